@@ -0,0 +1,106 @@
+# coding=utf-8
+"""
+time building a letter with a large author response table, by default a 500 row by
+10 column table of 5,000 cells
+
+run from the repository folder:
+
+    PYTHONPATH=. python benchmarks/table_wrap.py --rows 500 --columns 10
+"""
+
+import argparse
+import time
+from xml.etree import ElementTree
+from letterparser import build, generate, parse
+from letterparser.conf import raw_config, parse_raw_config
+
+
+def table_string(rows, columns):
+    """table with col tags and a pair of break tags in each cell"""
+    cells = "".join(
+        "<tr>%s</tr>"
+        % "".join(
+            "<td><italic>c%s</italic> %s.5<break /><break />n</td>" % (row, column)
+            for column in range(columns)
+        )
+        for row in range(rows)
+    )
+    return "<table>%s<thead><tr>%s</tr></thead><tbody>%s</tbody></table>" % (
+        '<col align="left" />' * columns,
+        "<th>h</th>" * columns,
+        cells,
+    )
+
+
+def letter_content(rows, columns):
+    """decision letter and author response content with the table"""
+    return (
+        "<root>"
+        "<p><bold>Decision letter</bold></p><p>Text.</p>"
+        "<p><bold>Author response</bold></p><p>Text.</p>"
+        "<p><bold>Author response table 1.</bold></p>"
+        "<p>&lt;Author response table 1 title/legend&gt;Title. Legend."
+        "&lt;/Author response table 1 title/legend&gt;</p>"
+        "%s<p>After.</p>"
+        "</root>"
+    ) % table_string(rows, columns)
+
+
+def best_time(function, repeat):
+    """the fastest of the repeated calls in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--columns", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    options = parser.parse_args(args)
+
+    config = parse_raw_config(raw_config("elife"))
+    raw_content = letter_content(options.rows, options.columns)
+    jats_content = parse.best_jats_content(raw_content)
+    table = table_string(options.rows, options.columns)
+    table_element = ElementTree.fromstring(table)
+    if build.table_section_element("", table, table_element) is None:
+        parser.error("the table is not copied as an Element")
+
+    timings = [
+        ("best_jats_content", lambda: parse.best_jats_content(raw_content)),
+        ("build_records", lambda: build.build_records(jats_content, config=config)),
+        (
+            "build_records and generate",
+            lambda: generate.output_xml(
+                generate.generate(build.build_records(jats_content, config=config))
+            ),
+        ),
+        (
+            "table_wrap_element from the table Element",
+            lambda: build.table_wrap_element(
+                "Table 1.",
+                "Title.",
+                None,
+                build.table_section_element("", table, table_element),
+            ),
+        ),
+        (
+            "table_wrap_element from the table string",
+            lambda: build.table_wrap_element("Table 1.", "Title.", None, table),
+        ),
+    ]
+    print(
+        "%s rows, %s columns, %s cells"
+        % (options.rows, options.columns, options.rows * options.columns)
+    )
+    for name, function in timings:
+        print("%s: %.3fs" % (name, best_time(function, options.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+# coding=utf-8
+
+"""
+walk the pandoc JSON AST to produce the same sections as parsing the best JATS,
+without string passes over the pandoc JATS output or parsing it again
+"""
+import json
+import re
+from collections import OrderedDict
+from xml.sax.saxutils import escape
+from letterparser import docx_lib, parse, utils
+
+
+# inline formatting converted to JATS tags
+INLINE_TAG_MAP = OrderedDict(
+    [
+        ("Emph", "italic"),
+        ("Strong", "bold"),
+        ("Superscript", "sup"),
+        ("Subscript", "sub"),
+        ("SmallCaps", "sc"),
+        ("Underline", "underline"),
+    ]
+)
+
+# inlines whose content is kept without a tag around it
+INLINE_CONTENT_TYPES = ["Quoted", "Cite"]
+
+# content which is converted to JATS by pandoc only
+UNSUPPORTED_TYPES = ["Math", "Note", "Image"]
+
+LIST_STYLE_MAP = {
+    "Decimal": "order",
+    "DefaultStyle": "order",
+    "LowerAlpha": "alpha-lower",
+    "UpperAlpha": "alpha-upper",
+    "LowerRoman": "roman-lower",
+    "UpperRoman": "roman-upper",
+}
+
+LIST_DELIM_MAP = {
+    "OneParen": "one-paren",
+    "TwoParens": "two-parens",
+    "Period": "period",
+}
+
+ALIGN_MAP = {"AlignCenter": "center", "AlignRight": "right"}
+
+# pandoc writes a line break as a new line, which best_jats joins or splits
+LINE_BREAK = "\n"
+
+# the end of a paragraph followed by another
+PARAGRAPH_SPLIT_PATTERN = re.compile(r"(?<=</p>)(?=<p[\s>])")
+
+
+def load(json_string):
+    """parse the pandoc JSON output"""
+    return json.loads(json_string)
+
+
+def is_supported(node):
+    """check the AST does not contain content which only pandoc can convert"""
+    if isinstance(node, dict):
+        if node.get("t") in UNSUPPORTED_TYPES:
+            return False
+        return is_supported(list(node.values()))
+    if isinstance(node, list):
+        return all(is_supported(child) for child in node)
+    return True
+
+
+XLINK_NAMESPACE = ' xmlns:xlink="http://www.w3.org/1999/xlink"'
+
+
+def attribute(value):
+    """quoted attribute value escaped as ElementTree does"""
+    return '"%s"' % escape(value, {'"': "&quot;", "\n": "&#10;"})
+
+
+def remove_strikeout(inlines):
+    """drop Strikeout inlines and the spaces next to them, like utils.remove_strike"""
+    output = []
+    skip_space = False
+    for i, inline in enumerate(inlines):
+        if skip_space and inline.get("t") == "Space":
+            skip_space = False
+            continue
+        skip_space = False
+        if inline.get("t") != "Strikeout":
+            output.append(inline)
+            continue
+        space_before = bool(output) and output[-1].get("t") == "Space"
+        space_after = i + 1 < len(inlines) and inlines[i + 1].get("t") == "Space"
+        if space_before:
+            output.pop()
+        skip_space = space_after
+        if space_before and space_after:
+            output.append({"t": "Space"})
+    return output
+
+
+def inline_contents(inline):
+    """child inlines of a formatting inline"""
+    if inline.get("t") in ["Quoted", "Cite"]:
+        return inline.get("c")[1]
+    return inline.get("c")
+
+
+def trim_spaces(inlines):
+    start = 0
+    end = len(inlines)
+    while start < end and inlines[start].get("t") in ["Space", "SoftBreak"]:
+        start += 1
+    while end > start and inlines[end - 1].get("t") in ["Space", "SoftBreak"]:
+        end -= 1
+    return inlines[start:end]
+
+
+def inline_to_jats(inline, break_tag=""):
+    inline_type = inline.get("t")
+    if inline_type == "Str":
+        return escape(inline.get("c"))
+    if inline_type in ["Space", "SoftBreak"]:
+        return " "
+    if inline_type == "LineBreak":
+        return break_tag
+    if inline_type in INLINE_TAG_MAP:
+        tag_name = INLINE_TAG_MAP.get(inline_type)
+        return "<%s>%s</%s>" % (
+            tag_name,
+            inlines_to_jats(inline.get("c"), break_tag),
+            tag_name,
+        )
+    if inline_type in INLINE_CONTENT_TYPES:
+        return inlines_to_jats(inline_contents(inline), break_tag)
+    if inline_type == "Span":
+        return inlines_to_jats(inline.get("c")[1], break_tag)
+    if inline_type == "Code":
+        return "<monospace>%s</monospace>" % escape(inline.get("c")[1])
+    if inline_type == "Link":
+        content = inlines_to_jats(inline.get("c")[1], break_tag)
+        url = inline.get("c")[2][0]
+        if url.startswith("#"):
+            return "<xref alt=%s rid=%s>%s</xref>" % (
+                attribute(inlines_text(inline.get("c")[1])),
+                attribute(url[1:]),
+                content,
+            )
+        return '<ext-link ext-link-type="uri" xlink:href=%s>%s</ext-link>' % (
+            attribute(url),
+            content,
+        )
+    return ""
+
+
+def inlines_to_jats(inlines, break_tag=""):
+    return "".join(
+        inline_to_jats(inline, break_tag) for inline in remove_strikeout(inlines)
+    )
+
+
+def inlines_text(inlines):
+    text = ""
+    for inline in inlines:
+        if inline.get("t") == "Str":
+            text += inline.get("c")
+        elif inline.get("t") in ["Space", "SoftBreak", "LineBreak"]:
+            text += " "
+        elif (
+            inline.get("t") in INLINE_TAG_MAP or inline.get("t") in INLINE_CONTENT_TYPES
+        ):
+            text += inlines_text(inline_contents(inline))
+        elif inline.get("t") in ["Span", "Link"]:
+            text += inlines_text(inline.get("c")[1])
+    return text
+
+
+def paragraphs_to_jats(inlines):
+    """
+    paragraphs of the inlines, the lines of a paragraph with line breaks are joined
+    or split into paragraphs the same as best_jats does to the pandoc JATS output
+    """
+    content = inlines_to_jats(trim_spaces(remove_strikeout(inlines)), LINE_BREAK)
+    if LINE_BREAK not in content:
+        return ["<p>%s</p>" % content] if content.strip() else []
+    jats_content = break_lines_to_jats("<p>%s</p>" % content)
+    jats_content = parse.convert_jats_tags(jats_content)
+    jats_content = parse.convert_break_tags(jats_content)
+    return [
+        paragraph
+        for paragraph in PARAGRAPH_SPLIT_PATTERN.split(jats_content)
+        if paragraph
+    ]
+
+
+def break_lines_to_jats(jats_string):
+    """
+    join the lines as best_jats does, pandoc writes no blank lines for line breaks
+    which follow each other and no spaces at the end of a line
+    """
+    lines = [line.rstrip(" ") for line in jats_string.split(LINE_BREAK)]
+    return utils.collapse_newlines(LINE_BREAK.join(line for line in lines if line))
+
+
+def list_to_jats(list_type, items, list_attributes=None):
+    labels = None
+    if list_attributes:
+        start, _, delim = list_attributes
+        if start != 1 or delim.get("t") not in ["DefaultDelim", "Period"]:
+            labels = [
+                docx_lib.list_marker(
+                    start + i, list_type, LIST_DELIM_MAP.get(delim.get("t"))
+                )
+                for i in range(len(items))
+            ]
+    item_strings = []
+    for i, item in enumerate(items):
+        content = ""
+        if labels:
+            content += "<label>%s</label>" % escape(labels[i])
+        for block in item:
+            if block.get("t") == "Plain":
+                block = {"t": "Para", "c": block.get("c")}
+            block_jats = block_to_jats(block)
+            if block.get("t") not in ["Para", "BulletList", "OrderedList"]:
+                block_jats = '<p specific-use="wrapper">%s</p>' % block_jats
+            content += block_jats
+        item_strings.append("<list-item>%s</list-item>" % content)
+    return '<list list-type="%s">%s</list>' % (list_type, "".join(item_strings))
+
+
+def cell_to_jats(blocks, tag_name):
+    """table cell, a single paragraph is not wrapped in a p tag"""
+    if len(blocks) == 1 and blocks[0].get("t") in ["Plain", "Para"]:
+        content = inlines_to_jats(blocks[0].get("c"), LINE_BREAK)
+    else:
+        content = "".join(block_to_jats(block) for block in blocks)
+    cell_string = "<%s>%s</%s>" % (tag_name, content, tag_name)
+    if LINE_BREAK in cell_string:
+        # double break tags are collapsed in table cells
+        cell_string = break_lines_to_jats(cell_string).replace(
+            "<break /><break />", "<break />"
+        )
+    return cell_string
+
+
+def row_to_jats(cells, tag_name):
+    return "<tr>%s</tr>" % "".join(cell_to_jats(cell, tag_name) for cell in cells)
+
+
+def table_parts(content):
+    """column alignments, header cells and body rows of a pandoc Table"""
+    if len(content) == 5:
+        # pandoc-types before 1.21
+        aligns, header, rows = content[1], content[3], content[4]
+        return [align.get("t") for align in aligns], header, rows
+    aligns = [colspec[0].get("t") for colspec in content[2]]
+    head_rows = [row[1] for row in content[3][1]]
+    rows = []
+    for body in content[4]:
+        for row in body[2] + body[3]:
+            rows.append(row[1])
+    rows += [row[1] for row in content[5][1]]
+    rows = spanned_rows(head_rows + rows)
+    header = rows.pop(0) if head_rows else []
+    return aligns, header, rows
+
+
+def spanned_rows(rows):
+    """
+    blocks of the cells of each row, merged cells are followed by empty cells for
+    each column and row they span, as pandoc-types before 1.21 has them
+    """
+    output = []
+    # rows each column is still spanned by a cell above
+    spanned = {}
+    for row in rows:
+        cells = []
+        for cell in row:
+            while spanned.get(len(cells)):
+                spanned[len(cells)] -= 1
+                cells.append([])
+            _, _, row_span, col_span, blocks = cell
+            for col in range(col_span):
+                spanned[len(cells)] = row_span - 1
+                cells.append(blocks if col == 0 else [])
+        while [col for col, span in spanned.items() if span and col >= len(cells)]:
+            if spanned.get(len(cells)):
+                spanned[len(cells)] -= 1
+            cells.append([])
+        output.append(cells)
+    return output
+
+
+def table_to_jats(content):
+    aligns, header, rows = table_parts(content)
+    parts = [
+        "<col align=%s />" % attribute(ALIGN_MAP.get(align, "left")) for align in aligns
+    ]
+    if [cell for cell in header if cell]:
+        parts.append("<thead>%s</thead>" % row_to_jats(header, "th"))
+    parts.append("<tbody>%s</tbody>" % "".join(row_to_jats(row, "td") for row in rows))
+    return "<table>%s</table>" % "".join(parts)
+
+
+def block_to_jats(block):
+    """JATS for a block, paragraphs split at line breaks are joined together"""
+    return "".join(jats_string for _, jats_string, _ in blocks_to_jats([block]))
+
+
+def blocks_to_jats(blocks):
+    """tag name, JATS string and child paragraphs for each top level tag"""
+    output = []
+    for block in blocks:
+        block_type = block.get("t")
+        content = block.get("c")
+        if block_type in ["Para", "Plain"]:
+            output += paragraph_blocks(content)
+        elif block_type == "Header":
+            # section titles are converted to paragraphs
+            output += paragraph_blocks(content[2])
+        elif block_type == "LineBlock":
+            for line in content:
+                output += paragraph_blocks(line)
+        elif block_type == "BlockQuote":
+            children = blocks_to_jats(content)
+            output.append(
+                (
+                    "disp-quote",
+                    "<disp-quote>%s</disp-quote>"
+                    % "".join(jats_string for _, jats_string, _ in children),
+                    [
+                        jats_string
+                        for tag_name, jats_string, _ in children
+                        if tag_name == "p"
+                    ],
+                )
+            )
+        elif block_type == "BulletList":
+            output.append(("list", list_to_jats("bullet", content), None))
+        elif block_type == "OrderedList":
+            list_attributes = content[0]
+            list_type = LIST_STYLE_MAP.get(list_attributes[1].get("t"), "order")
+            output.append(
+                ("list", list_to_jats(list_type, content[1], list_attributes), None)
+            )
+        elif block_type == "Table":
+            output.append(("table", table_to_jats(content), None))
+        elif block_type == "Div":
+            output += blocks_to_jats(content[1])
+        elif block_type == "CodeBlock":
+            jats_string = "<preformat>%s</preformat>" % escape(content[1])
+            output.append(("preformat", jats_string, None))
+    return output
+
+
+def paragraph_blocks(inlines):
+    return [("p", paragraph, None) for paragraph in paragraphs_to_jats(inlines)]
+
+
+def element_string(jats_string):
+    """string of a top level tag as ElementTree serialises it on its own"""
+    if "xlink:" in jats_string:
+        tag_end = jats_string.index(">")
+        if jats_string[tag_end - 1] == "/":
+            tag_end -= 2
+        jats_string = jats_string[:tag_end] + XLINK_NAMESPACE + jats_string[tag_end:]
+    return jats_string
+
+
+def content_sections(tag_name, jats_string, children):
+    """content sections for a top level tag, as build.split_content_sections makes"""
+    if tag_name == "disp-quote":
+        return [content_section("p", child) for child in children]
+    if tag_name in ["list", "p", "table"]:
+        return [content_section(tag_name, jats_string)]
+    return []
+
+
+def content_section(tag_name, jats_string):
+    section = OrderedDict()
+    section["tag_name"] = tag_name
+    section["content"] = element_string(jats_string)
+    return section
+
+
+def sections(ast, section_map):
+    """break the AST blocks into sections using the section map of heading paragraphs"""
+    sections = []
+    section = None
+    for tag_name, jats_string, children in blocks_to_jats(ast.get("blocks")):
+        section_type = None
+        for map_section_type, section_match in section_map.items():
+            if jats_string == section_match:
+                section_type = map_section_type
+        if section_type or section is None:
+            section = OrderedDict()
+            section["section_type"] = section_type
+            section["content"] = ""
+            section["content_sections"] = []
+            sections.append(section)
+        section["content"] += jats_string
+        if not section_type:
+            # the heading is trimmed from the content
+            section["content_sections"] += content_sections(
+                tag_name, jats_string, children
+            )
+    return sections
@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+
+
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 60
+
+
+class CircuitBreaker:
+    """stop using a backend after repeated failures until it is due a retry"""
+
+    def __init__(
+        self,
+        failure_threshold=FAILURE_THRESHOLD,
+        reset_timeout=RESET_TIMEOUT,
+        clock=time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+
+    def is_open(self):
+        return self.opened_at is not None
+
+    def retry_due(self):
+        """an open circuit is due a retry once the reset timeout has passed"""
+        return self.is_open() and self.clock() - self.opened_at >= self.reset_timeout
+
+    def trip(self):
+        self.opened_at = self.clock()
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.trip()
+
+
+class Backend:
+    """a way to call pandoc, probed for its pandoc version before it is used"""
+
+    def __init__(self, name, convert, probe, breaker=None, convert_async=None):
+        self.name = name
+        self.convert_function = convert
+        # coroutine function to convert without blocking the event loop, if any
+        self.convert_async_function = convert_async
+        self.probe_function = probe
+        self.breaker = breaker if breaker else CircuitBreaker()
+        self.version = None
+        self.probed = False
+        self.lock = threading.Lock()
+
+    def probe(self):
+        """probe the backend and open the circuit if it is not available"""
+        self.version = self.probe_function()
+        self.probed = True
+        if self.version:
+            self.breaker.record_success()
+        else:
+            self.breaker.trip()
+
+    def probe_due(self):
+        return not self.probed or self.breaker.retry_due()
+
+    def available(self):
+        """probe on first use and again when an open circuit is due a retry"""
+        with self.lock:
+            if self.probe_due():
+                self.probe()
+            return not self.breaker.is_open()
+
+    async def available_async(self):
+        """available without blocking the event loop when a probe is due"""
+        if self.probe_due():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.available)
+        return self.available()
+
+    def record(self, output):
+        with self.lock:
+            if output:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    def convert(self, file_name, output_format="jats", temp_dir=None):
+        output = self.convert_function(file_name, output_format, temp_dir)
+        self.record(output)
+        return output
+
+    async def convert_async(self, file_name, output_format="jats", temp_dir=None):
+        """convert using the coroutine function, otherwise in a thread"""
+        if self.convert_async_function:
+            output = await self.convert_async_function(
+                file_name, output_format, temp_dir
+            )
+        else:
+            loop = asyncio.get_running_loop()
+            output = await loop.run_in_executor(
+                None, self.convert_function, file_name, output_format, temp_dir
+            )
+        self.record(output)
+        return output
+
+
+class BackendRegistry:
+    """backends in order of preference, the first available one is used"""
+
+    def __init__(self, backends=None):
+        self.backends = backends if backends else []
+
+    def register(self, backend):
+        self.backends.append(backend)
+
+    def versions(self):
+        """pandoc version of each backend which has been probed"""
+        return {
+            backend.name: backend.version
+            for backend in self.backends
+            if backend.probed and backend.version
+        }
+
+    def first_available(self):
+        """the backend a conversion is tried with first"""
+        for backend in self.backends:
+            if backend.available():
+                return backend
+        return None
+
+    def convert(self, file_name, output_format="jats", temp_dir=None):
+        """
+        convert using available backends, trying the next one if it fails,
+        file_name may also be the docx bytes, temp_dir is the directory the
+        workspace containing the file was created in
+        """
+        for backend in self.backends:
+            if not backend.available():
+                continue
+            output = backend.convert(file_name, output_format, temp_dir)
+            if output:
+                return output
+        return None
+
+    async def convert_async(self, file_name, output_format="jats", temp_dir=None):
+        """convert using available backends without blocking the event loop"""
+        for backend in self.backends:
+            if not await backend.available_async():
+                continue
+            output = await backend.convert_async(file_name, output_format, temp_dir)
+            if output:
+                return output
+        return None
@@ -0,0 +1,101 @@
+# coding=utf-8
+
+"""
+convert many files at once in a pool of worker processes, each worker has its own
+temp directory for the workspaces of its conversions
+"""
+import concurrent.futures
+import os
+import shutil
+import tempfile
+import traceback
+import zipfile
+from collections import namedtuple
+from multiprocessing import util
+from xml.etree import ElementTree
+from letterparser import generate, parse
+
+
+# the outcome of converting one file, either the xml or the error is set
+BatchResult = namedtuple("BatchResult", ["file_name", "xml", "error"])
+
+# errors from a file which cannot be read or converted, returned in its
+# BatchResult, any other exception is raised by generate_xml_from_files
+CONVERSION_ERRORS = (
+    OSError,
+    KeyError,
+    ValueError,
+    RuntimeError,
+    ElementTree.ParseError,
+    zipfile.BadZipFile,
+)
+
+# set in each worker process by init_worker
+WORKER_CONFIG = None
+WORKER_TEMP_DIR = None
+
+
+def init_worker(config=None, temp_dir=None):
+    """
+    create the worker temp directory, removed when the worker exits, and probe
+    the pandoc backends once so the first conversion does not wait for it
+    """
+    global WORKER_CONFIG, WORKER_TEMP_DIR
+    WORKER_CONFIG = parse.ensure_config(config)
+    if temp_dir:
+        os.makedirs(temp_dir, exist_ok=True)
+    WORKER_TEMP_DIR = tempfile.mkdtemp(prefix="letterparser-", dir=temp_dir)
+    util.Finalize(
+        None,
+        shutil.rmtree,
+        args=(WORKER_TEMP_DIR,),
+        kwargs={"ignore_errors": True},
+        exitpriority=10,
+    )
+    parse.backend_registry(WORKER_CONFIG).first_available()
+
+
+def convert_file(file_name, root_tag="root", pretty=False, indent=""):
+    """convert the file in the worker, a conversion error is returned as the error"""
+    try:
+        xml = generate.generate_xml_from_file(
+            file_name,
+            root_tag=root_tag,
+            pretty=pretty,
+            indent=indent,
+            config=WORKER_CONFIG,
+            temp_dir=WORKER_TEMP_DIR,
+        )
+        return BatchResult(file_name, xml, None)
+    except CONVERSION_ERRORS:
+        return BatchResult(file_name, None, traceback.format_exc())
+
+
+def generate_xml_from_files(
+    file_names,
+    root_tag="root",
+    pretty=False,
+    indent="",
+    config=None,
+    temp_dir=None,
+    max_workers=None,
+    ordered=True,
+):
+    """
+    yield a BatchResult for each file, in the order of file_names if ordered
+    is True, otherwise as each conversion is completed, an exception other than
+    the CONVERSION_ERRORS is raised when its result is reached
+    """
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=init_worker,
+        initargs=(config, temp_dir),
+    ) as executor:
+        futures = [
+            executor.submit(convert_file, file_name, root_tag, pretty, indent)
+            for file_name in file_names
+        ]
+        if not ordered:
+            futures = concurrent.futures.as_completed(futures)
+        for future in futures:
+            yield future.result()
@@ -1,16 +1,36 @@
 # coding=utf-8
 
+import atexit
+import concurrent.futures
 import re
+import threading
 from xml.etree import ElementTree
 from xml.etree.ElementTree import Element, SubElement
 from collections import OrderedDict
 import elifearticle.utils as eautils
 from elifearticle.article import Article, ContentBlock, RelatedArticle
 from jatsgenerator import utils as jats_utils
-from letterparser import parse, utils
+from letterparser import parse, record_lib, utils
 from letterparser.conf import raw_config, parse_raw_config
 
 
+# tag fragments jatsgenerator keeps when it parses a content block string
+ALLOWED_TAGS = jats_utils.allowed_tags()
+
+# namespace prefixes of tag and attribute names as they are in a content block string
+NAMESPACE_PREFIX_MAP = {
+    uri: prefix for prefix, uri in jats_utils.XML_NAMESPACE_MAP.items()
+}
+
+# characters which do not survive escaping and parsing an attribute value again
+UNSAFE_ATTRIBUTE_MATCH_PATTERN = re.compile(r'[&<"\n\r\t]')
+
+
+# process pools building sub-articles, keyed by their number of processes
+BUILD_EXECUTORS = {}
+BUILD_EXECUTORS_LOCK = threading.Lock()
+
+
 def default_preamble(config):
     if config and config.get("preamble"):
         return OrderedDict(
@@ -23,12 +43,27 @@ def default_preamble(config):
 
 
 def build_articles(jats_content, file_name=None, config=None):
-    sections = parse.sections(jats_content)
+    sections = parse.section_records(jats_content)
+    return build_articles_from_sections(sections, file_name, config)
+
+
+def build_articles_from_sections(sections, file_name=None, config=None):
+    """build articles from sections of JATS content"""
+    records = build_records_from_sections(sections, file_name, config)
+    return [record_article(record) for record in records]
+
+
+def build_records(jats_content, file_name=None, config=None):
+    """build article records, which are faster to serialise than articles"""
+    sections = parse.section_records(jats_content)
+    return build_records_from_sections(sections, file_name, config)
+
 
+def build_records_from_sections(sections, file_name=None, config=None):
+    """build article records from sections of JATS content"""
     if not config:
         config = parse_raw_config(raw_config(None))
 
-    articles = []
     preamble_section = None
     id_count = 1
 
@@ -42,9 +77,9 @@ def build_articles(jats_content, file_name=None, config=None):
         )
         sciety_match = sciety_link_match_pattern.match(preamble_section.get("content"))
         if sciety_match:
-            related_material = RelatedArticle()
-            related_material.xlink_href = sciety_match.group(1)
-            related_material.ext_link_type = "continued-by"
+            related_material = record_lib.RelatedRecord(
+                sciety_match.group(1), "continued-by"
+            )
             break
 
     # filter a list of decision letter sections to check against later
@@ -62,6 +97,8 @@ def build_articles(jats_content, file_name=None, config=None):
     ]:
         id_count = 0
 
+    # assign the ids first so the sub-articles can be built independently
+    article_args = []
     for section in sections:
         if section.get("section_type") == "preamble":
             preamble_section = section
@@ -84,32 +121,113 @@ def build_articles(jats_content, file_name=None, config=None):
         manuscript = utils.manuscript_from_file_name(file_name)
         doi = build_doi(file_name, id_value, config)
 
-        if section.get("section_type") in ["editors_evaluation", "elife_assessment"]:
-            if section.get("section_type") == "editors_evaluation":
-                article = build_editors_evaluation(
-                    section, config, id_value, doi, manuscript
-                )
-            if section.get("section_type") == "elife_assessment":
-                article = build_elife_assessment(
-                    section, config, id_value, doi, manuscript
-                )
-            if related_material:
-                article.related_articles = [related_material]
-        elif section.get("section_type") == "decision_letter":
-            article = build_decision_letter(
-                section, config, preamble_section, id_value, doi, manuscript
-            )
-        else:
-            article = build_sub_article(
-                section, config, "reply", id_value, doi, manuscript
-            )
-        articles.append(article)
+        article_args.append((section, preamble_section, id_value, doi, manuscript))
         # reset the counter
         id_count += 1
         # reset the preamble section
         preamble_section = None
 
-    return articles
+    build_processes = config.get("build_processes")
+    if build_processes and build_processes > 1 and len(article_args) > 1:
+        # build the sub-articles at the same time in worker processes
+        executor = build_executor(build_processes)
+        try:
+            futures = [
+                executor.submit(build_section_record_data, config, *args)
+                for args in article_args
+            ]
+            records = [record_lib.loads(future.result())[0] for future in futures]
+        except concurrent.futures.process.BrokenProcessPool:
+            # a worker process died, the next call gets a new pool
+            discard_build_executor(build_processes, executor)
+            records = [build_section_record(config, *args) for args in article_args]
+    else:
+        records = [build_section_record(config, *args) for args in article_args]
+
+    if related_material:
+        for record in records:
+            if record.article_type == "editor-report":
+                record.related_articles = [related_material]
+
+    return records
+
+
+def build_section_record(
+    config, section, preamble_section=None, id_value=None, doi=None, manuscript=None
+):
+    """build the sub-article record for the section depending on its section_type"""
+    if section.get("section_type") in ["editors_evaluation", "elife_assessment"]:
+        return build_sub_article_record(
+            section, config, "editor-report", id_value, doi, manuscript
+        )
+    if section.get("section_type") == "decision_letter":
+        return build_decision_letter_record(
+            section, config, preamble_section, id_value, doi, manuscript
+        )
+    return build_sub_article_record(section, config, "reply", id_value, doi, manuscript)
+
+
+def build_section_record_data(config, *args):
+    """build the sub-article record in a worker process and serialise it"""
+    return record_lib.dumps([build_section_record(config, *args)])
+
+
+def record_article(record):
+    """elifearticle Article of the article record"""
+    article = Article(record.doi)
+    article.article_type = record.article_type
+    article.id = record.id
+    article.manuscript = record.manuscript
+    article.title = record.title
+    for related in record.related_articles:
+        related_article = RelatedArticle()
+        related_article.xlink_href = related.xlink_href
+        related_article.ext_link_type = related.ext_link_type
+        article.related_articles.append(related_article)
+    article.content_blocks = [
+        record_content_block(block) for block in record.content_blocks
+    ]
+    return article
+
+
+def record_content_block(block):
+    """content block of the block record, which keeps its Element if it has one"""
+    if block.element is not None:
+        content_block = ElementContentBlock(
+            block.block_type, block.element, block.attr, block._content
+        )
+    else:
+        content_block = ContentBlock(block.block_type, block.content, block.attr)
+    content_block.content_blocks = [
+        record_content_block(child_block) for child_block in block.content_blocks
+    ]
+    return content_block
+
+
+def build_executor(processes):
+    """return the process pool for building sub-articles, it is shared by calls"""
+    with BUILD_EXECUTORS_LOCK:
+        if processes not in BUILD_EXECUTORS:
+            BUILD_EXECUTORS[processes] = concurrent.futures.ProcessPoolExecutor(
+                max_workers=processes
+            )
+        return BUILD_EXECUTORS[processes]
+
+
+def discard_build_executor(processes, executor):
+    """remove a broken process pool so it is not shared by later calls"""
+    with BUILD_EXECUTORS_LOCK:
+        if BUILD_EXECUTORS.get(processes) is executor:
+            del BUILD_EXECUTORS[processes]
+    executor.shutdown(wait=False)
+
+
+@atexit.register
+def shutdown_build_executors():
+    with BUILD_EXECUTORS_LOCK:
+        for executor in BUILD_EXECUTORS.values():
+            executor.shutdown()
+        BUILD_EXECUTORS.clear()
 
 
 def build_doi(file_name, id_value, config):
@@ -133,42 +251,71 @@ def build_elife_assessment(section, config, id_value=None, doi=None, manuscript=
 def build_decision_letter(
     section, config, preamble_section=None, id_value=None, doi=None, manuscript=None
 ):
-    article = build_sub_article(
+    return record_article(
+        build_decision_letter_record(
+            section, config, preamble_section, id_value, doi, manuscript
+        )
+    )
+
+
+def build_decision_letter_record(
+    section, config, preamble_section=None, id_value=None, doi=None, manuscript=None
+):
+    record = build_sub_article_record(
         section, config, "decision-letter", id_value, doi, manuscript
     )
     # process the preabmle section
     if preamble_section:
         preamble_section = trim_section_heading(preamble_section)
-        preamble_block = ContentBlock("boxed-text", preamble_section.get("content"))
-        article.content_blocks = [preamble_block] + article.content_blocks
-    return article
+        preamble_block = record_lib.BlockRecord(
+            "boxed-text", preamble_section.get("content")
+        )
+        record.content_blocks = [preamble_block] + record.content_blocks
+    return record
 
 
 def build_sub_article(
     section, config, article_type=None, id_value=None, doi=None, manuscript=None
 ):
-    article = Article(doi)
-    article.id = id_value
-    article.manuscript = manuscript
+    return record_article(
+        build_sub_article_record(
+            section, config, article_type, id_value, doi, manuscript
+        )
+    )
+
+
+def build_sub_article_record(
+    section, config, article_type=None, id_value=None, doi=None, manuscript=None
+):
+    record = record_lib.ArticleRecord("research-article", id_value, doi, manuscript)
     if article_type:
-        article.article_type = article_type
+        record.article_type = article_type
     # add the content
-    article.content_blocks = []
-    set_title(article)
-    set_content_blocks(article, section)
+    set_title(record)
+    set_content_blocks(record, section)
     # set any figure or video file names
     fig_num = 1
     video_num = 1
-    for content_block in article.content_blocks:
+    for block_index, content_block in enumerate(record.content_blocks):
         if content_block.block_type == "fig":
             image_file_name = config.get("fig_filename_pattern").format(
                 manuscript=manuscript, id_value=id_value, num=fig_num
             )
-            href = 'xlink:href="{image_file_name}"'.format(
-                image_file_name=image_file_name
-            )
-            content_block.content = re.sub(
-                r'(<graphic.*?)xlink:href=".*?"', r"\1%s" % href, content_block.content
+            if getattr(content_block, "element", None) is not None:
+                for graphic_tag in content_block.element.iter("graphic"):
+                    if graphic_tag.get("xlink:href") is not None:
+                        graphic_tag.set("xlink:href", image_file_name)
+            else:
+                href = 'xlink:href="{image_file_name}"'.format(
+                    image_file_name=image_file_name
+                )
+                content_block.content = re.sub(
+                    r'(<graphic.*?)xlink:href=".*?"',
+                    r"\1%s" % href,
+                    content_block.content,
+                )
+            record.assets.append(
+                record_lib.AssetRecord("fig", image_file_name, block_index)
             )
             fig_num += 1
         elif content_block.block_type == "media":
@@ -177,9 +324,12 @@ def build_sub_article(
                 manuscript=manuscript, id_value=id_value, num=video_num
             )
             content_block.attr["xlink:href"] = video_file_name
+            record.assets.append(
+                record_lib.AssetRecord("video", video_file_name, block_index)
+            )
             video_num += 1
 
-    return article
+    return record
 
 
 def set_title(article):
@@ -210,17 +360,19 @@ def set_content_blocks(article, section):
 
     # trim away the section heading
     section = trim_section_heading(section)
-    # split into content sections
-    content_sections = split_content_sections(section)
+    # split into content sections, unless already split when walking the pandoc AST
+    content_sections = section.get("content_sections")
+    if content_sections is None:
+        content_sections = split_content_elements(section)
     # profile and process into content blocks
     content_blocks = process_content_sections(content_sections, prefs)
     # add to the article
     article.content_blocks = content_blocks
 
 
-def split_content_sections(section):
-    """split first child level tags into content parts"""
-    content_sections = []
+def content_section_tags(section):
+    """parse the section content and return its first child level block tags"""
+    block_tags = []
     # register namespaces
     for prefix, uri in jats_utils.XML_NAMESPACE_MAP.items():
         ElementTree.register_namespace(prefix, uri)
@@ -238,13 +390,30 @@ def split_content_sections(section):
         if block_tag.tag in ["list", "p", "table", "disp-quote"]:
             # add p tags from disp-quote blocks
             if block_tag.tag == "disp-quote":
-                for p_tag in block_tag.findall("./p"):
-                    append_tag_to_sections(content_sections, p_tag)
+                block_tags += block_tag.findall("./p")
             else:
-                append_tag_to_sections(content_sections, block_tag)
+                block_tags.append(block_tag)
+    return block_tags
+
+
+def split_content_sections(section):
+    """split first child level tags into content parts"""
+    content_sections = []
+    for block_tag in content_section_tags(section):
+        append_tag_to_sections(content_sections, block_tag)
     return content_sections
 
 
+def split_content_elements(section):
+    """split first child level tags into content section records with their Element"""
+    return [
+        record_lib.ContentSectionRecord(
+            block_tag.tag, element_to_string(block_tag), block_tag
+        )
+        for block_tag in content_section_tags(section)
+    ]
+
+
 def append_tag_to_sections(sections, tag):
     content_section = OrderedDict()
     rough_string = element_to_string(tag)
@@ -260,6 +429,113 @@ def element_to_string(tag):
     return rough_string
 
 
+def element_copy(element, replaced_tags=None):
+    """
+    copy of the Element with namespace prefixed names, or None if a tag is escaped
+    as text or an attribute is changed when parsed from a content string, empty
+    tags named in replaced_tags are replaced by their text value
+    """
+    tag_name = prefixed_name(element.tag)
+    if tag_name is None:
+        return None
+    attributes = OrderedDict()
+    for name, value in element.items():
+        name = prefixed_name(name)
+        if name is None or UNSAFE_ATTRIBUTE_MATCH_PATTERN.search(value):
+            return None
+        attributes[name] = value
+    if "\r" in (element.text or "") or "\r" in (element.tail or ""):
+        return None
+    empty = not element.text and not len(element)
+    open_tag = "<%s%s" % (tag_name, " " if attributes or empty else ">")
+    if not open_tag.startswith(ALLOWED_TAGS):
+        return None
+    if not empty and not utils.close_tag(tag_name).startswith(ALLOWED_TAGS):
+        return None
+    tag_copy = Element(tag_name, attributes)
+    tag_copy.text = element.text or None
+    tag_copy.tail = element.tail or None
+    for child_tag in element:
+        if replaced_tags and child_tag.tag in replaced_tags:
+            text = replaced_tags.get(child_tag.tag)
+            if child_tag.text or len(child_tag) or (text and child_tag.attrib):
+                return None
+            if "\r" in (child_tag.tail or ""):
+                return None
+            append_tail(tag_copy, text + (child_tag.tail or ""))
+            continue
+        child_copy = element_copy(child_tag, replaced_tags)
+        if child_copy is None:
+            return None
+        tag_copy.append(child_copy)
+    return tag_copy
+
+
+def append_tail(tag, text):
+    """add text after the last child of the tag, or to its text if it is empty"""
+    if not text:
+        return
+    if len(tag):
+        tag[-1].tail = (tag[-1].tail or "") + text
+    else:
+        tag.text = (tag.text or "") + text
+
+
+def prefixed_name(name):
+    """tag or attribute name with its namespace prefix, None if it is not known"""
+    if not name.startswith("{"):
+        return name
+    uri, local_name = name[1:].split("}", 1)
+    prefix = NAMESPACE_PREFIX_MAP.get(uri)
+    if not prefix:
+        return None
+    return "%s:%s" % (prefix, local_name)
+
+
+class ElementContentBlock(ContentBlock):
+    """
+    content block which keeps its content as an Element, the content string is
+    rendered from the Element when it is read, unless the content is set
+    """
+
+    def __init__(self, block_type=None, element=None, attr=None, content=None):
+        super().__init__(block_type, content, attr)
+        self.element = element
+
+    @property
+    def content(self):
+        if self._content is None and self.element is not None:
+            return record_lib.element_content(self.element)
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        # the new content replaces the Element
+        self._content = value
+        self.element = None
+
+
+def content_element(section):
+    """Element of a content section which can be used in place of its content"""
+    element = section.get("element")
+    if element is None or section.get("tag_name") not in ["list", "p"]:
+        return None
+    if section.get("tag_name") == "list" and element.find(".//disp-quote") is not None:
+        # disp-quote tags are removed from the list content as a string
+        return None
+    return element
+
+
+def element_has_namespaces(element):
+    """check for namespaced tags or attributes, they are declared on the root tag"""
+    for tag in element.iter():
+        if tag.tag.startswith("{") or [
+            name for name in tag.attrib if name.startswith("{")
+        ]:
+            return True
+    return False
+
+
 def clean_math_alternatives(section_xml):
     """use mml:math from the <alternatives> tag"""
     for formula_tag in section_xml.findall(".//disp-formula") + section_xml.findall(
@@ -276,6 +552,12 @@ def clean_math_alternatives(section_xml):
     return section_xml
 
 
+# full stops and the tags which are balanced at the end of a caption title
+CAPTION_TITLE_MATCH_PATTERN = re.compile(
+    r"\.|</?italic>|</?bold>|<ext-link|</ext-link>"
+)
+
+
 def extract_label_title_content(content):
     title_content = None
     content_content = None
@@ -290,40 +572,22 @@ def extract_label_title_content(content):
     parts_match = re.findall(r"<bold>(.*?)</bold>(.*)$", content)
     label_content = parts_match[0][0]
     remainder = "".join(parts_match[0][1:])
-    title_parts = remainder.split(".")
-    # if the first part contains an mml tag, it is probably too complicated to process as parts
-    if "<mml" in title_parts[0]:
-        title_parts = [remainder]
+    first_part_end = remainder.find(".")
     title_label_match = r"^(.*)\&lt;.*\&gt;$"
-    if len(title_parts) == 1:
-        content_match = re.match(title_label_match, title_parts[0])
+    # if the first part contains an mml tag, it is probably too complicated to process as parts
+    if first_part_end < 0 or "<mml" in remainder[:first_part_end]:
+        content_match = re.match(title_label_match, remainder)
         title_content = content_match.group(1).lstrip()
     else:
-        # check for nested italic tags
-        title_content = ""
-        content_remainders = []
-        for title_part in title_parts:
-            if not title_content:
-                title_content += title_part + "."
-                continue
-            open_tag_count = title_content.count(utils.open_tag("italic"))
-            close_tag_count = title_content.count(utils.close_tag("italic"))
-            open_bold_tag_count = title_content.count(utils.open_tag("bold"))
-            close_bold_tag_count = title_content.count(utils.close_tag("bold"))
-            open_ext_link_tag_count = title_content.count(
-                utils.open_tag("ext-link").rstrip(">")
-            )
-            close_ext_link_tag_count = title_content.count(utils.close_tag("ext-link"))
-            if (
-                open_tag_count != close_tag_count
-                or open_bold_tag_count != close_bold_tag_count
-                or open_ext_link_tag_count != close_ext_link_tag_count
-            ):
-                title_content += title_part + "."
-            else:
-                content_remainders.append(title_part)
+        # the title ends at the first full stop outside of nested italic tags
+        title_end = caption_title_end(remainder)
+        if title_end < 0:
+            title_content = remainder + "."
+            content_remainder = ""
+        else:
+            title_content = remainder[:title_end]
+            content_remainder = remainder[title_end:]
         title_content = title_content.lstrip()
-        content_remainder = ".".join(content_remainders)
         # strip the title / legend close tag
         content_match = re.match(title_label_match, content_remainder)
         if content_match:
@@ -332,6 +596,34 @@ def extract_label_title_content(content):
     return label_content, title_content, content_content
 
 
+def caption_title_end(remainder):
+    """
+    index after the first full stop where the italic, bold and ext-link tags before
+    it are balanced, or -1, found walking the caption once
+    """
+    italic_depth = 0
+    bold_depth = 0
+    ext_link_depth = 0
+    for match in CAPTION_TITLE_MATCH_PATTERN.finditer(remainder):
+        token = match.group()
+        if token == ".":
+            if not italic_depth and not bold_depth and not ext_link_depth:
+                return match.end()
+        elif token == "<italic>":
+            italic_depth += 1
+        elif token == "</italic>":
+            italic_depth -= 1
+        elif token == "<bold>":
+            bold_depth += 1
+        elif token == "</bold>":
+            bold_depth -= 1
+        elif token == "<ext-link":
+            ext_link_depth += 1
+        else:
+            ext_link_depth -= 1
+    return -1
+
+
 def build_fig(content):
     """parse content into individual elements of a figure"""
     fig_c = OrderedDict()
@@ -367,11 +659,6 @@ def fig_element(label, title, content):
     return fig_tag
 
 
-def fig_element_to_string(tag):
-    rough_string = element_to_string(tag)
-    return utils.clean_portion(rough_string, "fig")
-
-
 def media_element(label, title, content, mimetype="video"):
     """populate a media XML Element for a video"""
     media_tag = Element("media")
@@ -409,28 +696,16 @@ def disp_quote_element(content):
     return root_tag[0]
 
 
-def media_element_to_string(tag):
-    rough_string = element_to_string(tag)
-    return utils.clean_portion(rough_string, "media")
-
-
-def disp_quote_element_to_string(tag):
-    rough_string = element_to_string(tag)
-    return utils.clean_portion(rough_string, "disp-quote")
-
-
-def table_wrap_element_to_string(tag):
-    rough_string = element_to_string(tag)
-    return utils.clean_portion(rough_string, "table-wrap")
-
-
 def build_table_wrap(content):
     """parse table content into table-wrap tag"""
-    table = OrderedDict()
-
     parts_match = re.match(r"(.*)(<table.*)", content)
-    title_content = parts_match.group(1)
-    table["table"] = parts_match.group(2)
+    return build_table_wrap_parts(parts_match.group(1), parts_match.group(2))
+
+
+def build_table_wrap_parts(title_content, table_content):
+    """parse the table-wrap title content, the table is its string or Element"""
+    table = OrderedDict()
+    table["table"] = table_content
 
     # check for table label only
     if re.match(r"^<bold>(.*)?<\/bold>", title_content):
@@ -473,6 +748,38 @@ def build_table_wrap(content):
     return table
 
 
+# col tags are removed from a table and break tags left in its cells are escaped
+TABLE_REPLACED_TAGS = {"col": "", "break": "<break />"}
+
+
+def table_section_element(title_content, content, element):
+    """
+    copy of the table Element of the section content which ends a table-wrap, with
+    its col and break tags replaced, the same as table_wrap_element parses from the content
+    string, or None if the content string is needed
+    """
+    if element is None or element.tag != "table":
+        return None
+    # the content string is split at the last table tag on the first line
+    if element.tail not in [None, "", "\n"] or content.rfind("<table") != 0:
+        return None
+    if "\n" in title_content or "\n" in content.rstrip("\n"):
+        return None
+    table_tag = element_copy(element, TABLE_REPLACED_TAGS)
+    if table_tag is None:
+        return None
+    # the table tag is parsed again from its content without attributes
+    table_tag.attrib.clear()
+    table_tag.tail = None
+    # the table content string is stripped of whitespace
+    if len(table_tag):
+        table_tag.text = (table_tag.text or "").lstrip() or None
+        table_tag[-1].tail = (table_tag[-1].tail or "").rstrip() or None
+    else:
+        table_tag.text = (table_tag.text or "").strip() or None
+    return table_tag
+
+
 def table_content(content):
     """convert and clean table XML"""
     # remove <col> tags
@@ -501,7 +808,12 @@ def table_wrap_element(label, title, content, table):
                 caption_tag, "p", content, jats_utils.XML_NAMESPACE_MAP
             )
 
-    if table:
+    if isinstance(table, Element):
+        table_wrap_tag.append(table)
+        table_tag = table_wrap_tag[-1]
+        table_tag.set("frame", "hsides")
+        table_tag.set("rules", "groups")
+    elif table:
         clean_table = table_content(table)
         jats_utils.append_to_tag(
             table_wrap_tag, "table", clean_table, jats_utils.XML_NAMESPACE_MAP
@@ -516,153 +828,212 @@ def table_wrap_element(label, title, content, table):
 
 def process_content_sections(content_sections, prefs=None):
     """profile each paragraph and add as an appropriate content block"""
-    content_blocks = []
-    appended_content = ""
-    prev = {}
-    # add a blank section for the final loop
-    content_sections.append(OrderedDict())
-    for section in content_sections:
-        content_blocks, appended_content, prev = process_content_section(
-            section, content_blocks, appended_content, prev, prefs
-        )
-
-    return content_blocks
-
-
-def process_content_section(
-    section, content_blocks, appended_content, prev, prefs=None
-):
-    """profile and format the section content adding content blocks"""
-    tag_name = section.get("tag_name")
-    content, tag_name, attr, action, wrap = process_content(
-        tag_name, section.get("content"), prev, prefs
+    return ContentSectionProcessor(prefs).process(content_sections)
+
+
+class ContentSectionProcessor:
+    """
+    profile content sections in order and add them as content blocks, keeping the
+    wrap state and the appended content of the previous sections
+    """
+
+    __slots__ = (
+        "prefs",
+        "content_blocks",
+        "appended",
+        "appended_element",
+        "prev_content",
+        "prev_class",
+        "prev_action",
+        "prev_tag_name",
+        "prev_attr",
+        "prev_wrap",
     )
 
-    if (
-        (prev.get("wrap") and not wrap)
-        or (wrap and prev.get("wrap") and prev.get("wrap") != wrap)
-        or (prev.get("wrap") and not content)
-    ):
-        content_blocks, appended_content, prev = finish_wrap(
-            content_blocks, content, appended_content, prev
-        )
-
-    elif action == "add":
-        if prev.get("action") == "append" and appended_content:
-            content_blocks.append(
-                ContentBlock(prev.get("tag_name"), appended_content, prev.get("attr"))
+    def __init__(self, prefs=None):
+        self.prefs = prefs
+        self.content_blocks = []
+        # parts of the appended content, joined when it is added as a content block
+        self.appended = []
+        # Element of the appended content, if it is the content of one section
+        self.appended_element = None
+        self.prev_content = None
+        self.prev_class = 0
+        self.prev_action = None
+        self.prev_tag_name = None
+        self.prev_attr = None
+        self.prev_wrap = None
+
+    def process(self, content_sections):
+        """process the content sections and return the content blocks"""
+        for section in content_sections:
+            self.process_section(section)
+        # process a blank section to finish the final content
+        self.process_section(OrderedDict())
+        return self.content_blocks
+
+    def set_appended(self, content):
+        self.appended = [content] if content else []
+
+    def set_prev_content(self, content, content_class_value=0):
+        self.prev_content = content
+        self.prev_class = content_class_value
+
+    def process_section(self, section):
+        """profile and format the section content adding content blocks"""
+        tag_name = section.get("tag_name")
+        element = content_element(section)
+        appended_element = None
+        if tag_name == "p":
+            content = utils.clean_portion(section.get("content"), "p")
+            content, class_value, action, wrap = p_content_transition(
+                content,
+                section_content_class(section, content),
+                self.prev_content,
+                self.prev_class,
+                self.prev_wrap,
+                self.prefs,
             )
-            appended_content = ""
-        if content and not wrap:
-            content_blocks.append(ContentBlock(tag_name, content, attr))
-            prev["content"] = None
-            appended_content = ""
-        elif content:
-            appended_content = content
-            prev["content"] = content
-
-    elif action == "append":
-        if appended_content:
-            appended_content = appended_content + content
+            attr = None
         else:
-            appended_content = content
-        prev["content"] = content
-
-    prev["action"] = action
-    prev["tag_name"] = tag_name
-    prev["attr"] = attr
-    prev["wrap"] = wrap
-
-    return content_blocks, appended_content, prev
-
-
-def finish_wrap(content_blocks, content, appended_content, prev):
-    """add appended content to a wrap"""
-    # finish the fig tag content
-    if prev.get("wrap") == "fig":
-        # format the content into the figure content block
-        if content and match_fig_content_title_end(content):
-            appended_content = appended_content + content
-
-        # potentially multiple figs, parse and add to fig_content_list
-        fig_content_list = []
-        matches = re.finditer(FIG_CONTENT_START_PATTERN, appended_content)
-        prev_start = None
-        for match in matches:
-            start = match.start()
-            if prev_start is not None:
-                fig_content_list.append(appended_content[prev_start:start])
-            prev_start = start
-        fig_content_list.append(appended_content[prev_start:])
-
-        for fig_block_content in fig_content_list:
-            fig_content = build_fig(fig_block_content)
-            fig_tag = fig_element(
-                fig_content.get("label"),
-                fig_content.get("title"),
-                fig_content.get("content"),
+            content, tag_name, attr, action, wrap = process_content(
+                tag_name,
+                section.get("content"),
+                {"wrap": self.prev_wrap},
+                self.prefs,
+                element,
             )
-            content_block_content = fig_element_to_string(fig_tag)
-            content_blocks.append(
-                ContentBlock("fig", content_block_content, prev.get("attr"))
-            )
-        prev["content"] = None
-        if content and match_fig_content_title_end(content):
-            appended_content = None
-        else:
-            appended_content = content
-    elif prev.get("wrap") == "media":
-        # format the content into the video media content block
-        if content and match_video_content_title_end(content):
-            appended_content = appended_content + content
-        video_content = build_fig(appended_content)
-        media_tag = media_element(
-            video_content.get("label"),
-            video_content.get("title"),
-            video_content.get("content"),
-        )
-        content_block_content = media_element_to_string(media_tag)
-        content_blocks.append(
-            ContentBlock("media", content_block_content, media_tag.attrib)
-        )
-        prev["content"] = None
-        if content and match_video_content_title_end(content):
-            appended_content = None
-        else:
-            appended_content = content
-    elif prev.get("wrap") == "disp-quote":
-        disp_quote_tag = disp_quote_element(appended_content)
-        content_block_content = disp_quote_element_to_string(disp_quote_tag)
-        tag_attr = {"content-type": "editor-comment"}
-        content_blocks.append(
-            ContentBlock("disp-quote", content_block_content, tag_attr)
-        )
-        prev["content"] = content
-        appended_content = content
-    elif prev.get("wrap") == "table-wrap":
-        if content and match_table_content_end(content):
-            appended_content = appended_content + content
-        table_content = build_table_wrap(appended_content)
-        table_wrap_tag = table_wrap_element(
-            table_content.get("label"),
-            table_content.get("title"),
-            table_content.get("content"),
-            table_content.get("table"),
-        )
-        content_block_content = table_wrap_element_to_string(table_wrap_tag)
-        content_blocks.append(
-            ContentBlock("table-wrap", content_block_content, table_wrap_tag.attrib)
-        )
-        prev["content"] = None
-        if content and match_table_content_end(content):
-            appended_content = None
+            class_value = section_content_class(section, content)
 
-    return content_blocks, appended_content, prev
+        if (
+            (self.prev_wrap and not wrap)
+            or (wrap and self.prev_wrap and self.prev_wrap != wrap)
+            or (self.prev_wrap and not content)
+        ):
+            self.finish_wrap(content, class_value, section.get("element"))
+
+        elif action == "add":
+            if self.prev_action == "append" and self.appended:
+                self.content_blocks.append(
+                    record_lib.BlockRecord(
+                        self.prev_tag_name,
+                        "".join(self.appended),
+                        self.prev_attr,
+                        self.appended_element,
+                    )
+                )
+                self.appended = []
+            if content and not wrap:
+                self.content_blocks.append(
+                    record_lib.BlockRecord(tag_name, content, attr, element)
+                )
+                self.set_prev_content(None)
+                self.appended = []
+            elif content:
+                self.set_appended(content)
+                self.set_prev_content(content, class_value)
+
+        elif action == "append":
+            if self.appended:
+                self.appended.append(content)
+            else:
+                self.set_appended(content)
+                if not wrap:
+                    appended_element = element
+            self.set_prev_content(content, class_value)
+
+        self.prev_action = action
+        self.prev_tag_name = tag_name
+        self.prev_attr = attr
+        self.prev_wrap = wrap
+        self.appended_element = appended_element
+
+    def finish_wrap(self, content, class_value, element=None):
+        """add appended content to a wrap, element is the Element of the content"""
+        appended_content = "".join(self.appended)
+        # finish the fig tag content
+        if self.prev_wrap == "fig":
+            title_end = content and class_value & CONTENT_FIG_TITLE_END
+            # format the content into the figure content block
+            if title_end:
+                appended_content = appended_content + content
+
+            # potentially multiple figs, parse and add to fig_content_list
+            fig_content_list = []
+            prev_start = None
+            for match in FIG_CONTENT_START_MATCH_PATTERN.finditer(appended_content):
+                start = match.start()
+                if prev_start is not None:
+                    fig_content_list.append(appended_content[prev_start:start])
+                prev_start = start
+            fig_content_list.append(appended_content[prev_start:])
+
+            for fig_block_content in fig_content_list:
+                fig_content = build_fig(fig_block_content)
+                fig_tag = fig_element(
+                    fig_content.get("label"),
+                    fig_content.get("title"),
+                    fig_content.get("content"),
+                )
+                self.content_blocks.append(
+                    record_lib.BlockRecord("fig", None, self.prev_attr, fig_tag)
+                )
+            self.set_prev_content(None)
+            self.set_appended(None if title_end else content)
+        elif self.prev_wrap == "media":
+            title_end = content and class_value & CONTENT_VIDEO_TITLE_END
+            # format the content into the video media content block
+            if title_end:
+                appended_content = appended_content + content
+            video_content = build_fig(appended_content)
+            media_tag = media_element(
+                video_content.get("label"),
+                video_content.get("title"),
+                video_content.get("content"),
+            )
+            self.content_blocks.append(
+                record_lib.BlockRecord("media", None, media_tag.attrib, media_tag)
+            )
+            self.set_prev_content(None)
+            self.set_appended(None if title_end else content)
+        elif self.prev_wrap == "disp-quote":
+            disp_quote_tag = disp_quote_element(appended_content)
+            tag_attr = {"content-type": "editor-comment"}
+            self.content_blocks.append(
+                record_lib.BlockRecord("disp-quote", None, tag_attr, disp_quote_tag)
+            )
+            self.set_prev_content(content, class_value)
+            self.set_appended(content)
+        elif self.prev_wrap == "table-wrap":
+            table_end = content and class_value & CONTENT_TABLE_END
+            table_tag = None
+            if table_end:
+                table_tag = table_section_element(appended_content, content, element)
+            if table_tag is not None:
+                table_content = build_table_wrap_parts(appended_content, table_tag)
+            else:
+                if table_end:
+                    appended_content = appended_content + content
+                table_content = build_table_wrap(appended_content)
+            table_wrap_tag = table_wrap_element(
+                table_content.get("label"),
+                table_content.get("title"),
+                table_content.get("content"),
+                table_content.get("table"),
+            )
+            self.content_blocks.append(
+                record_lib.BlockRecord(
+                    "table-wrap", None, table_wrap_tag.attrib, table_wrap_tag
+                )
+            )
+            self.set_prev_content(None)
+            if table_end:
+                self.appended = []
 
 
-def process_content(tag_name, content, prev, prefs=None):
+def process_content(tag_name, content, prev, prefs=None, element=None):
     if tag_name == "list":
-        return process_list_content(content, prev)
+        return process_list_content(content, prev, element)
     if tag_name == "table":
         return process_table_content(content)
     if tag_name == "p":
@@ -679,23 +1050,141 @@ def process_table_content(content):
     return content, "table", None, "add", wrap
 
 
-def process_list_content(content, prev=None):
+def process_list_content(content, prev=None, element=None):
     # simple replacement of list-type="order" with list-type="number"
     if not prev:
         prev = {}
     content = content.replace('<list list-type="order">', '<list list-type="number">')
     content = eautils.remove_tag("disp-quote", content)
-    content_xml = ElementTree.fromstring(content)
+    if element is not None:
+        list_element_type(element)
+        attr = dict(element.attrib)
+    else:
+        attr = ElementTree.fromstring(content).attrib
     return (
         utils.clean_portion(content, "list"),
         "list",
-        content_xml.attrib,
+        attr,
         "add",
         prev.get("wrap"),
     )
 
 
+def list_element_type(element):
+    """replace list-type="order" in the Element as it is replaced in the content"""
+    # namespaces declared on the root tag come before its list-type attribute
+    root_replaced = not element_has_namespaces(element)
+    for list_tag in element.iter("list"):
+        if list_tag.attrib == {"list-type": "order"} and (
+            list_tag is not element or root_replaced
+        ):
+            list_tag.set("list-type", "number")
+
+
 FIG_CONTENT_START_PATTERN = r"\&lt;[A-Za-z ]+ image [0-9]+?\.{0,1}\&gt;"
+FIG_CONTENT_TITLE_START_PATTERN = r"^&lt;.*image [0-9]+? title\/legend\&gt;"
+# the lookahead checks the end of the content first, otherwise every &lt; is
+# tried against the rest of the content when it does not match
+FIG_CONTENT_TITLE_END_PATTERN = (
+    r"(?=.*image [0-9]+? title\/legend\&gt;$).*\&lt;.*image [0-9]+? title\/legend\&gt;$"
+)
+VIDEO_CONTENT_START_PATTERN = r"\&lt;.*video [0-9]+?\.{0,1}\&gt;"
+VIDEO_CONTENT_TITLE_START_PATTERN = r"^&lt;.*video [0-9]+? title\/legend\&gt;"
+VIDEO_CONTENT_TITLE_END_PATTERN = (
+    r"(?=.*video [0-9]+? title\/legend\&gt;$).*\&lt;.*video [0-9]+? title\/legend\&gt;$"
+)
+# only the first space after the &lt; is tried, the same as [A-Za-z ]+ before it
+# but without trying the rest of the content again from every later space
+TABLE_CONTENT_START_PATTERN = (
+    r"^<bold>.*[tT]able [0-9]+?.?<\/bold>$"
+    r"|\&lt;[A-Za-z ][A-Za-z]* .*[tT]able [0-9]+?\&gt;"
+)
+TABLE_CONTENT_END_PATTERN = r".*</table>$"
+DISP_QUOTE_CONTENT_PATTERN = r"^<italic>.*<\/italic>$"
+
+FIG_CONTENT_START_MATCH_PATTERN = re.compile(FIG_CONTENT_START_PATTERN)
+
+# content class bit flags, a content string can match more than one
+CONTENT_FIG_START = 1
+CONTENT_FIG_TITLE_START = 2
+CONTENT_FIG_TITLE_END = 4
+CONTENT_VIDEO_START = 8
+CONTENT_VIDEO_TITLE_START = 16
+CONTENT_VIDEO_TITLE_END = 32
+CONTENT_TABLE_START = 64
+CONTENT_TABLE_END = 128
+CONTENT_DISP_QUOTE = 256
+CONTENT_DISP_FORMULA = 512
+
+CONTENT_CLASS_GROUPS = OrderedDict(
+    [
+        ("fig_start", (CONTENT_FIG_START, FIG_CONTENT_START_PATTERN)),
+        ("fig_title_start", (CONTENT_FIG_TITLE_START, FIG_CONTENT_TITLE_START_PATTERN)),
+        ("fig_title_end", (CONTENT_FIG_TITLE_END, FIG_CONTENT_TITLE_END_PATTERN)),
+        ("video_start", (CONTENT_VIDEO_START, VIDEO_CONTENT_START_PATTERN)),
+        (
+            "video_title_start",
+            (CONTENT_VIDEO_TITLE_START, VIDEO_CONTENT_TITLE_START_PATTERN),
+        ),
+        (
+            "video_title_end",
+            (CONTENT_VIDEO_TITLE_END, VIDEO_CONTENT_TITLE_END_PATTERN),
+        ),
+        ("table_start", (CONTENT_TABLE_START, TABLE_CONTENT_START_PATTERN)),
+        ("table_end", (CONTENT_TABLE_END, TABLE_CONTENT_END_PATTERN)),
+        ("disp_quote", (CONTENT_DISP_QUOTE, DISP_QUOTE_CONTENT_PATTERN)),
+        ("disp_formula", (CONTENT_DISP_FORMULA, r"<disp-formula")),
+    ]
+)
+
+# each pattern is an optional lookahead from the start of the content, so one
+# match finds every class of the content
+CONTENT_CLASS_MATCH_PATTERN = re.compile(
+    "".join(
+        r"(?:(?=(?P<%s>%s)))?" % (name, pattern)
+        for name, (_, pattern) in CONTENT_CLASS_GROUPS.items()
+    )
+)
+
+# content wrapped in a p tag by clean_italic_p matches none of the patterns
+ITALIC_P_CONTENT_CLASS = 0
+
+# wraps started by a paragraph, in the order they are checked
+WRAP_START_TABLE = (
+    (CONTENT_FIG_START, "fig"),
+    (CONTENT_VIDEO_START, "media"),
+    (CONTENT_TABLE_START, "table-wrap"),
+    (CONTENT_DISP_QUOTE, "disp-quote"),
+)
+
+# wraps started by the paragraph after a fig with no caption, otherwise no wrap
+FIG_NEXT_WRAP_TABLE = (
+    (CONTENT_DISP_QUOTE, "disp-quote"),
+    (CONTENT_TABLE_START, "table-wrap"),
+    (CONTENT_VIDEO_START, "media"),
+)
+
+
+def content_class(content):
+    """bit flags of the fig, video, table and disp-quote patterns the content matches"""
+    if not content:
+        return 0
+    match = CONTENT_CLASS_MATCH_PATTERN.match(content)
+    if match.lastindex is None:
+        # most paragraphs match none of the patterns
+        return 0
+    class_value = 0
+    for name, value in match.groupdict().items():
+        if value is not None:
+            class_value |= CONTENT_CLASS_GROUPS[name][0]
+    return class_value
+
+
+def section_content_class(section, content):
+    """content class of the processed section content, cached on the section"""
+    if "content_class" not in section:
+        section["content_class"] = content_class(content)
+    return section["content_class"]
 
 
 def match_fig_content_start(content):
@@ -703,38 +1192,35 @@ def match_fig_content_start(content):
 
 
 def match_fig_content_title_start(content):
-    return bool(re.match(r"^&lt;.*image [0-9]+? title\/legend\&gt;", content))
+    return bool(re.match(FIG_CONTENT_TITLE_START_PATTERN, content))
 
 
 def match_fig_content_title_end(content):
-    return bool(re.match(r".*\&lt;.*image [0-9]+? title\/legend\&gt;$", content))
+    return bool(re.match(FIG_CONTENT_TITLE_END_PATTERN, content))
 
 
 def match_video_content_start(content):
-    return bool(re.match(r"\&lt;.*video [0-9]+?\.{0,1}\&gt;", content))
+    return bool(re.match(VIDEO_CONTENT_START_PATTERN, content))
 
 
 def match_video_content_title_start(content):
-    return bool(re.match(r"^&lt;.*video [0-9]+? title\/legend\&gt;", content))
+    return bool(re.match(VIDEO_CONTENT_TITLE_START_PATTERN, content))
 
 
 def match_video_content_title_end(content):
-    return bool(re.match(r".*\&lt;.*video [0-9]+? title\/legend\&gt;$", content))
+    return bool(re.match(VIDEO_CONTENT_TITLE_END_PATTERN, content))
 
 
 def match_table_content_start(content):
-    return bool(
-        re.match(r"^<bold>.*[tT]able [0-9]+?.?<\/bold>$", content)
-        or re.match(r"\&lt;[A-Za-z ]+ .*[tT]able [0-9]+?\&gt;", content)
-    )
+    return bool(re.match(TABLE_CONTENT_START_PATTERN, content))
 
 
 def match_table_content_end(content):
-    return bool(re.match(r".*</table>$", content))
+    return bool(re.match(TABLE_CONTENT_END_PATTERN, content))
 
 
 def match_disp_quote_content(content):
-    return bool(re.match(r"^<italic>.*<\/italic>$", content))
+    return bool(re.match(DISP_QUOTE_CONTENT_PATTERN, content))
 
 
 def p_wrap(content):
@@ -749,84 +1235,94 @@ def clean_italic_p(content):
 
 def process_p_content(content, prev, prefs=None):
     """set paragraph content and decide to append or add to previous paragraph content"""
-    action = "append"
-    tag_name = "p"
     content = utils.clean_portion(content, "p")
-    wrap = prev.get("wrap")
+    content, _, action, wrap = p_content_transition(
+        content,
+        content_class(content),
+        prev.get("content"),
+        content_class(prev.get("content")),
+        prev.get("wrap"),
+        prefs,
+    )
+    return content, "p", None, action, wrap
+
+
+def p_content_transition(
+    content, class_value, prev_content, prev_class, prev_wrap, prefs=None
+):
+    """
+    from the content class of the paragraph and the previous content decide the
+    action and the wrap, returns the content, its class, the action and the wrap
+    """
+    action = "append"
+    wrap = prev_wrap
 
     # author response or decision letter image parsing
     if not wrap:
-        if match_fig_content_start(content):
-            wrap = "fig"
-            action = "add"
-        elif match_video_content_start(content):
-            wrap = "media"
-            action = "add"
-        elif match_table_content_start(content):
-            wrap = "table-wrap"
-            action = "add"
-        elif match_disp_quote_content(content):
-            if prefs and prefs.get("italic_to_disp_quote"):
-                wrap = "disp-quote"
-                content = clean_italic_p(content)
+        for start_class, start_wrap in WRAP_START_TABLE:
+            if class_value & start_class:
+                if start_wrap == "disp-quote":
+                    if not (prefs and prefs.get("italic_to_disp_quote")):
+                        break
+                    content = clean_italic_p(content)
+                    class_value = ITALIC_P_CONTENT_CLASS
+                wrap = start_wrap
                 action = "add"
+                break
 
     if wrap and wrap != "disp-quote":
-        if match_fig_content_title_end(content) or match_video_content_title_end(
-            content
-        ):
+        if class_value & (CONTENT_FIG_TITLE_END | CONTENT_VIDEO_TITLE_END):
             action = "add"
             wrap = None
         elif (
             wrap == "fig"
-            and prev.get("content")
-            and match_fig_content_start(prev.get("content"))
-            and not match_fig_content_title_start(content)
+            and prev_content
+            and prev_class & CONTENT_FIG_START
+            and not class_value & CONTENT_FIG_TITLE_START
         ):
-            if match_fig_content_start(content):
-                # append content if two figs are listed in succession
-                content = "%s%s" % (prev.get("content"), content)
+            if class_value & CONTENT_FIG_START:
+                # append content if two figs are listed in succession, it still
+                # starts with the previous fig, which is all that is checked of it
+                content = "%s%s" % (prev_content, content)
+                class_value = prev_class
                 action = "add"
             else:
                 # after a fig with no caption, check if the next paragraph
                 # is another type of wrap or will be a disp-quote
-                if not match_disp_quote_content(content):
-                    if match_table_content_start(content):
-                        wrap = "table-wrap"
-                        action = "add"
-                    elif match_video_content_start(content):
-                        wrap = "media"
+                wrap = None
+                for next_class, next_wrap in FIG_NEXT_WRAP_TABLE:
+                    if class_value & next_class:
+                        if next_wrap == "disp-quote":
+                            content = clean_italic_p(content)
+                            class_value = ITALIC_P_CONTENT_CLASS
+                        wrap = next_wrap
                         action = "add"
-                    else:
-                        wrap = None
-                else:
-                    wrap = "disp-quote"
-                    content = clean_italic_p(content)
-                    action = "add"
+                        break
         elif (
             wrap == "media"
-            and prev.get("content")
-            and match_video_content_start(prev.get("content"))
-            and not match_video_content_title_start(content)
+            and prev_content
+            and prev_class & CONTENT_VIDEO_START
+            and not class_value & CONTENT_VIDEO_TITLE_START
         ):
             wrap = None
     elif wrap == "disp-quote":
-        if match_table_content_start(content):
+        if class_value & CONTENT_TABLE_START:
             wrap = "table-wrap"
-        elif prev.get("wrap") == "disp-quote":
-            if not match_disp_quote_content(content):
+        elif prev_wrap == "disp-quote":
+            if not class_value & CONTENT_DISP_QUOTE:
                 wrap = None
             else:
                 content = clean_italic_p(content)
+                class_value = ITALIC_P_CONTENT_CLASS
     elif (
         not wrap
-        and prev.get("content")
-        and not prev.get("content").startswith("<disp-formula")
-        and not content.startswith("<disp-formula")
+        and prev_content
+        and not prev_class & CONTENT_DISP_FORMULA
+        and not class_value & CONTENT_DISP_FORMULA
     ):
         action = "add"
 
-    return content, tag_name, None, action, wrap
+    return content, class_value, action, wrap
 
 
 def process_disp_quote_content(content, prev):
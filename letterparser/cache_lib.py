@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+MEMORY_SIZE = 128
+
+# disk cache size budget in bytes
+DISK_SIZE = 100 * 1024 * 1024
+
+CACHE_FILE_SUFFIX = ".cache"
+
+
+def cache_key(*parts):
+    """hash of the JSON of the parts which identify a conversion"""
+    key_string = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(key_string.encode("utf8")).hexdigest()
+
+
+class MemoryCache:
+    """least recently used entries are removed once there are more than the size"""
+
+    def __init__(self, size=MEMORY_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+class DiskCache:
+    """
+    a file per entry in the directory, the least recently used files are removed
+    once they take up more than the size in bytes
+    """
+
+    def __init__(self, directory, size=DISK_SIZE):
+        self.directory = directory
+        self.size = size
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + CACHE_FILE_SUFFIX)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as open_file:
+                value = open_file.read().decode("utf8")
+            # the modified time records when the entry was last used
+            os.utime(path)
+        except OSError:
+            return None
+        return value
+
+    def set(self, key, value):
+        # write to a temporary file first so a partial entry is never read
+        with tempfile.NamedTemporaryFile(
+            dir=self.directory, suffix=".tmp", delete=False
+        ) as open_file:
+            open_file.write(value.encode("utf8"))
+        os.replace(open_file.name, self.path(key))
+        self.evict()
+
+    def evict(self):
+        """remove the least recently used files until they fit the size"""
+        with self.lock:
+            entries = []
+            for dir_entry in os.scandir(self.directory):
+                if dir_entry.name.endswith(CACHE_FILE_SUFFIX):
+                    try:
+                        stat = dir_entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_size <= self.size:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total_size -= size
+
+
+class ConversionCache:
+    """
+    look up a conversion in each tier in order, an entry found in a later tier
+    is copied to the earlier ones, any object with get and set methods is a tier
+    """
+
+    def __init__(self, tiers=None):
+        self.tiers = tiers if tiers else []
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for earlier_tier in self.tiers[:i]:
+                    earlier_tier.set(key, value)
+                with self.lock:
+                    self.hits += 1
+                return value
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        for tier in self.tiers:
+            tier.set(key, value)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def create_cache(memory_size=None, directory=None, disk_size=None):
+    """a memory tier and a disk tier if a directory is specified"""
+    tiers = []
+    if memory_size:
+        tiers.append(MemoryCache(memory_size))
+    if directory:
+        tiers.append(DiskCache(directory, disk_size if disk_size else DISK_SIZE))
+    return ConversionCache(tiers)
@@ -2,8 +2,17 @@ import configparser
 import json
 
 CONFIG_FILE = "letterparser.cfg"
-BOOLEAN_VALUES = []
-INT_VALUES = []
+BOOLEAN_VALUES = ["pandoc_ast", "pandoc_lua_filter", "workspace_ram"]
+INT_VALUES = [
+    "async_concurrency",
+    "backend_failure_threshold",
+    "backend_reset_timeout",
+    "build_processes",
+    "cache_disk_size",
+    "cache_memory_size",
+    "docker_pool_size",
+    "pandoc_server_timeout",
+]
 LIST_VALUES = []
 
 
@@ -19,7 +28,7 @@ def raw_config(config_section, config_file=CONFIG_FILE):
     if config.has_section(config_section):
         return config[config_section]
     # default
-    return config.defaults()
+    return config[configparser.DEFAULTSECT]
 
 
 def boolean_config(raw_config, value_name):
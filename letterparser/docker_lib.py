@@ -1,21 +1,292 @@
+import asyncio
+import atexit
+import functools
 import os
+import queue
+import tempfile
+import threading
 import docker
 from letterparser import utils
 
 
+# one docker client shared by all calls
+DOCKER_CLIENT = None
+
+# container pools keyed by docker image and work directory
+CONTAINER_POOLS = {}
+CONTAINER_POOLS_LOCK = threading.Lock()
+
+POOL_LABEL = "letterparser-pandoc-pool"
+
+# where the directory containing a Lua filter is mounted in the container
+FILTER_BIND_PATH = "/filters"
+
+# docx bytes are written here for the container to read, docker has no simple stdin
+BYTES_WORK_DIR = os.path.join(tempfile.gettempdir(), "letterparser-docker")
+
+
 def get_docker_client():
-    return docker.from_env()
+    global DOCKER_CLIENT
+    if DOCKER_CLIENT is None:
+        DOCKER_CLIENT = docker.from_env()
+    return DOCKER_CLIENT
 
 
 def create_docker_volumes_dict(source_path, bind_path="/data", mode="ro"):
     return {source_path: {"bind": bind_path, "mode": mode}}
 
 
-def call_pandoc(file_name, docker_image, output_format="jats"):
+def filter_volumes_dict(lua_filter):
+    """mount the directory of the Lua filter, if specified"""
+    if not lua_filter:
+        return {}
+    return create_docker_volumes_dict(
+        utils.get_file_name_path(os.path.abspath(lua_filter)), FILTER_BIND_PATH
+    )
+
+
+def filter_container_path(lua_filter):
+    return "%s/%s" % (FILTER_BIND_PATH, utils.get_file_name_file(lua_filter))
+
+
+def pandoc_command(file_name, output_format="jats", lua_filter=None):
+    command = ["pandoc", "--wrap=none", "--to=%s" % output_format]
+    if lua_filter:
+        command.append("--lua-filter=%s" % filter_container_path(lua_filter))
+    return command + [file_name]
+
+
+def call_pandoc(
+    file_name,
+    docker_image,
+    output_format="jats",
+    pool_size=None,
+    work_dir=None,
+    lua_filter=None,
+):
+    if pool_size:
+        if not work_dir:
+            work_dir = utils.get_file_name_path(os.path.abspath(file_name))
+        pool = get_container_pool(docker_image, work_dir, pool_size, lua_filter)
+        return pool.call_pandoc(file_name, output_format)
     client = get_docker_client()
     file_name_path = utils.get_file_name_path(os.path.abspath(file_name))
     file_name_file = utils.get_file_name_file(file_name)
     volumes = create_docker_volumes_dict(file_name_path)
+    volumes.update(filter_volumes_dict(lua_filter))
     command = '--wrap=none --to=%s "%s"' % (output_format, file_name_file)
-    output = client.containers.run(docker_image, command, volumes=volumes)
+    if lua_filter:
+        command = '--lua-filter="%s" %s' % (filter_container_path(lua_filter), command)
+    # remove the container once it exits so they do not accumulate
+    output = client.containers.run(docker_image, command, volumes=volumes, remove=True)
     return output.decode("utf8")
+
+
+def call_pandoc_bytes(
+    docx_bytes,
+    docker_image,
+    output_format="jats",
+    pool_size=None,
+    lua_filter=None,
+):
+    """convert docx bytes, they are written to a file only while the container reads it"""
+    os.makedirs(BYTES_WORK_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=BYTES_WORK_DIR, suffix=".docx", delete=False
+    ) as open_file:
+        open_file.write(docx_bytes)
+    try:
+        return call_pandoc(
+            open_file.name,
+            docker_image,
+            output_format=output_format,
+            pool_size=pool_size,
+            work_dir=BYTES_WORK_DIR,
+            lua_filter=lua_filter,
+        )
+    finally:
+        os.remove(open_file.name)
+
+
+async def run_in_thread(function, *args, **kwargs):
+    """the docker SDK blocks, wait for its calls in a thread off the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, functools.partial(function, *args, **kwargs)
+    )
+
+
+async def call_pandoc_async(
+    file_name,
+    docker_image,
+    output_format="jats",
+    pool_size=None,
+    work_dir=None,
+    lua_filter=None,
+):
+    """call_pandoc without blocking the event loop"""
+    return await run_in_thread(
+        call_pandoc,
+        file_name,
+        docker_image,
+        output_format=output_format,
+        pool_size=pool_size,
+        work_dir=work_dir,
+        lua_filter=lua_filter,
+    )
+
+
+async def call_pandoc_bytes_async(
+    docx_bytes,
+    docker_image,
+    output_format="jats",
+    pool_size=None,
+    lua_filter=None,
+):
+    """call_pandoc_bytes without blocking the event loop"""
+    return await run_in_thread(
+        call_pandoc_bytes,
+        docx_bytes,
+        docker_image,
+        output_format=output_format,
+        pool_size=pool_size,
+        lua_filter=lua_filter,
+    )
+
+
+def pandoc_version(docker_image):
+    """get the pandoc version from the first line of pandoc --version output"""
+    client = get_docker_client()
+    output = client.containers.run(docker_image, "--version", remove=True)
+    return output.decode("utf8").split("\n")[0].split(" ")[-1]
+
+
+class ContainerPool:
+    """long-lived pandoc containers which run conversions using exec"""
+
+    def __init__(
+        self, docker_image, work_dir, size=1, bind_path="/data", lua_filter=None
+    ):
+        self.docker_image = docker_image
+        self.work_dir = os.path.abspath(work_dir)
+        self.size = size
+        self.bind_path = bind_path
+        self.lua_filter = lua_filter
+        self.containers = queue.Queue()
+        self.started = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        """start the containers, if not already started"""
+        with self.lock:
+            if self.started:
+                return
+            for _ in range(self.size):
+                self.containers.put(self.start_container())
+            self.started = True
+
+    def start_container(self):
+        """run a container which idles until it is given a command to exec"""
+        volumes = create_docker_volumes_dict(self.work_dir, self.bind_path)
+        volumes.update(filter_volumes_dict(self.lua_filter))
+        return get_docker_client().containers.run(
+            self.docker_image,
+            entrypoint=["tail", "-f", "/dev/null"],
+            volumes=volumes,
+            labels=[POOL_LABEL],
+            detach=True,
+            auto_remove=True,
+        )
+
+    def is_healthy(self, container):
+        """check the container is still running"""
+        try:
+            container.reload()
+        except docker.errors.APIError:
+            return False
+        return container.status == "running"
+
+    def replace(self, container):
+        """remove a dead container and start a new one in its place"""
+        try:
+            container.remove(force=True)
+        except docker.errors.APIError:
+            # container may already be removed
+            pass
+        return self.start_container()
+
+    def acquire(self):
+        """wait for an idle container and make sure it is healthy"""
+        self.start()
+        container = self.containers.get()
+        if not self.is_healthy(container):
+            try:
+                container = self.replace(container)
+            except docker.errors.APIError:
+                # return the dead container so the pool does not shrink
+                self.containers.put(container)
+                raise
+        return container
+
+    def release(self, container):
+        self.containers.put(container)
+
+    def container_path(self, file_name):
+        """path of the file inside the container"""
+        relative_path = os.path.relpath(os.path.abspath(file_name), self.work_dir)
+        if relative_path.startswith(os.pardir):
+            raise ValueError(
+                "%s is not inside the work directory %s" % (file_name, self.work_dir)
+            )
+        return "/".join([self.bind_path] + relative_path.split(os.sep))
+
+    def call_pandoc(self, file_name, output_format="jats"):
+        # the filter only applies to JATS output
+        lua_filter = self.lua_filter if output_format == "jats" else None
+        command = pandoc_command(
+            self.container_path(file_name), output_format, lua_filter
+        )
+        container = self.acquire()
+        try:
+            exit_code, output = container.exec_run(command, workdir=self.bind_path)
+        except docker.errors.APIError:
+            # the container probably stopped during the call
+            container = self.replace(container)
+            raise
+        finally:
+            self.release(container)
+        if exit_code != 0:
+            raise docker.errors.ContainerError(
+                container, exit_code, command, self.docker_image, output
+            )
+        return output.decode("utf8")
+
+    def close(self):
+        """stop and remove all the containers"""
+        with self.lock:
+            while not self.containers.empty():
+                container = self.containers.get()
+                try:
+                    container.remove(force=True)
+                except docker.errors.APIError:
+                    pass
+            self.started = False
+
+
+def get_container_pool(docker_image, work_dir, size=1, lua_filter=None):
+    """return the pool of containers for the docker image and work directory"""
+    key = (docker_image, os.path.abspath(work_dir), lua_filter)
+    with CONTAINER_POOLS_LOCK:
+        if key not in CONTAINER_POOLS:
+            CONTAINER_POOLS[key] = ContainerPool(
+                docker_image, work_dir, size, lua_filter=lua_filter
+            )
+        return CONTAINER_POOLS[key]
+
+
+@atexit.register
+def close_container_pools():
+    with CONTAINER_POOLS_LOCK:
+        for pool in CONTAINER_POOLS.values():
+            pool.close()
+        CONTAINER_POOLS.clear()
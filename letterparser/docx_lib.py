@@ -0,0 +1,807 @@
+# coding=utf-8
+
+"""
+pure Python docx reader producing the same rough JATS as pandoc for a subset of documents
+paragraphs, bold, italic, strike, superscript, subscript and underline runs, links,
+lists, block quotes from indentation, headings and tables are supported,
+documents containing math, images, embedded objects or notes are not
+"""
+import re
+import zipfile
+from xml.etree import ElementTree
+
+
+W_NAMESPACE = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+R_NAMESPACE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+DOCUMENT_XML = "word/document.xml"
+NUMBERING_XML = "word/numbering.xml"
+STYLES_XML = "word/styles.xml"
+RELS_XML = "word/_rels/document.xml.rels"
+
+# docx content which the native reader cannot convert
+UNSUPPORTED_TAGS = [
+    b"<m:oMath",
+    b"<w:drawing",
+    b"<w:pict",
+    b"<w:object",
+    b"<w:footnoteReference",
+    b"<w:endnoteReference",
+    b"<w:sym",
+]
+
+CHUNK_SIZE = 1024 * 1024
+
+# inline formatting applied to a run, outermost first, as pandoc does
+RUN_FORMATTING = ["italic", "bold", "strike", "sup", "sub"]
+
+# formatting tags which are merged when they are next to each other
+MERGE_TAGS = ["italic", "bold", "strike", "sup", "sub"]
+
+LIST_STYLE_MAP = {
+    "decimal": "order",
+    "upperLetter": "alpha-upper",
+    "lowerLetter": "alpha-lower",
+    "upperRoman": "roman-upper",
+    "lowerRoman": "roman-lower",
+}
+
+LIST_DELIM_MAP = {"%1)": "one-paren", "(%1)": "two-parens", "%1.": "period"}
+
+OFF_VALUES = ["false", "0", "off"]
+
+
+def w_tag(name):
+    return "{%s}%s" % (W_NAMESPACE, name)
+
+
+def w_attr(element, name, default=None):
+    return element.get(w_tag(name), default) if element is not None else default
+
+
+def native_supported(file_name):
+    """check the docx document.xml does not contain any unsupported content"""
+    overlap = max(len(tag) for tag in UNSUPPORTED_TAGS)
+    with zipfile.ZipFile(file_name) as open_zip:
+        with open_zip.open(DOCUMENT_XML) as open_file:
+            tail = b""
+            while True:
+                chunk = open_file.read(CHUNK_SIZE)
+                if not chunk:
+                    return True
+                data = tail + chunk
+                if [tag for tag in UNSUPPORTED_TAGS if tag in data]:
+                    return False
+                tail = data[-overlap:]
+
+
+def on_off(element):
+    """value of a toggle property tag, None if the tag is not present"""
+    if element is None:
+        return None
+    return w_attr(element, "val") not in OFF_VALUES
+
+
+def run_properties(rpr_tag):
+    """formatting values set by a w:rPr tag"""
+    props = {}
+    if rpr_tag is None:
+        return props
+    # complex script formatting is only used for right to left or complex script runs
+    complex_script = on_off(rpr_tag.find(w_tag("rtl"))) or on_off(
+        rpr_tag.find(w_tag("cs"))
+    )
+    for name, tag_name in [("italic", "i"), ("bold", "b")]:
+        if complex_script:
+            tag_name += "Cs"
+        value = on_off(rpr_tag.find(w_tag(tag_name)))
+        if value is not None:
+            props[name] = value
+    strike = on_off(rpr_tag.find(w_tag("strike")))
+    if strike is not None:
+        props["strike"] = strike
+    vert_align = w_attr(rpr_tag.find(w_tag("vertAlign")), "val")
+    if vert_align == "superscript":
+        props["sup"] = True
+    elif vert_align == "subscript":
+        props["sub"] = True
+    style = w_attr(rpr_tag.find(w_tag("rStyle")), "val")
+    if style:
+        props["style"] = style
+    return props
+
+
+def parse_styles(xml_bytes):
+    """style names, base styles and run properties keyed by style id"""
+    styles = {}
+    if not xml_bytes:
+        return styles
+    root = ElementTree.fromstring(xml_bytes)
+    for style_tag in root.iter(w_tag("style")):
+        styles[w_attr(style_tag, "styleId")] = {
+            "type": w_attr(style_tag, "type"),
+            "name": w_attr(style_tag.find(w_tag("name")), "val", ""),
+            "based_on": w_attr(style_tag.find(w_tag("basedOn")), "val"),
+            "props": run_properties(style_tag.find(w_tag("rPr"))),
+        }
+    return styles
+
+
+def parse_numbering(xml_bytes):
+    """list level formats keyed by numId and then ilvl"""
+    numbering = {}
+    if not xml_bytes:
+        return numbering
+    root = ElementTree.fromstring(xml_bytes)
+    abstract_levels = {}
+    for abstract_tag in root.findall(w_tag("abstractNum")):
+        levels = {}
+        for level_tag in abstract_tag.findall(w_tag("lvl")):
+            levels[w_attr(level_tag, "ilvl")] = {
+                "format": w_attr(level_tag.find(w_tag("numFmt")), "val"),
+                "text": w_attr(level_tag.find(w_tag("lvlText")), "val"),
+                "start": int(w_attr(level_tag.find(w_tag("start")), "val", "1")),
+            }
+        abstract_levels[w_attr(abstract_tag, "abstractNumId")] = levels
+    for num_tag in root.findall(w_tag("num")):
+        abstract_id = w_attr(num_tag.find(w_tag("abstractNumId")), "val")
+        numbering[w_attr(num_tag, "numId")] = abstract_levels.get(abstract_id, {})
+    return numbering
+
+
+def parse_relationships(xml_bytes):
+    """relationship targets keyed by id"""
+    if not xml_bytes:
+        return {}
+    root = ElementTree.fromstring(xml_bytes)
+    return {tag.get("Id"): tag.get("Target") for tag in root}
+
+
+def style_properties(styles, style_id):
+    """run properties of a character style including its base styles"""
+    props = {}
+    seen = set()
+    while style_id and style_id in styles and style_id not in seen:
+        seen.add(style_id)
+        for name, value in styles[style_id].get("props").items():
+            props.setdefault(name, value)
+        style_id = styles[style_id].get("based_on")
+    return props
+
+
+def heading_level(styles, style_id):
+    """heading level from the paragraph style name, e.g. Heading 1"""
+    name = styles.get(style_id, {}).get("name") if style_id else None
+    match = re.match(r"^[Hh]eading ([1-6])$", name or "")
+    return int(match.group(1)) if match else None
+
+
+# inline nodes are lists, [tag_name, children, attributes] or ["str", text],
+# ["space"] or ["break"], and are merged in the same way as pandoc inlines
+
+
+def append_inline(inlines, node):
+    """append a node to the inlines list, merging it with the previous node"""
+    if not inlines:
+        inlines.append(node)
+        return
+    prev = inlines[-1]
+    if prev[0] == "space" and node[0] in ["space", "break"]:
+        inlines[-1] = node
+    elif prev[0] == "break" and node[0] == "space":
+        pass
+    elif prev[0] == "str" and node[0] == "str":
+        inlines[-1] = ["str", prev[1] + node[1]]
+    elif prev[0] == node[0] and node[0] in MERGE_TAGS:
+        children = list(prev[1])
+        for child in node[1]:
+            append_inline(children, child)
+        inlines[-1] = [prev[0], children, prev[2]]
+    else:
+        inlines.append(node)
+
+
+def extend_inlines(inlines, nodes):
+    for node in nodes:
+        append_inline(inlines, node)
+    return inlines
+
+
+def text_inlines(text):
+    """split text into str and space nodes"""
+    inlines = []
+    for part in re.split(r"([ \t\n\r]+)", text):
+        if not part:
+            continue
+        if part.strip(" \t\n\r"):
+            append_inline(inlines, ["str", part])
+        else:
+            append_inline(inlines, ["space"])
+    return inlines
+
+
+def stack_inlines(tag_names, inlines):
+    """wrap the inlines in the formatting tags, outermost first"""
+    for tag_name in reversed(tag_names):
+        if inlines:
+            inlines = [[tag_name, inlines, {}]]
+    return inlines
+
+
+def unstack_inlines(inlines):
+    """formatting tags wrapping a single node and the inlines inside them"""
+    tag_names = []
+    while len(inlines) == 1 and inlines[0][0] in MERGE_TAGS:
+        tag_names.append(inlines[0][0])
+        inlines = inlines[0][1]
+    return tag_names, inlines
+
+
+def space_out_left(inlines):
+    """move a leading space outside of the formatting"""
+    tag_names, inner = unstack_inlines(inlines)
+    if inner and inner[0][0] == "space":
+        return [inner[0]], stack_inlines(tag_names, inner[1:])
+    return [], inlines
+
+
+def space_out_right(inlines):
+    """move a trailing space outside of the formatting"""
+    tag_names, inner = unstack_inlines(inlines)
+    if inner and inner[-1][0] == "space":
+        return stack_inlines(tag_names, inner[:-1]), [inner[-1]]
+    return inlines, []
+
+
+def combine_inlines(first, second):
+    """join inlines, merging the formatting shared at the join like pandoc"""
+    if not first or not second:
+        return extend_inlines(list(first), second)
+    first_tags, first_inner = unstack_inlines(first[-1:])
+    second_tags, second_inner = unstack_inlines(second[:1])
+    shared = [tag_name for tag_name in first_tags if tag_name in second_tags]
+    if shared:
+        joined = stack_inlines(
+            shared,
+            combine_inlines(
+                stack_inlines(
+                    [tag for tag in first_tags if tag not in shared], first_inner
+                ),
+                stack_inlines(
+                    [tag for tag in second_tags if tag not in shared], second_inner
+                ),
+            ),
+        )
+    else:
+        first_part, first_space = space_out_right(first[-1:])
+        second_space, second_part = space_out_left(second[:1])
+        joined = first_part + first_space + second_space + second_part
+    inlines = extend_inlines(list(first[:-1]), joined)
+    return extend_inlines(inlines, second[1:])
+
+
+def trim_spaces(inlines):
+    """remove leading and trailing spaces and breaks"""
+    start = 0
+    end = len(inlines)
+    while start < end and inlines[start][0] in ["space", "break"]:
+        start += 1
+    while end > start and inlines[end - 1][0] in ["space", "break"]:
+        end -= 1
+    return inlines[start:end]
+
+
+class DocxReader:
+    """convert the body of a docx into pandoc-like block and inline nodes"""
+
+    def __init__(self, styles=None, numbering=None, relationships=None):
+        self.styles = styles or {}
+        self.numbering = numbering or {}
+        self.relationships = relationships or {}
+        self.identifiers = set()
+
+    def formatting(self, rpr_tag):
+        props = run_properties(rpr_tag)
+        style_props = style_properties(self.styles, props.get("style"))
+        for name, value in style_props.items():
+            props.setdefault(name, value)
+        return [name for name in RUN_FORMATTING if props.get(name)]
+
+    def run_inlines(self, run_tag):
+        inlines = []
+        for child in run_tag:
+            if child.tag == w_tag("t"):
+                extend_inlines(inlines, text_inlines(child.text or ""))
+            elif child.tag in [w_tag("br"), w_tag("cr")]:
+                append_inline(inlines, ["break"])
+            elif child.tag == w_tag("tab"):
+                append_inline(inlines, ["space"])
+            elif child.tag == w_tag("noBreakHyphen"):
+                append_inline(inlines, ["str", "\u2011"])
+            elif child.tag == w_tag("softHyphen"):
+                append_inline(inlines, ["str", "\u00ad"])
+        return stack_inlines(self.formatting(run_tag.find(w_tag("rPr"))), inlines)
+
+    def link_target(self, hyperlink_tag):
+        target = self.relationships.get(hyperlink_tag.get("{%s}id" % R_NAMESPACE))
+        anchor = w_attr(hyperlink_tag, "anchor")
+        if target and anchor:
+            return "%s#%s" % (target, anchor)
+        if anchor:
+            return "#%s" % anchor
+        return target
+
+    def parts_inlines(self, parent_tag):
+        """inlines from the runs, links and fields inside a paragraph"""
+        inlines = []
+        field = None
+        for child in parent_tag:
+            if child.tag == w_tag("r"):
+                fld_char = child.find(w_tag("fldChar"))
+                instr_text = child.find(w_tag("instrText"))
+                if fld_char is not None:
+                    fld_char_type = w_attr(fld_char, "fldCharType")
+                    if fld_char_type == "begin":
+                        field = {"instr": "", "result": [], "separated": False}
+                    elif fld_char_type == "separate" and field:
+                        field["separated"] = True
+                    elif fld_char_type == "end" and field:
+                        inlines = combine_inlines(inlines, self.field_inlines(field))
+                        field = None
+                elif instr_text is not None and field and not field["separated"]:
+                    field["instr"] += instr_text.text or ""
+                elif field and field["separated"]:
+                    field["result"] = combine_inlines(
+                        field["result"], self.run_inlines(child)
+                    )
+                elif not field:
+                    inlines = combine_inlines(inlines, self.run_inlines(child))
+            elif child.tag == w_tag("hyperlink"):
+                target = self.link_target(child)
+                children = self.parts_inlines(child)
+                if target:
+                    inlines = combine_inlines(
+                        inlines, [["link", children, {"href": target}]]
+                    )
+                else:
+                    inlines = combine_inlines(inlines, children)
+            elif child.tag in [
+                w_tag("ins"),
+                w_tag("smartTag"),
+                w_tag("fldSimple"),
+                w_tag("customXml"),
+            ]:
+                inlines = combine_inlines(inlines, self.parts_inlines(child))
+            elif child.tag == w_tag("sdt"):
+                content_tag = child.find(w_tag("sdtContent"))
+                if content_tag is not None:
+                    inlines = combine_inlines(inlines, self.parts_inlines(content_tag))
+        return inlines
+
+    def field_inlines(self, field):
+        match = re.match(r'^\s*HYPERLINK\s+"(.*?)"', field.get("instr"))
+        if match:
+            return [["link", field.get("result"), {"href": match.group(1)}]]
+        return field.get("result")
+
+    def identifier(self, inlines):
+        """unique auto identifier for a heading in the pandoc style"""
+        text = "".join(inlines_text(inlines)).lower()
+        text = re.sub(r"[^\w\s.-]", "", text)
+        text = re.sub(r"^[^a-z]+", "", re.sub(r"\s+", "-", text.strip()))
+        identifier = text or "section"
+        if identifier in self.identifiers:
+            i = 1
+            while "%s-%s" % (identifier, i) in self.identifiers:
+                i += 1
+            identifier = "%s-%s" % (identifier, i)
+        self.identifiers.add(identifier)
+        return identifier
+
+    def paragraph_item(self, p_tag):
+        """intermediate paragraph item to be grouped into lists and sections"""
+        ppr_tag = p_tag.find(w_tag("pPr"))
+        style_id = w_attr(
+            ppr_tag.find(w_tag("pStyle")) if ppr_tag is not None else None, "val"
+        )
+        inlines = trim_spaces(self.parts_inlines(p_tag))
+        item = {"type": "p", "inlines": inlines, "style": style_id}
+        level = heading_level(self.styles, style_id)
+        if level:
+            item["type"] = "heading"
+            item["level"] = level
+            return item
+        num_pr = ppr_tag.find(w_tag("numPr")) if ppr_tag is not None else None
+        if num_pr is not None:
+            num_id = w_attr(num_pr.find(w_tag("numId")), "val")
+            ilvl = w_attr(num_pr.find(w_tag("ilvl")), "val", "0")
+            level_info = self.numbering.get(num_id, {}).get(ilvl)
+            if num_id != "0" and level_info:
+                item["list"] = {"num_id": num_id, "level": int(ilvl)}
+                item["list"].update(level_info)
+        ind = ppr_tag.find(w_tag("ind")) if ppr_tag is not None else None
+        left = w_attr(ind, "left", w_attr(ind, "start"))
+        if left is not None and style_id != "ListParagraph":
+            hanging = int(w_attr(ind, "hanging", "0"))
+            item["quote"] = int(left) - hanging > 0
+        return item
+
+    def paragraph_blocks(self, item):
+        if not item.get("inlines"):
+            return []
+        blocks = [["p", item.get("inlines")]]
+        if item.get("quote"):
+            blocks = [["disp-quote", blocks]]
+        return blocks
+
+    def table_block(self, tbl_tag):
+        rows = []
+        for tr_tag in tbl_tag.findall(w_tag("tr")):
+            cells = []
+            for tc_tag in tr_tag.findall(w_tag("tc")):
+                cell_blocks = self.body_blocks(tc_tag)
+                if len(cell_blocks) == 1 and cell_blocks[0][0] == "p":
+                    cell_blocks = [["plain", cell_blocks[0][1]]]
+                cells.append(cell_blocks)
+            rows.append(cells)
+        header = None
+        tbl_look = tbl_tag.find("%s/%s" % (w_tag("tblPr"), w_tag("tblLook")))
+        first_row = w_attr(tbl_look, "firstRow") in ["1", "true", "on"] or bool(
+            int(w_attr(tbl_look, "val", "0"), 16) & 0x0020
+        )
+        if first_row and len(rows) > 1:
+            header = rows[0]
+            rows = rows[1:]
+        width = max([len(row) for row in rows] + [len(header or [])])
+        rows = [row + [[]] * (width - len(row)) for row in rows]
+        if header:
+            header = header + [[]] * (width - len(header))
+        return ["table", {"width": width, "header": header, "rows": rows}]
+
+    def element_items(self, element):
+        """items from a paragraph, table or content control in the body"""
+        if element.tag == w_tag("p"):
+            return [self.paragraph_item(element)]
+        if element.tag == w_tag("tbl"):
+            return [{"type": "block", "block": self.table_block(element)}]
+        if element.tag == w_tag("sdt"):
+            content_tag = element.find(w_tag("sdtContent"))
+            if content_tag is not None:
+                return self.body_items(content_tag)
+        return []
+
+    def body_items(self, parent_tag):
+        items = []
+        for child in parent_tag:
+            items += self.element_items(child)
+        return items
+
+    def body_blocks(self, parent_tag):
+        return self.items_to_blocks(self.body_items(parent_tag))
+
+    def items_to_blocks(self, items):
+        """group list items into lists and headings into sections"""
+        blocks = []
+        i = 0
+        while i < len(items):
+            item = items[i]
+            if item.get("list"):
+                list_items = [item]
+                i += 1
+                while i < len(items) and (
+                    items[i].get("list")
+                    or (
+                        items[i].get("type") == "p"
+                        and items[i].get("style") == "ListParagraph"
+                    )
+                ):
+                    list_items.append(items[i])
+                    i += 1
+                blocks += self.list_blocks(list_items, -1)
+                continue
+            if item.get("type") == "heading":
+                # collect the section content up to the next heading of the same level
+                j = i + 1
+                while j < len(items) and not (
+                    items[j].get("type") == "heading"
+                    and items[j].get("level") <= item.get("level")
+                ):
+                    j += 1
+                blocks.append(
+                    [
+                        "sec",
+                        {
+                            "id": self.identifier(item.get("inlines")),
+                            "title": item.get("inlines"),
+                            "blocks": self.items_to_blocks(items[i + 1 : j]),
+                        },
+                    ]
+                )
+                i = j
+                continue
+            if item.get("type") == "block":
+                blocks.append(item.get("block"))
+            else:
+                blocks += self.paragraph_blocks(item)
+            i += 1
+        return blocks
+
+    def list_blocks(self, items, level):
+        """nest list items by level, splitting lists when the numId changes"""
+        blocks = []
+        i = 0
+        while i < len(items):
+            item = items[i]
+            item_level = item_list_level(item)
+            if not item.get("list"):
+                blocks += self.paragraph_blocks(item)
+                i += 1
+                continue
+            num_id = item.get("list", {}).get("num_id")
+            j = i + 1
+            while j < len(items) and (
+                item_list_level(items[j]) > item_level
+                or (
+                    item_list_level(items[j]) == item_level
+                    and items[j].get("list", {}).get("num_id") == num_id
+                )
+            ):
+                j += 1
+            children = items[i:j]
+            list_items = []
+            for child in children:
+                if item_list_level(child) == item_level and child.get("list"):
+                    list_items.append([child])
+                elif list_items:
+                    list_items[-1].append(child)
+            blocks.append(
+                [
+                    "list",
+                    {
+                        "info": item.get("list"),
+                        "items": [
+                            self.paragraph_blocks(list_item[0])
+                            + self.list_blocks(list_item[1:], item_level)
+                            for list_item in list_items
+                        ],
+                    },
+                ]
+            )
+            i = j
+        return blocks
+
+
+def item_list_level(item):
+    if item.get("list"):
+        return item.get("list").get("level")
+    if item.get("style") == "ListParagraph":
+        # continuation paragraph belongs to the previous list item
+        return 1000
+    return -1
+
+
+def inlines_text(inlines):
+    for node in inlines:
+        if node[0] == "str":
+            yield node[1]
+        elif node[0] in ["space", "break"]:
+            yield " "
+        else:
+            yield from inlines_text(node[1])
+
+
+def escape(string):
+    return (
+        string.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .replace('"', "&quot;")
+    )
+
+
+def inlines_to_jats(inlines):
+    output = []
+    for node in inlines:
+        if node[0] == "str":
+            output.append(escape(node[1]))
+        elif node[0] == "space":
+            output.append(" ")
+        elif node[0] == "break":
+            output.append("\n")
+        elif node[0] == "link":
+            href = node[2].get("href")
+            if href.startswith("#"):
+                output.append(
+                    '<xref alt="%s" rid="%s">%s</xref>'
+                    % (
+                        escape("".join(inlines_text(node[1]))),
+                        escape(href[1:]),
+                        inlines_to_jats(node[1]),
+                    )
+                )
+            else:
+                output.append(
+                    '<ext-link ext-link-type="uri" xlink:href="%s">%s</ext-link>'
+                    % (escape(href), inlines_to_jats(node[1]))
+                )
+        else:
+            output.append("<%s>%s</%s>" % (node[0], inlines_to_jats(node[1]), node[0]))
+    return "".join(output)
+
+
+def inline_content(inlines):
+    """line breaks which follow each other only start one new line"""
+    return re.sub(r"\n+", "\n", inlines_to_jats(inlines))
+
+
+def nest(string, indent=2):
+    """indent every line of the string which is not empty"""
+    return "\n".join(
+        (" " * indent + line) if line else line for line in string.split("\n")
+    )
+
+
+def indented_tag(open_tag, close_tag, content):
+    if content:
+        return "%s\n%s\n%s" % (open_tag, nest(content), close_tag)
+    return "%s\n%s" % (open_tag, close_tag)
+
+
+def roman_numeral(number):
+    numerals = [
+        (1000, "m"),
+        (900, "cm"),
+        (500, "d"),
+        (400, "cd"),
+        (100, "c"),
+        (90, "xc"),
+        (50, "l"),
+        (40, "xl"),
+        (10, "x"),
+        (9, "ix"),
+        (5, "v"),
+        (4, "iv"),
+        (1, "i"),
+    ]
+    result = ""
+    for value, numeral in numerals:
+        while number >= value:
+            result += numeral
+            number -= value
+    return result
+
+
+def list_marker(number, list_type, delim):
+    if list_type == "alpha-lower":
+        marker = chr(ord("a") + (number - 1) % 26)
+    elif list_type == "alpha-upper":
+        marker = chr(ord("A") + (number - 1) % 26)
+    elif list_type == "roman-lower":
+        marker = roman_numeral(number)
+    elif list_type == "roman-upper":
+        marker = roman_numeral(number).upper()
+    else:
+        marker = str(number)
+    if delim == "one-paren":
+        return "%s)" % marker
+    if delim == "two-parens":
+        return "(%s)" % marker
+    return "%s." % marker
+
+
+def list_to_jats(list_data):
+    info = list_data.get("info")
+    labels = None
+    if info.get("format") == "bullet" or not info.get("text"):
+        list_type = "bullet"
+    else:
+        list_type = LIST_STYLE_MAP.get(info.get("format"), "order")
+        delim = LIST_DELIM_MAP.get(info.get("text"))
+        start = info.get("start")
+        if start != 1 or delim not in [None, "period"]:
+            labels = [
+                list_marker(start + i, list_type, delim)
+                for i in range(len(list_data.get("items")))
+            ]
+    items = []
+    for i, item_blocks in enumerate(list_data.get("items")):
+        contents = []
+        if labels:
+            contents.append("<label>%s</label>" % escape(labels[i]))
+        for block in item_blocks:
+            block_jats = block_to_jats(block)
+            if block[0] not in ["p", "plain", "list"]:
+                block_jats = indented_tag(
+                    '<p specific-use="wrapper">', "</p>", block_jats
+                )
+            contents.append(block_jats)
+        items.append(indented_tag("<list-item>", "</list-item>", "\n".join(contents)))
+    return indented_tag(
+        '<list list-type="%s">' % list_type, "</list>", "\n".join(items)
+    )
+
+
+def cell_to_jats(cell_blocks, tag_name):
+    return "<%s>%s</%s>" % (tag_name, blocks_to_jats(cell_blocks), tag_name)
+
+
+def table_to_jats(table_data):
+    parts = ['<col align="left" />'] * table_data.get("width")
+    if table_data.get("header") and [cell for cell in table_data.get("header") if cell]:
+        row = indented_tag(
+            "<tr>",
+            "</tr>",
+            "\n".join(cell_to_jats(cell, "th") for cell in table_data.get("header")),
+        )
+        parts.append(indented_tag("<thead>", "</thead>", row))
+    rows = [
+        indented_tag(
+            "<tr>", "</tr>", "\n".join(cell_to_jats(cell, "td") for cell in row)
+        )
+        for row in table_data.get("rows")
+    ]
+    parts.append(indented_tag("<tbody>", "</tbody>", "\n".join(rows)))
+    return indented_tag("<table>", "</table>", "\n".join(parts))
+
+
+def block_to_jats(block):
+    if block[0] == "p":
+        return "<p>%s</p>" % inline_content(block[1])
+    if block[0] == "plain":
+        return inline_content(block[1])
+    if block[0] == "disp-quote":
+        return indented_tag("<disp-quote>", "</disp-quote>", blocks_to_jats(block[1]))
+    if block[0] == "list":
+        return list_to_jats(block[1])
+    if block[0] == "table":
+        return table_to_jats(block[1])
+    if block[0] == "sec":
+        contents = ["<title>%s</title>" % inline_content(block[1].get("title"))]
+        contents += [block_to_jats(child) for child in block[1].get("blocks")]
+        return indented_tag(
+            '<sec id="%s">' % escape(block[1].get("id")), "</sec>", "\n".join(contents)
+        )
+    return ""
+
+
+def blocks_to_jats(blocks):
+    return "\n".join(block_to_jats(block) for block in blocks)
+
+
+def read_zip_member(open_zip, name):
+    if name in open_zip.namelist():
+        return open_zip.read(name)
+    return None
+
+
+def iter_body_elements(open_file):
+    """yield each child element of the document body once it is parsed"""
+    depth = 0
+    body = None
+    for event, element in ElementTree.iterparse(open_file, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if depth == 2 and element.tag == w_tag("body"):
+                body = element
+            continue
+        depth -= 1
+        if body is not None and depth == 2:
+            yield element
+            # free the memory used by the element which is no longer needed
+            body.remove(element)
+
+
+def docx_to_jats(file_name):
+    """convert the docx file to rough JATS similar to the output of pandoc"""
+    with zipfile.ZipFile(file_name) as open_zip:
+        reader = DocxReader(
+            parse_styles(read_zip_member(open_zip, STYLES_XML)),
+            parse_numbering(read_zip_member(open_zip, NUMBERING_XML)),
+            parse_relationships(read_zip_member(open_zip, RELS_XML)),
+        )
+        items = []
+        with open_zip.open(DOCUMENT_XML) as open_file:
+            for element in iter_body_elements(open_file):
+                items += reader.element_items(element)
+    # pandoc output ends with a new line
+    return blocks_to_jats(reader.items_to_blocks(items)) + "\n"
@@ -0,0 +1,202 @@
+-- normalise the document before pandoc writes the JATS output, doing what
+-- letterparser.parse.convert_jats_tags would otherwise do to the JATS output:
+-- strike through text is removed, section headings become paragraphs and
+-- paragraphs which are only whitespace are removed
+--
+-- the lines are still joined and break tags converted by letterparser, so
+-- documents with line breaks, which decide how the lines are joined, are not
+-- changed and are post-processed as before
+--
+-- only element filters are used, pandoc before 2.9.2 has no Inlines filters
+
+-- added to the output so letterparser knows the filter was applied
+local FILTER_MARKER = "<!-- letterparser-filter -->"
+
+-- inlines with content the strike through text is removed from
+local CONTAINERS = {
+  Emph = true,
+  Strong = true,
+  Superscript = true,
+  Subscript = true,
+  SmallCaps = true,
+  Underline = true,
+  Span = true,
+  Link = true,
+  Quoted = true,
+}
+
+-- code points Python str.isspace() is true for
+local SPACE_CODES = {}
+for _, code in ipairs({
+  0x85, 0xA0, 0x1680, 0x2028, 0x2029, 0x202F, 0x205F, 0x3000,
+}) do
+  SPACE_CODES[code] = true
+end
+for code = 0x09, 0x0D do
+  SPACE_CODES[code] = true
+end
+for code = 0x1C, 0x20 do
+  SPACE_CODES[code] = true
+end
+for code = 0x2000, 0x200A do
+  SPACE_CODES[code] = true
+end
+
+local function codes(text)
+  local output = {}
+  for _, code in utf8.codes(text) do
+    table.insert(output, code)
+  end
+  return output
+end
+
+local function is_space(el)
+  return el ~= nil and (el.t == "Space" or el.t == "SoftBreak")
+end
+
+-- true if the inlines are written as only whitespace
+local function is_whitespace(inlines)
+  for _, el in ipairs(inlines) do
+    if el.t == "Str" then
+      for _, code in ipairs(codes(el.text)) do
+        if not SPACE_CODES[code] then
+          return false
+        end
+      end
+    elseif not is_space(el) then
+      return false
+    end
+  end
+  return true
+end
+
+-- remove whitespace from the end of the output, as a regular expression \s*
+-- matched in the JATS output would, return whether a space was removed first
+local function strip_before(output)
+  local first_space = false
+  while #output > 0 do
+    local el = output[#output]
+    if is_space(el) then
+      first_space = true
+      table.remove(output)
+    elseif el.t == "Str" then
+      local text_codes = codes(el.text)
+      local last = #text_codes
+      while last > 0 and SPACE_CODES[text_codes[last]] do
+        first_space = text_codes[last] == 0x20
+        last = last - 1
+      end
+      if last == 0 then
+        table.remove(output)
+      else
+        if last < #text_codes then
+          output[#output] = pandoc.Str(utf8.char(table.unpack(text_codes, 1, last)))
+        end
+        return first_space
+      end
+    else
+      return first_space
+    end
+  end
+  return first_space
+end
+
+-- remove whitespace from the start of the inlines from index i, return the
+-- index of the next inline and whether the last whitespace removed was a space
+local function strip_after(inlines, i, output)
+  local last_space = false
+  while i <= #inlines do
+    local el = inlines[i]
+    if is_space(el) then
+      last_space = true
+    elseif el.t == "Str" then
+      local text_codes = codes(el.text)
+      local first = 1
+      while first <= #text_codes and SPACE_CODES[text_codes[first]] do
+        last_space = text_codes[first] == 0x20
+        first = first + 1
+      end
+      if first <= #text_codes then
+        table.insert(
+          output, pandoc.Str(utf8.char(table.unpack(text_codes, first, #text_codes)))
+        )
+        return i + 1, last_space
+      end
+    else
+      return i, last_space
+    end
+    i = i + 1
+  end
+  return i, last_space
+end
+
+-- remove Strikeout inlines and the whitespace next to them, leaving a space
+-- if both the whitespace before and after it are a space
+local function remove_strikeout(inlines)
+  local output = pandoc.List:new()
+  local i = 1
+  while i <= #inlines do
+    local el = inlines[i]
+    if el.t == "Strikeout" then
+      local space_before = strip_before(output)
+      local after = pandoc.List:new()
+      local space_after
+      i, space_after = strip_after(inlines, i + 1, after)
+      if space_before and space_after then
+        table.insert(output, pandoc.Space())
+      end
+      output:extend(after)
+    else
+      if CONTAINERS[el.t] then
+        el.content = remove_strikeout(el.content)
+      end
+      table.insert(output, el)
+      i = i + 1
+    end
+  end
+  return output
+end
+
+local function has_element(blocks, element_type)
+  local found = false
+  pandoc.walk_block(pandoc.Div(blocks), {
+    [element_type] = function(el)
+      found = true
+    end,
+  })
+  return found
+end
+
+local paragraphs = {
+  Para = function(el)
+    local content = remove_strikeout(el.content)
+    -- remove a paragraph of whitespace, an empty paragraph is kept
+    if #content > 0 and is_whitespace(content) then
+      return {}
+    end
+    return pandoc.Para(content)
+  end,
+  Plain = function(el)
+    return pandoc.Plain(remove_strikeout(el.content))
+  end,
+  Header = function(el)
+    return pandoc.Para(remove_strikeout(el.content))
+  end,
+}
+
+return {
+  {
+    Pandoc = function(doc)
+      if has_element(doc.blocks, "LineBreak") then
+        return nil
+      end
+      local blocks = pandoc.walk_block(pandoc.Div(doc.blocks), paragraphs).content
+      -- strike through text somewhere else, such as a table caption
+      if has_element(blocks, "Strikeout") then
+        return nil
+      end
+      table.insert(blocks, pandoc.RawBlock("jats", FILTER_MARKER))
+      return pandoc.Pandoc(blocks, doc.meta)
+    end,
+  },
+}
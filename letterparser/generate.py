@@ -1,5 +1,7 @@
 # coding=utf-8
 
+import asyncio
+import io
 import os
 import re
 from collections import OrderedDict
@@ -40,40 +42,172 @@ def generate_xml_from_file(
     )
 
 
+async def generate_xml_from_file_async(
+    file_name, root_tag="root", pretty=False, indent="", config=None, temp_dir="tmp"
+):
+    """generate_xml_from_file without blocking the event loop while pandoc runs"""
+    if not re.match(r".*\.[Zz][Ii][Pp]$", file_name):
+        records = await docx_to_records_async(file_name, root_tag, config, temp_dir)
+        jats_xml = generate(records, root_tag, temp_dir, [])
+        return output_xml(jats_xml, pretty, indent)
+    loop = asyncio.get_running_loop()
+    with zip_lib.ZipManifest(file_name) as manifest:
+        with parse.conversion_workspace(temp_dir, config) as work_dir:
+            docx_file_name = await loop.run_in_executor(
+                None, manifest.extract_docx, work_dir
+            )
+            # the docx is converted in its own workspace in the temp_dir
+            records = await docx_to_records_async(
+                docx_file_name, root_tag, config, temp_dir
+            )
+    jats_xml = generate(records, root_tag, work_dir, manifest.asset_file_names)
+    return output_xml(jats_xml, pretty, indent)
+
+
 def generate_xml_from_zip(
     file_name, root_tag="root", pretty=False, indent="", config=None, temp_dir="tmp"
 ):
-    """generate JATS output from zip file"""
-    docx_file_name, asset_file_names = zip_lib.unzip_zip(file_name, temp_dir)
-    return generate_xml_from_docx(
-        docx_file_name,
-        root_tag=root_tag,
-        pretty=pretty,
-        indent=indent,
-        config=config,
-        temp_dir=temp_dir,
+    """generate JATS output from zip file, unzipped into a workspace in the temp_dir"""
+    with zip_lib.ZipManifest(file_name) as manifest:
+        with parse.conversion_workspace(temp_dir, config) as work_dir:
+            # only the docx is extracted, the asset file names are enough to rename them
+            docx_file_name = manifest.extract_docx(work_dir)
+            # the docx is converted in its own workspace in the temp_dir
+            records = docx_to_records(docx_file_name, root_tag, config, temp_dir)
+    # only the assets of this zip file are renamed
+    jats_xml = generate(records, root_tag, work_dir, manifest.asset_file_names)
+    return output_xml(jats_xml, pretty, indent)
+
+
+def generate_xml_from_bytes(
+    data,
+    file_name=None,
+    root_tag="root",
+    pretty=False,
+    indent="",
+    config=None,
+    temp_dir=None,
+):
+    """
+    generate JATS output from the bytes, or a file object, of a zip or docx file,
+    files are written to the temp_dir only if it is specified, to materialise assets
+    """
+    if hasattr(data, "read"):
+        data = data.read()
+    if zip_lib.is_docx(io.BytesIO(data)):
+        docx_file_name, docx_bytes, asset_file_names = file_name, data, []
+    else:
+        docx_file_name, docx_bytes, asset_file_names = zip_lib.unzip_bytes(
+            data, temp_dir
+        )
+    records = docx_to_records(
+        docx_file_name, root_tag, config, temp_dir, docx_bytes=docx_bytes
     )
+    jats_xml = generate(records, root_tag, temp_dir, asset_file_names)
+    return output_xml(jats_xml, pretty, indent)
+
+
+def generate_package_from_zip(
+    file_name,
+    output_file,
+    root_tag="root",
+    pretty=False,
+    indent="",
+    config=None,
+    xml_file_name=None,
+):
+    """
+    write a zip to output_file containing the JATS output from the zip file and its
+    asset files, named as they are referenced in the XML by the config file name
+    patterns, the docx is converted from memory and the assets are copied as they
+    are compressed in the zip file
+    """
+    with zip_lib.ZipManifest(file_name) as manifest:
+        records = docx_to_records(
+            manifest.docx_file_name,
+            root_tag,
+            config,
+            None,
+            docx_bytes=manifest.read_docx(),
+        )
+        root = generate(records, root_tag, None, manifest.asset_file_names)
+        if not xml_file_name:
+            xml_file_name = "%s.xml" % manifest.docx_file_name.rsplit(".", 1)[0]
+        zip_lib.write_package(
+            output_file,
+            xml_file_name,
+            output_xml(root, pretty, indent),
+            manifest,
+            package_file_name_map(root, manifest.asset_file_names),
+        )
+    return xml_file_name
 
 
 def generate_xml_from_docx(
     file_name, root_tag="root", pretty=False, indent="", config=None, temp_dir="tmp"
 ):
     """generate JATS output from docx file_name"""
-    articles = docx_to_articles(file_name, root_tag, config, temp_dir)
-    jats_xml = generate(articles, root_tag, temp_dir)
+    records = docx_to_records(file_name, root_tag, config, temp_dir)
+    jats_xml = generate(records, root_tag, temp_dir, [])
     return output_xml(jats_xml, pretty, indent)
 
 
-def docx_to_articles(file_name, root_tag="root", config=None, temp_dir="tmp"):
-    """convert the docx file to Article objects"""
+def docx_to_articles(
+    file_name, root_tag="root", config=None, temp_dir="tmp", docx_bytes=None
+):
+    """convert the docx file, or the docx_bytes if specified, to Article objects"""
+    records = docx_to_records(file_name, root_tag, config, temp_dir, docx_bytes)
+    return [build.record_article(record) for record in records]
+
+
+def docx_to_records(
+    file_name, root_tag="root", config=None, temp_dir="tmp", docx_bytes=None
+):
+    """convert the docx file, or the docx_bytes if specified, to article records"""
+    if config and config.get("pandoc_ast"):
+        sections = parse.ast_sections(
+            file_name, config=config, temp_dir=temp_dir, docx_bytes=docx_bytes
+        )
+        if sections is not None:
+            return build.build_records_from_sections(
+                sections, file_name=file_name, config=config
+            )
     jats_content = parse.best_jats(
-        file_name, root_tag, config=config, temp_dir=temp_dir
+        file_name, root_tag, config=config, temp_dir=temp_dir, docx_bytes=docx_bytes
+    )
+    return build.build_records(jats_content, file_name=file_name, config=config)
+
+
+async def docx_to_articles_async(
+    file_name, root_tag="root", config=None, temp_dir="tmp", docx_bytes=None
+):
+    """docx_to_articles without blocking the event loop while pandoc runs"""
+    records = await docx_to_records_async(
+        file_name, root_tag, config, temp_dir, docx_bytes
+    )
+    return [build.record_article(record) for record in records]
+
+
+async def docx_to_records_async(
+    file_name, root_tag="root", config=None, temp_dir="tmp", docx_bytes=None
+):
+    """docx_to_records without blocking the event loop while pandoc runs"""
+    if config and config.get("pandoc_ast"):
+        sections = await parse.ast_sections_async(
+            file_name, config=config, temp_dir=temp_dir, docx_bytes=docx_bytes
+        )
+        if sections is not None:
+            return build.build_records_from_sections(
+                sections, file_name=file_name, config=config
+            )
+    jats_content = await parse.best_jats_async(
+        file_name, root_tag, config=config, temp_dir=temp_dir, docx_bytes=docx_bytes
     )
-    return build.build_articles(jats_content, file_name=file_name, config=config)
+    return build.build_records(jats_content, file_name=file_name, config=config)
 
 
-def generate(articles, root_tag="root", temp_dir="tmp"):
-    """from jats_content generate final JATS output"""
+def generate(articles, root_tag="root", temp_dir="tmp", asset_file_names=None):
+    """from Article objects, or article records, generate final JATS output"""
     # Create the root XML node
     root = Element(root_tag)
     # set namespaces
@@ -85,7 +219,7 @@ def generate(articles, root_tag="root", temp_dir="tmp"):
         set_if_value(sub_article_tag, "article-type", article.article_type)
         set_if_value(sub_article_tag, "id", article.id)
         set_front_stub(sub_article_tag, article)
-        jats_build.set_body(sub_article_tag, article)
+        set_body(sub_article_tag, article)
         # set tag id attributes per sub-article
         set_id_attributes(sub_article_tag, "mml:math", article.id)
         set_id_attributes(sub_article_tag, "disp-formula", article.id)
@@ -95,19 +229,84 @@ def generate(articles, root_tag="root", temp_dir="tmp"):
         # highlight mentions of fig, media, table with an xref tag
         asset_xref_tags(sub_article_tag)
         # rename asset files in the XML
-        rename_assets(root, temp_dir)
+        rename_assets(root, temp_dir, asset_file_names)
     return root
 
 
-def rename_assets(root, temp_dir="tmp"):
+def set_body(parent, article):
+    """set body tag"""
+    body_tag = SubElement(parent, "body")
+    if hasattr(article, "content_blocks") and article.content_blocks:
+        set_content_blocks(body_tag, article.content_blocks)
+    return body_tag
+
+
+def set_content_blocks(parent, content_blocks):
+    """
+    append a copy of the Element of content blocks which have one, other content
+    blocks are parsed from their content string by jatsgenerator
+    """
+    for block in content_blocks:
+        block_tag = content_block_tag(block)
+        if block_tag is not None:
+            parent.append(block_tag)
+        else:
+            jats_build.set_content_blocks(parent, [block])
+
+
+def content_block_tag(block):
+    """
+    tag for the content block copied from its Element, the same as jatsgenerator
+    parses from the content string, or None if the content string is needed
+    """
+    element = getattr(block, "element", None)
+    if element is None or block.content_blocks:
+        return None
+    # the tail is part of the content string unless it is a final new line
+    if element.tail not in [None, "", "\n"]:
+        return None
+    text = element.text or ""
+    children = []
+    for child_tag in element:
+        child_copy = build.element_copy(child_tag)
+        if child_copy is None:
+            return None
+        children.append(child_copy)
+    # content strings are stripped of whitespace
+    if children:
+        text = text.lstrip()
+        children[-1].tail = (children[-1].tail or "").rstrip() or None
+    else:
+        text = text.strip()
+    block_tag = Element(block.block_type)
+    if not text and not children:
+        # empty tags keep their attributes unescaped
+        for key, value in block.attr.items():
+            block_tag.set(key, value)
+        return block_tag
+    for key, value in sorted(block.attr.items()):
+        if key.startswith("{") or build.UNSAFE_ATTRIBUTE_MATCH_PATTERN.search(value):
+            return None
+        block_tag.set(key, value)
+    if "\r" in text:
+        return None
+    block_tag.text = text or None
+    block_tag.extend(children)
+    return block_tag
+
+
+def rename_assets(root, temp_dir="tmp", file_names=None):
     """rename xlink:link values if matches the file names in the temp_dir"""
-    # profile the image file names in the tmp folder
-    file_names = sorted(os.listdir(temp_dir))
+    # profile the image file names in the tmp folder, unless they are specified
+    if file_names is None:
+        file_names = os.listdir(temp_dir)
+    file_names = sorted(file_names)
     file_name_map = OrderedDict()
     for file_name in file_names:
-        file_name_name = utils.get_file_name_file(file_name).split(".")[0]
+        file_name_file = utils.get_file_name_file(file_name)
+        file_name_name = file_name_file.split(".")[0]
         if file_name_name:
-            file_name_map[file_name_name] = file_name
+            file_name_map[file_name_name] = file_name_file
     # search for tags and rewrite the xlink:href values
     xpath_list = [".//graphic", ".//media"]
     for xpath in xpath_list:
@@ -117,6 +316,23 @@ def rename_assets(root, temp_dir="tmp"):
                 tag.set("xlink:href", file_name_map.get(href))
 
 
+def package_file_name_map(root, file_names):
+    """map the file names to the name referenced in graphic or media tags, if any"""
+    href_map = {}
+    for xpath in [".//graphic", ".//media"]:
+        for tag in root.findall(xpath):
+            href = tag.get("xlink:href")
+            if href:
+                href_map[href.split(".")[0]] = href
+    file_name_map = OrderedDict()
+    for file_name in file_names:
+        file_name_file = utils.get_file_name_file(file_name)
+        href = href_map.get(file_name_file.split(".")[0])
+        if href and href != file_name:
+            file_name_map[file_name] = href
+    return file_name_map
+
+
 def id_prefix(tag_name):
     """return the id attribute prefix for the tag name"""
     id_prefix_map = {
@@ -173,6 +389,8 @@ def asset_xref_tags(root):
     which requires to know the p tag parent and index of the p tag inside that parent
     """
     asset_labels = labels(root)
+    if not asset_labels:
+        return
     # strip full stop at end of label if present
     for label in asset_labels:
         if label.get("text"):
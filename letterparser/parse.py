@@ -1,13 +1,71 @@
+import asyncio
+import io
+import os
+import weakref
 import re
+import subprocess
+import threading
 from collections import OrderedDict
+import docker
 import pypandoc
 import requests
-from letterparser import docker_lib, utils, zip_lib
+from letterparser import (
+    ast_lib,
+    backend_lib,
+    cache_lib,
+    docker_lib,
+    docx_lib,
+    record_lib,
+    server_lib,
+    utils,
+    zip_lib,
+)
 from letterparser.conf import raw_config, parse_raw_config
 
 
 DEFAULT_DOCKER_IMAGE = "pandoc/core:2.9.1.1"
 
+# Lua filter which does the JATS post-processing inside pandoc
+LUA_FILTER = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "filters", "normalise.lua"
+)
+
+# added to the pandoc output by the Lua filter
+LUA_FILTER_MARKER = "<!-- letterparser-filter -->"
+
+
+# tags changed by removing strike tags and empty paragraphs and converting sec tags
+JATS_TAG_PATTERN = re.compile(
+    r"(?P<strike>\s*<strike>.*?</strike>\s*)"
+    r"|(?P<sec_title><sec[^>\n]*><title[^>\n]*>)"
+    r"|(?P<sec_open><sec[^>\n]*>)"
+    r"|(?P<sec_close></sec>)"
+    r"|(?P<title_close></title>)"
+    r"|(?P<p_open><p[^>]*>)"
+    r"|(?P<p_close></p>)"
+)
+
+
+# break tags which divide paragraphs
+BREAK_SECTION_MATCH = "<break /><break />"
+
+# tags followed when converting break tags, hanging tags may be open across paragraphs
+BREAK_TAG_PATTERN = re.compile(
+    r"(?P<break><break /><break />)"
+    r"|(?P<cell_open><t[dh][\s>])"
+    r"|(?P<cell_close></t[dh]>)"
+    r"|(?P<hanging_tag></?(?:italic|bold)>)"
+)
+
+# a paragraph is not closed after content ending with these tags
+BREAK_SECTION_CLOSE_TAGS = (
+    "</p>",
+    "</table>",
+    "</table-wrap>",
+    "</disp-quote>",
+    "</list>",
+)
+
 
 SECTION_MAP = {
     "editors_evaluation": "<p><bold>Editors evaluation</bold></p>",
@@ -17,6 +75,37 @@ SECTION_MAP = {
     "author_response": "<p><bold>Author response</bold></p>",
 }
 
+# config values which determine the backends used to call pandoc
+BACKEND_CONFIG_KEYS = [
+    "pandoc_server_url",
+    "pandoc_server_timeout",
+    "docker_image",
+    "docker_pool_size",
+    "backend_failure_threshold",
+    "backend_reset_timeout",
+    "pandoc_lua_filter",
+]
+
+# backend registries keyed by their config values, populated once per process
+BACKEND_REGISTRIES = {}
+BACKEND_REGISTRIES_LOCK = threading.Lock()
+
+# config values which determine the conversion cache
+CACHE_CONFIG_KEYS = ["cache_memory_size", "cache_dir", "cache_disk_size"]
+
+# config values which change the conversion output, part of the cache key
+CACHE_KEY_CONFIG_KEYS = ["docx_reader", "docker_image", "pandoc_lua_filter"]
+
+# conversion caches keyed by their config values, populated once per process
+CONVERSION_CACHES = {}
+CONVERSION_CACHES_LOCK = threading.Lock()
+
+# conversions in flight at once on an event loop, unless it is in the config
+ASYNC_CONCURRENCY = 4
+
+# semaphores for each running event loop keyed by their concurrency
+ASYNC_SEMAPHORES = weakref.WeakKeyDictionary()
+
 
 def ensure_config(config):
     """populate a default config if it is not specified"""
@@ -25,67 +114,731 @@ def ensure_config(config):
     return config
 
 
-def pandoc_output(file_name):
+def config_lua_filter(config, output_format="jats"):
+    """path of the Lua filter if it is enabled in the config"""
+    if config and config.get("pandoc_lua_filter") and output_format == "jats":
+        return LUA_FILTER
+    return None
+
+
+def pandoc_extra_args(lua_filter=None):
+    extra_args = ["--wrap=none"]
+    if lua_filter:
+        extra_args.append("--lua-filter=%s" % lua_filter)
+    return extra_args
+
+
+def pandoc_command(output_format="jats", extra_args=None, file_name=None):
+    """local pandoc command, it reads the docx from stdin if there is no file_name"""
+    command = [pypandoc.get_pandoc_path(), "--from=docx", "--to=%s" % output_format]
+    if extra_args:
+        command += extra_args
+    if file_name:
+        command.append(file_name)
+    return command
+
+
+def pandoc_process_output(returncode, stdout, stderr):
+    if returncode != 0:
+        raise RuntimeError(
+            'Pandoc died with exitcode "%s" during conversion: %s'
+            % (returncode, stderr.decode("utf8"))
+        )
+    return stdout.decode("utf8")
+
+
+def pandoc_stdin_output(docx_bytes, output_format="jats", extra_args=None):
+    """convert docx bytes by piping them to the local pandoc on stdin"""
+    process = subprocess.run(
+        pandoc_command(output_format, extra_args),
+        input=docx_bytes,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=False,
+    )
+    return pandoc_process_output(process.returncode, process.stdout, process.stderr)
+
+
+async def pandoc_output_async(file_name, output_format="jats", lua_filter=None):
+    """pandoc_output in a subprocess which does not block the event loop"""
+    docx_bytes = None
+    if isinstance(file_name, bytes):
+        docx_bytes, file_name = file_name, None
     try:
-        return pypandoc.convert_file(file_name, to="jats", extra_args=["--wrap=none"])
+        process = await asyncio.create_subprocess_exec(
+            *pandoc_command(output_format, pandoc_extra_args(lua_filter), file_name),
+            stdin=asyncio.subprocess.PIPE if docx_bytes is not None else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+    except OSError:
+        # todo!! log exception pandoc is probably not installed locally
+        return None
+    stdout, stderr = await process.communicate(docx_bytes)
+    return pandoc_process_output(process.returncode, stdout, stderr)
+
+
+def pandoc_output(file_name, output_format="jats", lua_filter=None):
+    """convert using the local pandoc, file_name may also be the docx bytes"""
+    extra_args = pandoc_extra_args(lua_filter)
+    try:
+        if isinstance(file_name, bytes):
+            return pandoc_stdin_output(file_name, output_format, extra_args)
+        return pypandoc.convert_file(file_name, to=output_format, extra_args=extra_args)
     except OSError:
         # todo!! log exception pandoc is probably not installed locally
         pass
     return None
 
 
-def docker_pandoc_output(file_name, config):
+def config_docker_image(config):
     docker_image = None
     if config:
         docker_image = config.get("docker_image")
     if not docker_image:
         # todo !! log that default docker image was used
         docker_image = DEFAULT_DOCKER_IMAGE
+    return docker_image
+
+
+def docker_pandoc_output(file_name, config, output_format="jats", temp_dir=None):
+    """
+    convert using docker, a pool of containers mounts the temp_dir the file's
+    workspace was created in, so the pool is shared by conversions in it
+    """
+    pool_size = None
+    if config:
+        pool_size = config.get("docker_pool_size")
+    lua_filter = config_lua_filter(config, output_format)
     try:
-        return docker_lib.call_pandoc(file_name, docker_image)
-    except requests.exceptions.ConnectionError:
+        if isinstance(file_name, bytes):
+            return docker_lib.call_pandoc_bytes(
+                file_name,
+                config_docker_image(config),
+                output_format=output_format,
+                pool_size=pool_size,
+                lua_filter=lua_filter,
+            )
+        return docker_lib.call_pandoc(
+            file_name,
+            config_docker_image(config),
+            output_format=output_format,
+            pool_size=pool_size,
+            work_dir=temp_dir,
+            lua_filter=lua_filter,
+        )
+    except (docker.errors.DockerException, requests.exceptions.ConnectionError):
         # todo !! log exception - docker may not be running
         pass
     return None
 
 
-def parse_file(file_name, config=None, temp_dir="tmp"):
-    """issue the call to pandoc locally or via docker"""
-    # make a copy of the file and fix complex scripts styles inside the docx
-    new_file_name = zip_lib.fix_complex_scripts_styles(file_name, temp_dir)
-    output = pandoc_output(new_file_name)
-    if not output:
-        output = docker_pandoc_output(new_file_name, config)
+async def docker_pandoc_output_async(
+    file_name, config, output_format="jats", temp_dir=None
+):
+    """docker_pandoc_output without blocking the event loop"""
+    pool_size = None
+    if config:
+        pool_size = config.get("docker_pool_size")
+    lua_filter = config_lua_filter(config, output_format)
+    try:
+        if isinstance(file_name, bytes):
+            return await docker_lib.call_pandoc_bytes_async(
+                file_name,
+                config_docker_image(config),
+                output_format=output_format,
+                pool_size=pool_size,
+                lua_filter=lua_filter,
+            )
+        return await docker_lib.call_pandoc_async(
+            file_name,
+            config_docker_image(config),
+            output_format=output_format,
+            pool_size=pool_size,
+            work_dir=temp_dir,
+            lua_filter=lua_filter,
+        )
+    except (docker.errors.DockerException, requests.exceptions.ConnectionError):
+        # todo !! log exception - docker may not be running
+        pass
+    return None
+
+
+def server_pandoc_output(file_name, config, output_format="jats"):
+    server_url = None
+    if config:
+        server_url = config.get("pandoc_server_url")
+    if not server_url:
+        return None
+    call_pandoc = server_lib.call_pandoc
+    if isinstance(file_name, bytes):
+        call_pandoc = server_lib.call_pandoc_bytes
+    try:
+        return call_pandoc(
+            file_name,
+            server_url,
+            output_format=output_format,
+            timeout=config.get("pandoc_server_timeout"),
+        )
+    except requests.exceptions.RequestException:
+        # todo !! log exception - pandoc server may not be running or timed out
+        pass
+    return None
+
+
+def pandoc_version():
+    """version of the local pandoc, None if it is not installed"""
+    try:
+        return pypandoc.get_pandoc_version()
+    except OSError:
+        return None
+
+
+def docker_pandoc_version(config):
+    """version of pandoc in the docker image, None if docker is not available"""
+    try:
+        return docker_lib.pandoc_version(config_docker_image(config))
+    except (docker.errors.DockerException, requests.exceptions.ConnectionError):
+        return None
+
+
+def server_pandoc_version(config):
+    """version of the pandoc server, None if it is not running"""
+    try:
+        return server_lib.pandoc_version(
+            config.get("pandoc_server_url"),
+            timeout=config.get("pandoc_server_timeout"),
+        )
+    except requests.exceptions.RequestException:
+        return None
+
+
+def circuit_breaker(config):
+    """circuit breaker for a backend using config values if specified"""
+    breaker = backend_lib.CircuitBreaker()
+    if config and config.get("backend_failure_threshold"):
+        breaker.failure_threshold = config.get("backend_failure_threshold")
+    if config and config.get("backend_reset_timeout"):
+        breaker.reset_timeout = config.get("backend_reset_timeout")
+    return breaker
+
+
+def create_backend_registry(config=None):
+    """register the backends in the order they are tried"""
+    registry = backend_lib.BackendRegistry()
+    if config and config.get("pandoc_server_url"):
+        registry.register(
+            backend_lib.Backend(
+                "server",
+                lambda file_name, output_format, temp_dir: server_pandoc_output(
+                    file_name, config, output_format
+                ),
+                lambda: server_pandoc_version(config),
+                circuit_breaker(config),
+            )
+        )
+    registry.register(
+        backend_lib.Backend(
+            "local",
+            lambda file_name, output_format, temp_dir: pandoc_output(
+                file_name, output_format, config_lua_filter(config, output_format)
+            ),
+            lambda: pandoc_version(),
+            circuit_breaker(config),
+            lambda file_name, output_format, temp_dir: pandoc_output_async(
+                file_name, output_format, config_lua_filter(config, output_format)
+            ),
+        )
+    )
+    registry.register(
+        backend_lib.Backend(
+            "docker",
+            lambda file_name, output_format, temp_dir: docker_pandoc_output(
+                file_name, config, output_format, temp_dir
+            ),
+            lambda: docker_pandoc_version(config),
+            circuit_breaker(config),
+            lambda file_name, output_format, temp_dir: docker_pandoc_output_async(
+                file_name, config, output_format, temp_dir
+            ),
+        )
+    )
+    return registry
+
+
+def backend_registry(config=None):
+    """get the backend registry for the config, only created once per process"""
+    key = tuple(config.get(name) if config else None for name in BACKEND_CONFIG_KEYS)
+    with BACKEND_REGISTRIES_LOCK:
+        if key not in BACKEND_REGISTRIES:
+            BACKEND_REGISTRIES[key] = create_backend_registry(config)
+        return BACKEND_REGISTRIES[key]
+
+
+def reset_backend_registries():
+    """forget the backends so they are probed again"""
+    with BACKEND_REGISTRIES_LOCK:
+        BACKEND_REGISTRIES.clear()
+
+
+def cache_config_key(config):
+    return tuple(config.get(name) if config else None for name in CACHE_CONFIG_KEYS)
+
+
+def conversion_cache(config=None):
+    """get the conversion cache for the config, None if caching is not configured"""
+    key = cache_config_key(config)
+    with CONVERSION_CACHES_LOCK:
+        if key not in CONVERSION_CACHES:
+            if not config or not (
+                config.get("cache_memory_size") or config.get("cache_dir")
+            ):
+                return None
+            CONVERSION_CACHES[key] = cache_lib.create_cache(
+                config.get("cache_memory_size"),
+                config.get("cache_dir"),
+                config.get("cache_disk_size"),
+            )
+        return CONVERSION_CACHES[key]
+
+
+def set_conversion_cache(cache, config=None):
+    """use the cache, or any object with get and set methods, for the config"""
+    with CONVERSION_CACHES_LOCK:
+        CONVERSION_CACHES[cache_config_key(config)] = cache
+
+
+def reset_conversion_caches():
+    with CONVERSION_CACHES_LOCK:
+        CONVERSION_CACHES.clear()
+
+
+def converter_version(config=None):
+    """name and pandoc version of the backend a conversion will be tried with"""
+    backend = backend_registry(config).first_available()
+    if backend:
+        return "%s %s" % (backend.name, backend.version)
+    return None
+
+
+def conversion_digest(docx, config=None):
+    """digest of the docx for the conversion cache key, None if there is no cache"""
+    if conversion_cache(config) is None:
+        return None
+    return zip_lib.docx_digest(docx)
+
+
+def conversion_cache_key(digest, config=None, *parts):
+    """key of the docx digest, the converter and the config"""
+    return cache_lib.cache_key(
+        digest,
+        converter_version(config),
+        [config.get(name) if config else None for name in CACHE_KEY_CONFIG_KEYS],
+        *parts
+    )
+
+
+def cached_conversion(docx, config, parts, convert_function, digest=None):
+    """
+    the cached output for the docx, otherwise convert it and cache the output,
+    the digest of the docx is computed unless it is specified
+    """
+    cache = conversion_cache(config)
+    if cache is None:
+        return convert_function()
+    if digest is None:
+        digest = zip_lib.docx_digest(docx)
+    key = conversion_cache_key(digest, config, *parts)
+    output = cache.get(key)
+    if output is None:
+        output = convert_function()
+        if output:
+            cache.set(key, output)
     return output
 
 
-def raw_jats(file_name, root_tag="root", config=None, temp_dir="tmp"):
+async def cached_conversion_async(docx, config, parts, convert_function, digest=None):
+    """cached_conversion awaiting the convert coroutine function"""
+    cache = conversion_cache(config)
+    if cache is None:
+        return await convert_function()
+    if digest is None:
+        loop = asyncio.get_running_loop()
+        digest = await loop.run_in_executor(None, zip_lib.docx_digest, docx)
+    key = conversion_cache_key(digest, config, *parts)
+    output = cache.get(key)
+    if output is None:
+        output = await convert_function()
+        if output:
+            cache.set(key, output)
+    return output
+
+
+def conversion_semaphore(config=None):
+    """semaphore limiting the conversions in flight on the running event loop"""
+    concurrency = None
+    if config:
+        concurrency = config.get("async_concurrency")
+    if not concurrency:
+        concurrency = ASYNC_CONCURRENCY
+    semaphores = ASYNC_SEMAPHORES.setdefault(asyncio.get_running_loop(), {})
+    if concurrency not in semaphores:
+        semaphores[concurrency] = asyncio.Semaphore(concurrency)
+    return semaphores[concurrency]
+
+
+def use_native_reader(file_name, config=None):
+    """check the native reader is configured and supports the docx file"""
+    if not config or config.get("docx_reader") != "native":
+        return False
+    return docx_lib.native_supported(file_name)
+
+
+def parse_file(
+    file_name, config=None, temp_dir="tmp", output_format="jats", digest=None
+):
+    """issue the call to pandoc using the first available backend, or use the cache"""
+    return cached_conversion(
+        file_name,
+        config,
+        ["parse", output_format],
+        lambda: convert_file(file_name, config, temp_dir, output_format),
+        digest,
+    )
+
+
+def conversion_workspace(temp_dir="tmp", config=None):
+    """a directory for one conversion, removed on exit, in RAM if configured"""
+    return utils.workspace(temp_dir, bool(config and config.get("workspace_ram")))
+
+
+def native_output(docx, config=None, output_format="jats"):
+    """JATS from the native reader, None if it is not used for the docx"""
+    if output_format == "jats" and use_native_reader(docx, config):
+        return docx_lib.docx_to_jats(docx)
+    return None
+
+
+def convert_file(file_name, config=None, temp_dir="tmp", output_format="jats"):
+    with conversion_workspace(temp_dir, config) as work_dir:
+        # make a copy of the file and fix complex scripts styles inside the docx
+        new_file_name = zip_lib.fix_complex_scripts_styles(file_name, work_dir)
+        output = native_output(new_file_name, config, output_format)
+        if output is not None:
+            return output
+        return backend_registry(config).convert(
+            new_file_name, output_format, os.path.dirname(work_dir)
+        )
+
+
+async def parse_file_async(
+    file_name, config=None, temp_dir="tmp", output_format="jats", digest=None
+):
+    """parse_file without blocking the event loop"""
+    return await cached_conversion_async(
+        file_name,
+        config,
+        ["parse", output_format],
+        lambda: convert_file_async(file_name, config, temp_dir, output_format),
+        digest,
+    )
+
+
+async def convert_file_async(
+    file_name, config=None, temp_dir="tmp", output_format="jats"
+):
+    loop = asyncio.get_running_loop()
+    with conversion_workspace(temp_dir, config) as work_dir:
+        new_file_name = await loop.run_in_executor(
+            None, zip_lib.fix_complex_scripts_styles, file_name, work_dir
+        )
+        output = await loop.run_in_executor(
+            None, native_output, new_file_name, config, output_format
+        )
+        if output is not None:
+            return output
+        return await backend_registry(config).convert_async(
+            new_file_name, output_format, os.path.dirname(work_dir)
+        )
+
+
+def parse_bytes(docx_bytes, config=None, output_format="jats", digest=None):
+    """issue the call to pandoc with the docx bytes, kept in memory where possible"""
+    return cached_conversion(
+        io.BytesIO(docx_bytes),
+        config,
+        ["parse", output_format],
+        lambda: convert_bytes(docx_bytes, config, output_format),
+        digest,
+    )
+
+
+def convert_bytes(docx_bytes, config=None, output_format="jats"):
+    new_docx_bytes = zip_lib.fix_complex_scripts_styles_bytes(docx_bytes)
+    output = native_output(io.BytesIO(new_docx_bytes), config, output_format)
+    if output is not None:
+        return output
+    return backend_registry(config).convert(new_docx_bytes, output_format)
+
+
+async def parse_bytes_async(docx_bytes, config=None, output_format="jats", digest=None):
+    """parse_bytes without blocking the event loop"""
+    return await cached_conversion_async(
+        io.BytesIO(docx_bytes),
+        config,
+        ["parse", output_format],
+        lambda: convert_bytes_async(docx_bytes, config, output_format),
+        digest,
+    )
+
+
+async def convert_bytes_async(docx_bytes, config=None, output_format="jats"):
+    loop = asyncio.get_running_loop()
+    new_docx_bytes = await loop.run_in_executor(
+        None, zip_lib.fix_complex_scripts_styles_bytes, docx_bytes
+    )
+    output = await loop.run_in_executor(
+        None, native_output, io.BytesIO(new_docx_bytes), config, output_format
+    )
+    if output is not None:
+        return output
+    return await backend_registry(config).convert_async(new_docx_bytes, output_format)
+
+
+def parse_docx(
+    file_name,
+    config=None,
+    temp_dir="tmp",
+    output_format="jats",
+    docx_bytes=None,
+    digest=None,
+):
+    """parse the docx bytes if specified, otherwise parse the file"""
+    if docx_bytes is not None:
+        return parse_bytes(
+            docx_bytes, config=config, output_format=output_format, digest=digest
+        )
+    return parse_file(
+        file_name,
+        config=config,
+        temp_dir=temp_dir,
+        output_format=output_format,
+        digest=digest,
+    )
+
+
+async def parse_docx_async(
+    file_name,
+    config=None,
+    temp_dir="tmp",
+    output_format="jats",
+    docx_bytes=None,
+    digest=None,
+):
+    """parse_docx waiting for the semaphore which limits conversions in flight"""
+    async with conversion_semaphore(config):
+        if docx_bytes is not None:
+            return await parse_bytes_async(
+                docx_bytes, config=config, output_format=output_format, digest=digest
+            )
+        return await parse_file_async(
+            file_name,
+            config=config,
+            temp_dir=temp_dir,
+            output_format=output_format,
+            digest=digest,
+        )
+
+
+def pandoc_ast(file_name, config=None, temp_dir="tmp", docx_bytes=None):
+    """pandoc JSON AST of the file"""
+    config = ensure_config(config)
+    output = parse_docx(
+        file_name,
+        config=config,
+        temp_dir=temp_dir,
+        output_format="json",
+        docx_bytes=docx_bytes,
+    )
+    return ast_lib.load(output) if output else None
+
+
+async def pandoc_ast_async(file_name, config=None, temp_dir="tmp", docx_bytes=None):
+    """pandoc_ast without blocking the event loop"""
+    config = ensure_config(config)
+    output = await parse_docx_async(
+        file_name,
+        config=config,
+        temp_dir=temp_dir,
+        output_format="json",
+        docx_bytes=docx_bytes,
+    )
+    return ast_lib.load(output) if output else None
+
+
+def ast_sections(
+    file_name, config=None, temp_dir="tmp", section_map=None, docx_bytes=None
+):
+    """sections from walking the pandoc AST, None if the AST cannot be used"""
+    ast = pandoc_ast(file_name, config=config, temp_dir=temp_dir, docx_bytes=docx_bytes)
+    if not ast or not ast_lib.is_supported(ast):
+        # todo !! log that math or other content requires the JATS output
+        return None
+    return ast_lib.sections(ast, section_map if section_map else SECTION_MAP)
+
+
+async def ast_sections_async(
+    file_name, config=None, temp_dir="tmp", section_map=None, docx_bytes=None
+):
+    """ast_sections without blocking the event loop"""
+    ast = await pandoc_ast_async(
+        file_name, config=config, temp_dir=temp_dir, docx_bytes=docx_bytes
+    )
+    if not ast or not ast_lib.is_supported(ast):
+        return None
+    return ast_lib.sections(ast, section_map if section_map else SECTION_MAP)
+
+
+def raw_jats(
+    file_name,
+    root_tag="root",
+    config=None,
+    temp_dir="tmp",
+    docx_bytes=None,
+    digest=None,
+):
     "convert file content to JATS"
     config = ensure_config(config)
-    output = parse_file(file_name, config=config, temp_dir=temp_dir)
+    output = parse_docx(
+        file_name,
+        config=config,
+        temp_dir=temp_dir,
+        docx_bytes=docx_bytes,
+        digest=digest,
+    )
     return "<%s>%s</%s>" % (root_tag, output, root_tag)
 
 
-def clean_jats(file_name, root_tag="root", config=None, temp_dir="tmp"):
+async def raw_jats_async(
+    file_name,
+    root_tag="root",
+    config=None,
+    temp_dir="tmp",
+    docx_bytes=None,
+    digest=None,
+):
+    """raw_jats without blocking the event loop"""
+    config = ensure_config(config)
+    output = await parse_docx_async(
+        file_name,
+        config=config,
+        temp_dir=temp_dir,
+        docx_bytes=docx_bytes,
+        digest=digest,
+    )
+    return "<%s>%s</%s>" % (root_tag, output, root_tag)
+
+
+def clean_jats(
+    file_name, root_tag="root", config=None, temp_dir="tmp", docx_bytes=None
+):
     """cleaner rough JATS output from the raw_jats"""
     config = ensure_config(config)
     jats_content = ""
-    raw_jats_content = raw_jats(file_name, root_tag, config=config, temp_dir=temp_dir)
+    raw_jats_content = raw_jats(
+        file_name, root_tag, config=config, temp_dir=temp_dir, docx_bytes=docx_bytes
+    )
     jats_content = utils.collapse_newlines(raw_jats_content)
     return jats_content
 
 
-def best_jats(file_name, root_tag="root", config=None, temp_dir="tmp"):
+def best_jats(file_name, root_tag="root", config=None, temp_dir="tmp", docx_bytes=None):
     """from file input, produce the best JATS output possible"""
     config = ensure_config(config)
-    clean_jats_content = clean_jats(
-        file_name, root_tag, config=config, temp_dir=temp_dir
-    )
-    clean_jats_content = utils.remove_strike(clean_jats_content)
-    # remove empty paragraphs
-    jats_content = utils.remove_empty_p_tags(clean_jats_content)
-    # convert sec tags
-    jats_content = convert_sec_tags(jats_content)
+    docx = io.BytesIO(docx_bytes) if docx_bytes is not None else file_name
+    # computed once for the best_jats and the pandoc output cache keys
+    digest = conversion_digest(docx, config)
+    return cached_conversion(
+        docx,
+        config,
+        ["best_jats", root_tag],
+        lambda: convert_best_jats(
+            file_name, root_tag, config, temp_dir, docx_bytes, digest
+        ),
+        digest,
+    )
+
+
+def convert_best_jats(
+    file_name,
+    root_tag="root",
+    config=None,
+    temp_dir="tmp",
+    docx_bytes=None,
+    digest=None,
+):
+    raw_jats_content = raw_jats(
+        file_name,
+        root_tag,
+        config=config,
+        temp_dir=temp_dir,
+        docx_bytes=docx_bytes,
+        digest=digest,
+    )
+    return best_jats_content(raw_jats_content, root_tag)
+
+
+async def best_jats_async(
+    file_name, root_tag="root", config=None, temp_dir="tmp", docx_bytes=None
+):
+    """best_jats without blocking the event loop while pandoc runs"""
+    config = ensure_config(config)
+    docx = io.BytesIO(docx_bytes) if docx_bytes is not None else file_name
+    loop = asyncio.get_running_loop()
+    digest = await loop.run_in_executor(None, conversion_digest, docx, config)
+    return await cached_conversion_async(
+        docx,
+        config,
+        ["best_jats", root_tag],
+        lambda: convert_best_jats_async(
+            file_name, root_tag, config, temp_dir, docx_bytes, digest
+        ),
+        digest,
+    )
+
+
+async def convert_best_jats_async(
+    file_name,
+    root_tag="root",
+    config=None,
+    temp_dir="tmp",
+    docx_bytes=None,
+    digest=None,
+):
+    raw_jats_content = await raw_jats_async(
+        file_name,
+        root_tag,
+        config=config,
+        temp_dir=temp_dir,
+        docx_bytes=docx_bytes,
+        digest=digest,
+    )
+    return best_jats_content(raw_jats_content, root_tag)
+
+
+def best_jats_content(raw_jats_content, root_tag="root"):
+    """post-process the raw JATS content"""
+    filtered = LUA_FILTER_MARKER in raw_jats_content
+    if filtered:
+        # the marker is written on a line of its own after the last block
+        raw_jats_content = raw_jats_content.replace(
+            "\n" + LUA_FILTER_MARKER, ""
+        ).replace(LUA_FILTER_MARKER, "")
+    jats_content = utils.collapse_newlines(raw_jats_content)
+    if not filtered:
+        # remove strike tags and empty paragraphs and convert sec tags,
+        # the Lua filter already did this
+        jats_content = convert_jats_tags(jats_content)
     # convert break tags
     jats_content = convert_break_tags(jats_content, root_tag)
     # wrap in root_tag
@@ -95,6 +848,76 @@ def best_jats(file_name, root_tag="root", config=None, temp_dir="tmp"):
     return jats_content
 
 
+def convert_jats_tags(jats_content):
+    """
+    remove strike tags and empty paragraphs and convert sec tags in one pass,
+    as remove_strike, remove_empty_p_tags and convert_sec_tags do in turn
+    """
+    if not jats_content:
+        return ""
+    output = []
+    # index in output of a p tag followed only by whitespace so far
+    empty_p_index = None
+    empty_p_whitespace = False
+    # end of the content from the first sec tag to the last sec close tag on a line
+    sec_end = 0
+    # no more sec close tags before this position
+    sec_close_end = 0
+    position = 0
+    for match in JATS_TAG_PATTERN.finditer(jats_content):
+        text = jats_content[position : match.start()]
+        if text:
+            output.append(text)
+            empty_p_whitespace = text.isspace()
+            if not empty_p_whitespace:
+                empty_p_index = None
+        position = match.end()
+        tag_type = match.lastgroup
+        tag = match.group(0)
+        if tag_type == "strike":
+            # replace with blank string unless flanked by spaces replace with a space char
+            if tag.startswith(" ") and tag.endswith(" "):
+                output.append(" ")
+                empty_p_whitespace = True
+            continue
+        if tag_type == "p_open":
+            output.append(tag)
+            empty_p_index = len(output) - 1
+            empty_p_whitespace = False
+            continue
+        if tag_type == "p_close":
+            if empty_p_index is not None and empty_p_whitespace:
+                del output[empty_p_index:]
+            else:
+                output.append(tag)
+            empty_p_index = None
+            continue
+        empty_p_index = None
+        if (
+            tag_type in ["sec_title", "sec_open"]
+            and match.start() >= sec_end
+            and match.start() >= sec_close_end
+        ):
+            line_end = jats_content.find("\n", position)
+            if line_end < 0:
+                line_end = len(jats_content)
+            last_sec_close = jats_content.rfind("</sec>", position, line_end)
+            if last_sec_close < 0:
+                sec_close_end = line_end
+            else:
+                sec_end = last_sec_close + len("</sec>")
+        if match.start() < sec_end:
+            tag = {
+                "sec_title": "<p>",
+                "sec_open": "",
+                "sec_close": "",
+                "title_close": "</p>",
+            }.get(tag_type, tag)
+        output.append(tag)
+    output.append(jats_content[position:])
+    return "".join(output)
+
+
 def convert_sec_tags(jats_content):
     """remove sec tags and convert title to p tag"""
     match_string = r"(<sec.*?>.*</sec>)"
@@ -114,76 +937,73 @@ def convert_sec_tags(jats_content):
 
 def convert_break_tags(jats_content, root_tag="root"):
     """convert break tags to p tags and remove unwanted break tags"""
-    converted_jats_content = ""
     # simple fix for italic sandwich
     jats_content = jats_content.replace("<break /><italic><break />", "</p><p><italic>")
-
-    # replace break tags in tables first
-    jats_content = re.sub(
-        r"<td(.*?)<break /><break />(.*?)</td>", r"<td\1<break />\2</td>", jats_content
-    )
-    jats_content = re.sub(
-        r"<th(.*?)<break /><break />(.*?)</th>", r"<th\1<break />\2</th>", jats_content
-    )
-
-    # collapse double break tags into paragraph tags
-    break_section_match = "<break /><break />"
-    break_section_map = {"": break_section_match}
-    break_sections = sections(jats_content, root_tag, break_section_map)
-    # add blank content to the end for last iteration
-    break_sections.append({"content": ""})
+    output = []
     # hanging tags could possibly be still open across <break /><break /> dividers
-    hanging_tags = ["italic", "bold"]
-    open_tags = set()
-    for i, break_section in enumerate(break_sections):
-        content = break_section.get("content")
-
-        content = content.replace(break_section_match, "")
-
-        if 0 < i < len(break_sections) - 1:
-            for tag_name in open_tags:
-                content = utils.open_tag(tag_name) + content
-            if not content.startswith("<p>"):
-                content = "<p>" + content
-
-        if i < len(break_sections) - 1:
-            # detect and close any open tags
-            for tag_name in hanging_tags:
-                open_tag_count = content.count(utils.open_tag(tag_name))
-                close_tag_count = content.count(utils.close_tag(tag_name))
-                first_close_tag_index = content.find(utils.close_tag(tag_name))
-                first_open_tag_index = content.find(utils.open_tag(tag_name))
-                if open_tag_count == close_tag_count and tag_name in open_tags:
-                    open_tags.remove(tag_name)
-
-                if open_tag_count > close_tag_count and tag_name not in open_tags:
-                    content += utils.close_tag(tag_name)
-                    open_tags.add(tag_name)
-                elif (
-                    first_close_tag_index
-                    and first_open_tag_index
-                    and first_close_tag_index < first_open_tag_index
-                ):
-                    # do the same if tag counts equal but close tag comes before the open tag
-                    content += utils.close_tag(tag_name)
-                    open_tags.add(tag_name)
-                elif tag_name in open_tags:
-                    # there are open tags from previous section
-                    content += utils.close_tag(tag_name)
-                    open_tags.add(tag_name)
-
-            if (
-                not content.endswith("</p>")
-                and not content.endswith("</table>")
-                and not content.endswith("</disp-quote>")
-                and not content.endswith("</list>")
-            ):
-                content += "</p>"
+    open_tags = []
+    section_parts = []
+    section_tags = []
+    cell_depth = 0
+    position = 0
+    for match in BREAK_TAG_PATTERN.finditer(jats_content):
+        tag_type = match.lastgroup
+        if tag_type == "break":
+            section_parts.append(jats_content[position : match.start()])
+            position = match.end()
+            if cell_depth:
+                # collapse double break tags in tables
+                section_parts.append("<break />")
+                continue
+            # collapse double break tags into paragraph tags
+            open_tags = convert_break_section(
+                output, section_parts, section_tags, open_tags, root_tag
+            )
+            section_parts = [BREAK_SECTION_MATCH]
+            section_tags = []
+        elif tag_type == "cell_open":
+            cell_depth += 1
+        elif tag_type == "cell_close":
+            cell_depth = max(cell_depth - 1, 0)
+        else:
+            section_tags.append(match.group(0))
+    section_parts.append(jats_content[position:])
+    convert_break_section(output, section_parts, section_tags, open_tags, root_tag)
+    return "".join(output)
 
-        converted_jats_content += content
 
-    # remove other break tags
-    return converted_jats_content
+def convert_break_section(output, section_parts, section_tags, open_tags, root_tag):
+    """
+    add the content between break tags to the output as a paragraph, reopening
+    the tags open_tags left open and closing its own open tags, which are returned
+    """
+    content = "".join(section_parts)
+    if root_tag in content:
+        content = utils.clean_portion(content, root_tag)
+    else:
+        content = content.strip()
+    if not content:
+        return open_tags
+    content = content.replace(BREAK_SECTION_MATCH, "")
+    tag_stack = []
+    if output:
+        tag_stack = list(open_tags)
+        content = "".join(utils.open_tag(tag_name) for tag_name in open_tags) + content
+        if not content.startswith("<p>"):
+            content = "<p>" + content
+    for tag in section_tags:
+        tag_name = tag.strip("</>")
+        if not tag.startswith("</"):
+            tag_stack.append(tag_name)
+        elif tag_name in tag_stack:
+            # close the innermost open tag of the name
+            del tag_stack[len(tag_stack) - 1 - tag_stack[::-1].index(tag_name)]
+    # detect and close any open tags
+    content += "".join(utils.close_tag(tag_name) for tag_name in reversed(tag_stack))
+    if not content.endswith(BREAK_SECTION_CLOSE_TAGS):
+        content += "</p>"
+    output.append(content)
+    return tag_stack
 
 
 def section_type(jats_content, section_map):
@@ -197,35 +1017,83 @@ def section_type(jats_content, section_map):
 
 def sections(jats_content, root_tag="root", section_map=None):
     """break the jats_content into sections for sub-article tags"""
-    sections = []
-    if not section_map:
-        section_map = SECTION_MAP
-    # find the string indicies for the section markers
-    string_indexes = [0]
-    for section_marker in list(section_map.values()):
-        string_indexes += [
-            match.start() for match in re.finditer(section_marker, jats_content)
-        ]
-    string_indexes.append(len(jats_content))
-    # add sections
-    for i, string_index in enumerate(sorted(string_indexes)):
-        if i == 0:
-            # set the substring_start from the first 0 index
-            substring_start = string_index
-            continue
-        portion = utils.clean_portion(
-            jats_content[substring_start:string_index], root_tag
-        )
-        # set the section type based on the match string
-        portion_section_type = section_type(portion, section_map)
-        # populate the section
-        section = OrderedDict()
-        section["section_type"] = portion_section_type
-        section["content"] = portion
-        # append it if not empty
-        if portion:
+    return SectionIndex(jats_content, root_tag, section_map).sections()
+
+
+def section_records(jats_content, root_tag="root", section_map=None):
+    """break the jats_content into section records for sub-article tags"""
+    return SectionIndex(jats_content, root_tag, section_map).records()
+
+
+class SectionIndex:
+    """
+    spans of the jats_content between section markers, found in one pass,
+    as (start, end, section_type) tuples, the content of a span is only
+    copied when it is asked for
+    """
+
+    def __init__(self, jats_content, root_tag="root", section_map=None):
+        self.jats_content = jats_content
+        self.section_map = section_map if section_map else SECTION_MAP
+        self.spans = []
+        marker_pattern = re.compile(
+            "|".join(re.escape(marker) for marker in self.section_map.values())
+        )
+        root_open_pattern = re.compile(r"<%s.*?>" % re.escape(root_tag))
+        root_close_tag = "</%s>" % root_tag
+        start = 0
+        for match in marker_pattern.finditer(jats_content):
+            self.add_span(start, match.start(), root_open_pattern, root_close_tag)
+            start = match.start()
+        self.add_span(start, len(jats_content), root_open_pattern, root_close_tag)
+
+    def add_span(self, start, end, root_open_pattern, root_close_tag):
+        """add the span, without root tags and whitespace as utils.clean_portion does"""
+        match = root_open_pattern.match(self.jats_content, start, end)
+        if match:
+            start = match.end()
+        if self.jats_content.endswith(root_close_tag, start, end):
+            end -= len(root_close_tag)
+        elif self.jats_content.endswith(root_close_tag + "\n", start, end):
+            # the pattern in clean_portion also matches before a final new line
+            end -= len(root_close_tag) + 1
+        while start < end and self.jats_content[start].isspace():
+            start += 1
+        while end > start and self.jats_content[end - 1].isspace():
+            end -= 1
+        if start < end:
+            self.spans.append((start, end, self.span_section_type(start, end)))
+
+    def span_section_type(self, start, end):
+        """the section type of the last marker the span starts with"""
+        span_section_type = None
+        for section_type, section_match in self.section_map.items():
+            if self.jats_content.startswith(section_match, start, end):
+                span_section_type = section_type
+        return span_section_type
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __iter__(self):
+        return iter(self.spans)
+
+    def content(self, span):
+        """the content of the span"""
+        return self.jats_content[span[0] : span[1]]
+
+    def sections(self):
+        """the sections as dicts of their section_type and content"""
+        sections = []
+        for span in self.spans:
+            section = OrderedDict()
+            section["section_type"] = span[2]
+            section["content"] = self.content(span)
             sections.append(section)
-        # set for next iteration
-        substring_start = string_index
+        return sections
 
-    return sections
+    def records(self):
+        """the sections as records of their section_type and content"""
+        return [
+            record_lib.SectionRecord(span[2], self.content(span)) for span in self.spans
+        ]
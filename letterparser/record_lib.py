@@ -0,0 +1,325 @@
+# coding=utf-8
+
+"""
+compact records of the sections, content blocks and assets passed between the
+parse, build and generate stages, they have slots instead of a dict and are
+serialised with marshal, an elifearticle Article is only created from an
+article record when it is asked for
+"""
+import marshal
+import re
+from xml.etree import ElementTree
+from xml.etree.ElementTree import Element
+import elifearticle.utils as eautils
+from letterparser import utils
+
+
+# version of the serialised records, data of another version is not loaded
+SERIAL_VERSION = 1
+
+# XML of Elements which cannot be parsed again as it was, carriage returns in text
+# are lost and prefixed names, such as mml:math, have no namespace declaration
+UNPARSEABLE_XML_MATCH_PATTERN = re.compile(rb'\r|<[^\s>/]+:|\s[^\s<>="]+:[^\s<>="]+="')
+
+
+class Record:
+    """slotted record, its fields can also be read and set like dict items"""
+
+    __slots__ = ()
+
+    def get(self, name, default=None):
+        return getattr(self, name) if name in self.__slots__ else default
+
+    def __contains__(self, name):
+        return name in self.__slots__ and getattr(self, name) is not None
+
+    def __getitem__(self, name):
+        if name not in self.__slots__:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __setitem__(self, name, value):
+        if name not in self.__slots__:
+            raise KeyError(name)
+        setattr(self, name, value)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __repr__(self):
+        return "%s(%s)" % (
+            type(self).__name__,
+            ", ".join("%s=%r" % (name, getattr(self, name)) for name in self.__slots__),
+        )
+
+
+class SectionRecord(Record):
+    """section of the document for one sub-article"""
+
+    __slots__ = ("section_type", "content", "content_sections")
+
+    def __init__(self, section_type=None, content=None, content_sections=None):
+        self.section_type = section_type
+        self.content = content
+        self.content_sections = content_sections
+
+    def state(self):
+        """tuple of plain values, content sections keep only their tag and content"""
+        content_section_states = None
+        if self.content_sections is not None:
+            content_section_states = [
+                (content_section.get("tag_name"), content_section.get("content"))
+                for content_section in self.content_sections
+            ]
+        return (self.section_type, self.content, content_section_states)
+
+    @classmethod
+    def from_state(cls, state):
+        section_type, content, content_section_states = state
+        content_sections = None
+        if content_section_states is not None:
+            content_sections = [
+                ContentSectionRecord(tag_name, content)
+                for tag_name, content in content_section_states
+            ]
+        return cls(section_type, content, content_sections)
+
+
+class ContentSectionRecord(Record):
+    """first child level tag of a section, with its Element and content class"""
+
+    __slots__ = ("tag_name", "content", "element", "content_class")
+
+    def __init__(self, tag_name=None, content=None, element=None, content_class=None):
+        self.tag_name = tag_name
+        self.content = content
+        self.element = element
+        self.content_class = content_class
+
+
+class BlockRecord(Record):
+    """
+    content block of a sub-article, its content string is rendered from the
+    Element when it is read, unless the content is set
+    """
+
+    __slots__ = ("block_type", "attr", "_content", "element", "content_blocks")
+
+    def __init__(
+        self,
+        block_type=None,
+        content=None,
+        attr=None,
+        element=None,
+        content_blocks=None,
+    ):
+        self.block_type = block_type
+        self._content = content
+        self.attr = attr if attr else {}
+        self.element = element
+        self.content_blocks = content_blocks if content_blocks else []
+
+    @property
+    def content(self):
+        if self._content is None and self.element is not None:
+            return element_content(self.element)
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        # the new content replaces the Element
+        self._content = value
+        self.element = None
+
+    def attr_names(self):
+        return eautils.attr_names(self.attr)
+
+    def attr_string(self):
+        return eautils.attr_string(self.attr)
+
+
+class AssetRecord(Record):
+    """file name of a fig or video asset and the index of its content block"""
+
+    __slots__ = ("asset_type", "file_name", "block_index")
+
+    def __init__(self, asset_type=None, file_name=None, block_index=None):
+        self.asset_type = asset_type
+        self.file_name = file_name
+        self.block_index = block_index
+
+    def state(self):
+        return (self.asset_type, self.file_name, self.block_index)
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(*state)
+
+
+class RelatedRecord(Record):
+    """link to a related article"""
+
+    __slots__ = ("xlink_href", "ext_link_type")
+
+    def __init__(self, xlink_href=None, ext_link_type=None):
+        self.xlink_href = xlink_href
+        self.ext_link_type = ext_link_type
+
+    def state(self):
+        return (self.xlink_href, self.ext_link_type)
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(*state)
+
+
+class ArticleRecord(Record):
+    """sub-article with the fields of an elifearticle Article which are used"""
+
+    __slots__ = (
+        "article_type",
+        "id",
+        "doi",
+        "manuscript",
+        "title",
+        "related_articles",
+        "content_blocks",
+        "assets",
+    )
+
+    def __init__(
+        self,
+        article_type=None,
+        id_value=None,
+        doi=None,
+        manuscript=None,
+        title=None,
+        related_articles=None,
+        content_blocks=None,
+        assets=None,
+    ):
+        self.article_type = article_type
+        self.id = id_value
+        self.doi = doi
+        self.manuscript = manuscript
+        self.title = title
+        self.related_articles = related_articles if related_articles else []
+        self.content_blocks = content_blocks if content_blocks else []
+        self.assets = assets if assets else []
+
+    def state(self):
+        """
+        tuple of plain values, the Elements of the content blocks are one XML string
+        which is much faster to serialise than each Element
+        """
+        elements_tag = Element("elements")
+        block_states = [
+            block_state(block, elements_tag) for block in self.content_blocks
+        ]
+        xml_string = ElementTree.tostring(elements_tag, "utf-8")
+        if UNPARSEABLE_XML_MATCH_PATTERN.search(xml_string):
+            block_states = [block_state(block) for block in self.content_blocks]
+            xml_string = None
+        return (
+            self.article_type,
+            self.id,
+            self.doi,
+            self.manuscript,
+            self.title,
+            [related.state() for related in self.related_articles],
+            block_states,
+            xml_string,
+            [asset.state() for asset in self.assets],
+        )
+
+    @classmethod
+    def from_state(cls, state):
+        (
+            article_type,
+            id_value,
+            doi,
+            manuscript,
+            title,
+            related_states,
+            block_states,
+            xml_string,
+            asset_states,
+        ) = state
+        elements = []
+        if xml_string is not None:
+            elements = list(ElementTree.fromstring(xml_string))
+        return cls(
+            article_type,
+            id_value,
+            doi,
+            manuscript,
+            title,
+            [RelatedRecord.from_state(related) for related in related_states],
+            [block_from_state(block, elements) for block in block_states],
+            [AssetRecord.from_state(asset) for asset in asset_states],
+        )
+
+
+def element_content(element):
+    """content string of the Element without its own tags"""
+    rough_string = ElementTree.tostring(element, "utf8").decode("utf8")
+    rough_string = rough_string.replace("<?xml version='1.0' encoding='utf8'?>", "")
+    return utils.clean_portion(rough_string.lstrip("\n"), element.tag)
+
+
+def block_state(block, elements_tag=None):
+    """
+    tuple of the block values, its Element is added to the elements_tag and its
+    index is kept, if there is no elements_tag the content string is kept
+    """
+    element_index = -1
+    content = block._content
+    if block.element is not None:
+        if elements_tag is not None:
+            element_index = len(elements_tag)
+            elements_tag.append(block.element)
+        else:
+            content = block.content
+    return (
+        block.block_type,
+        dict(block.attr),
+        content,
+        element_index,
+        [
+            block_state(child_block, elements_tag)
+            for child_block in block.content_blocks
+        ],
+    )
+
+
+def block_from_state(state, elements):
+    block_type, attr, content, element_index, child_states = state
+    return BlockRecord(
+        block_type,
+        content,
+        attr,
+        elements[element_index] if element_index >= 0 else None,
+        [block_from_state(child_state, elements) for child_state in child_states],
+    )
+
+
+def dumps(records):
+    """serialise a list of article or section records to bytes"""
+    states = []
+    for record in records:
+        states.append((type(record).__name__, record.state()))
+    return marshal.dumps((SERIAL_VERSION, states))
+
+
+def loads(data):
+    """list of article or section records from the bytes dumps returned"""
+    version, states = marshal.loads(data)
+    if version != SERIAL_VERSION:
+        raise ValueError("serialised records version %s is not supported" % version)
+    record_classes = {
+        ArticleRecord.__name__: ArticleRecord,
+        SectionRecord.__name__: SectionRecord,
+    }
+    return [record_classes[name].from_state(state) for name, state in states]
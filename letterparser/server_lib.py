@@ -0,0 +1,74 @@
+import base64
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# shared session so connections to the pandoc server are kept alive and reused
+SESSION = None
+
+POOL_MAXSIZE = 10
+
+
+def create_session(pool_maxsize=POOL_MAXSIZE):
+    """create a requests Session with a pool of keep-alive connections"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    """return the shared requests Session, creating it if required"""
+    global SESSION
+    if SESSION is None:
+        SESSION = create_session()
+    return SESSION
+
+
+def close_session():
+    """close the shared requests Session and its pooled connections"""
+    global SESSION
+    if SESSION is not None:
+        SESSION.close()
+    SESSION = None
+
+
+def request_data(docx_bytes, output_format="jats"):
+    """pandoc-server request body, binary input formats are base64 encoded"""
+    return {
+        "text": base64.b64encode(docx_bytes).decode("utf8"),
+        "from": "docx",
+        "to": output_format,
+        "wrap": "none",
+    }
+
+
+def call_pandoc(file_name, server_url, output_format="jats", timeout=None):
+    """convert the docx file by posting it to a running pandoc-server"""
+    with open(file_name, "rb") as open_file:
+        docx_bytes = open_file.read()
+    return call_pandoc_bytes(docx_bytes, server_url, output_format, timeout)
+
+
+def call_pandoc_bytes(docx_bytes, server_url, output_format="jats", timeout=None):
+    """convert the docx bytes by posting them to a running pandoc-server"""
+    response = get_session().post(
+        server_url,
+        json=request_data(docx_bytes, output_format),
+        headers={"Accept": "application/json"},
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    response_json = response.json()
+    output = response_json.get("output")
+    if response_json.get("base64"):
+        output = base64.b64decode(output).decode("utf8")
+    return output
+
+
+def pandoc_version(server_url, timeout=None):
+    """get the pandoc version of the pandoc-server"""
+    response = get_session().get("%s/version" % server_url.rstrip("/"), timeout=timeout)
+    response.raise_for_status()
+    return response.text.strip()
@@ -3,7 +3,10 @@
 "utility helper functions"
 import os
 import re
+import shutil
+import tempfile
 import unicodedata
+from contextlib import contextmanager
 from elifetools import xmlio
 from elifetools import utils as etoolsutils
 
@@ -16,6 +19,29 @@ PROBLEM_PUNCTUATION_CHARS = [chr(8232)]
 
 PROBLEM_CHARS = PROBLEM_PUNCTUATION_CHARS + MATH_SYMBOL_CHARS
 
+# RAM-backed filesystem for workspaces, if it is available
+RAM_DIR = "/dev/shm"
+
+WORKSPACE_PREFIX = "letterparser-"
+
+
+@contextmanager
+def workspace(temp_dir="tmp", ram=False):
+    """
+    a new directory for one conversion inside the temp_dir, or on the RAM-backed
+    filesystem if ram is True, the directory is removed on exit
+    """
+    parent_dir = temp_dir
+    if ram and os.path.isdir(RAM_DIR):
+        parent_dir = RAM_DIR
+    elif parent_dir:
+        os.makedirs(parent_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=WORKSPACE_PREFIX, dir=parent_dir)
+    try:
+        yield work_dir
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
 
 def remove_non_breaking_space(string):
     """replace non breaking space characters"""
@@ -43,81 +69,157 @@ def remove_empty_p_tags(string):
     return re.sub(empty_p_tag_match_pattern, "", string)
 
 
-def new_line_replace_with(line_one, line_two):
-    """determine the whitespace to use when concatenating two lines together"""
-    if line_one is None:
-        return ""
-
-    # strip spaces before comparisons
-    line_one = line_one.lstrip().rstrip()
-    line_two = line_two.lstrip().rstrip()
-
-    if line_one.endswith(">") and line_two.startswith("<"):
+# classes of a line, without leading and trailing whitespace, as bit flags
+LINE_STARTS_TAG = 1 << 0
+LINE_ENDS_TAG = 1 << 1
+LINE_STARTS_P = 1 << 2
+LINE_STARTS_P_ITALIC = 1 << 3
+LINE_IS_P_ITALIC = 1 << 4
+LINE_STARTS_ITALIC = 1 << 5
+LINE_IS_ITALIC = 1 << 6
+LINE_ENDS_ITALIC = 1 << 7
+LINE_STARTS_CLOSE_ITALIC = 1 << 8
+LINE_ENDS_CLOSE_ITALIC = 1 << 9
+LINE_IS_CLOSE_ITALIC_P = 1 << 10
+LINE_ENDS_CLOSE_ITALIC_P = 1 << 11
+LINE_STARTS_BOLD = 1 << 12
+LINE_ENDS_CLOSE_BOLD_P = 1 << 13
+LINE_ENDS_CLOSE_P = 1 << 14
+
+# the whitespace to use between two lines, keyed by their classes, filled as needed
+LINE_JOIN_TABLE = {}
+
+
+def line_class(line):
+    """the bit flags of a line, leading and trailing whitespace is ignored"""
+    line = line.strip()
+    flags = 0
+    # the prefixes and suffixes are tags, so only look for them after a < or >
+    if line[:1] == "<":
+        flags = LINE_STARTS_TAG
+        if line.startswith("<p>"):
+            flags |= LINE_STARTS_P
+            if line.startswith("<p><italic>"):
+                flags |= LINE_STARTS_P_ITALIC
+                if line == "<p><italic>":
+                    flags |= LINE_IS_P_ITALIC
+        elif line.startswith("<italic>"):
+            flags |= LINE_STARTS_ITALIC
+            if line == "<italic>":
+                flags |= LINE_IS_ITALIC
+        elif line.startswith("</italic>"):
+            flags |= LINE_STARTS_CLOSE_ITALIC
+            if line == "</italic></p>":
+                flags |= LINE_IS_CLOSE_ITALIC_P
+        elif line.startswith("<bold>"):
+            flags |= LINE_STARTS_BOLD
+    if line[-1:] == ">":
+        flags |= LINE_ENDS_TAG
+        if line.endswith("</p>"):
+            flags |= LINE_ENDS_CLOSE_P
+            if line.endswith("</italic></p>"):
+                flags |= LINE_ENDS_CLOSE_ITALIC_P
+            elif line.endswith("</bold></p>"):
+                flags |= LINE_ENDS_CLOSE_BOLD_P
+        elif line.endswith("</italic>"):
+            flags |= LINE_ENDS_CLOSE_ITALIC
+        elif line.endswith("<italic>"):
+            flags |= LINE_ENDS_ITALIC
+    return flags
+
+
+def line_join(class_one, class_two):
+    """look up the whitespace to join two lines of the classes"""
+    key = (class_one, class_two)
+    if key not in LINE_JOIN_TABLE:
+        LINE_JOIN_TABLE[key] = line_join_rule(class_one, class_two)
+    return LINE_JOIN_TABLE[key]
+
+
+def line_join_rule(one, two):
+    """determine the whitespace to use between lines of the two classes"""
+    break_tags = "<break /><break />"
+    italic_break_tags = "</italic><break /><break /><italic>"
+
+    if one & LINE_ENDS_TAG and two & LINE_STARTS_TAG:
         if (
-            line_one.startswith("<p><italic>")
-            and not line_one.endswith("</italic></p>")
-            and line_two.startswith("</italic>")
+            one & LINE_STARTS_P_ITALIC
+            and not one & LINE_ENDS_CLOSE_ITALIC_P
+            and two & LINE_STARTS_CLOSE_ITALIC
         ):
-            return "</italic><break /><break /><italic>"
+            return italic_break_tags
         # default return blank string
         return ""
 
-    if not line_one.startswith("<p>"):
-        if line_two == "<italic>":
-            return "<break /><break />"
-        if line_one.endswith("</italic>"):
-            return "<break /><break />"
-        if line_one.startswith("</italic>") and line_two.startswith("<italic>"):
-            return "<break /><break />"
+    if not one & LINE_STARTS_P:
+        if two & LINE_IS_ITALIC:
+            return break_tags
+        if one & LINE_ENDS_CLOSE_ITALIC:
+            return break_tags
+        if one & LINE_STARTS_CLOSE_ITALIC and two & LINE_STARTS_ITALIC:
+            return break_tags
         if (
-            not line_one.startswith("<")
-            and line_two.startswith("</italic>")
-            and line_two != "</italic></p>"
+            not one & LINE_STARTS_TAG
+            and two & LINE_STARTS_CLOSE_ITALIC
+            and not two & LINE_IS_CLOSE_ITALIC_P
         ):
-            return "<break /><break />"
-        if line_two.startswith("<bold>") and line_two.endswith("</bold></p>"):
-            return "<break /><break />"
-        if not line_two.startswith("<") and line_two.endswith("</p>"):
-            return "<break /><break />"
-        if not line_two.endswith("</p>") and not line_one.startswith("<"):
-            return "<break /><break />"
-    elif line_two == "<italic>":
-        return "<break /><break />"
-    elif not line_one.endswith(">") and line_two.startswith("<italic>"):
-        return "<break /><break />"
-    elif (
-        line_one != "<p><italic>"
-        and line_one.endswith("<italic>")
-        and not line_two.startswith("<")
-    ):
-        return "</italic><break /><break /><italic>"
+            return break_tags
+        if two & LINE_STARTS_BOLD and two & LINE_ENDS_CLOSE_BOLD_P:
+            return break_tags
+        if not two & LINE_STARTS_TAG and two & LINE_ENDS_CLOSE_P:
+            return break_tags
+        if not two & LINE_ENDS_CLOSE_P and not one & LINE_STARTS_TAG:
+            return break_tags
+    elif two & LINE_IS_ITALIC:
+        return break_tags
+    elif not one & LINE_ENDS_TAG and two & LINE_STARTS_ITALIC:
+        return break_tags
     elif (
-        line_one.startswith("<p><italic>")
-        and not line_one.endswith("</italic></p>")
-        and line_two.startswith("</italic>")
-        and line_two != "</italic></p>"
+        not one & LINE_IS_P_ITALIC
+        and one & LINE_ENDS_ITALIC
+        and not two & LINE_STARTS_TAG
     ):
-        return "</italic><break /><break /><italic>"
-    elif not line_one.endswith(">") and not line_two.startswith("<"):
-        return "<break /><break />"
+        return italic_break_tags
     elif (
-        not line_one.endswith(">")
-        and line_two.startswith("<bold>")
-        and line_two.endswith("</p>")
+        one & LINE_STARTS_P_ITALIC
+        and not one & LINE_ENDS_CLOSE_ITALIC_P
+        and two & LINE_STARTS_CLOSE_ITALIC
+        and not two & LINE_IS_CLOSE_ITALIC_P
     ):
-        return "<break /><break />"
+        return italic_break_tags
+    elif not one & LINE_ENDS_TAG and not two & LINE_STARTS_TAG:
+        return break_tags
+    elif not one & LINE_ENDS_TAG and two & LINE_STARTS_BOLD and two & LINE_ENDS_CLOSE_P:
+        return break_tags
     return ""
 
 
+def new_line_replace_with(line_one, line_two):
+    """determine the whitespace to use when concatenating two lines together"""
+    if line_one is None:
+        return ""
+    return line_join(line_class(line_one), line_class(line_two))
+
+
 def collapse_newlines(string):
     if not string:
         return None
-    new_string = ""
-    prev_line = None
+    parts = []
+    prev_class = None
     for line in string.split("\n"):
-        replace_with = new_line_replace_with(prev_line, line.lstrip())
-        new_string += replace_with + line.lstrip()
-        prev_line = line
+        line = line.lstrip()
+        current_class = line_class(line)
+        if prev_class is not None:
+            join = LINE_JOIN_TABLE.get((prev_class, current_class))
+            if join is None:
+                join = line_join(prev_class, current_class)
+            parts.append(join)
+        parts.append(line)
+        prev_class = current_class
+    new_string = "".join(parts)
+    # the edge case fixes below all involve italic tags
+    if "italic>" not in new_string:
+        return new_string
     # remove meaningless break and italic tags due to and edge case fix
     new_string = new_string.replace(
         "<break /><break /></italic><break /><break />", "</italic><break /><break />"
@@ -132,6 +234,13 @@ def collapse_newlines(string):
     return new_string
 
 
+def join_lines(string):
+    """join lines together without their indentation"""
+    if not string:
+        return None
+    return "".join(line.lstrip() for line in string.split("\n"))
+
+
 def clean_portion(string, root_tag="root"):
     if not string:
         return ""
@@ -280,24 +389,104 @@ def manuscript_from_file_name(file_name):
     return None
 
 
-def remove_complex_scripts_styles(document_xml):
-    """given docx document.xml contents remove complex scripts style tags"""
+def has_complex_scripts_styles(document_xml):
+    """quick check for complex scripts style tags in the docx document.xml contents"""
+    return b"<w:bCs" in document_xml or b"<w:iCs" in document_xml
 
-    # pattern for matching run tags w:r
-    run_tag_match_pattern = re.compile(rb"(<w:r\s+.*?>.*?</w:r>)")
-    # pattern for matching complex styles bold formatting tags
-    complex_bold_match_pattern = re.compile(rb"<w:bCs.*?/>")
-    # pattern for matching complex styles italic formatting tags
-    complex_italic_match_pattern = re.compile(rb"<w:iCs.*?/>")
-
-    new_document_xml = b""
-    for xml_part in re.split(run_tag_match_pattern, document_xml):
-        # if the w:rFonts tag contains a specific attribute, then do not remove the complex styles
-        if not (b"<w:rFonts" in xml_part and b"w:cstheme" in xml_part) or (
-            b"<w:rFonts" in xml_part and b"w:ascii" in xml_part
-        ):
-            xml_part = re.sub(complex_bold_match_pattern, b"", xml_part)
-            xml_part = re.sub(complex_italic_match_pattern, b"", xml_part)
-        new_document_xml += xml_part
 
-    return new_document_xml
+# run tags are matched as the pattern rb"(<w:r\s+.*?>.*?</w:r>)" would, where . is
+# any byte except a new line
+RUN_TAG_START = b"<w:r"
+RUN_TAG_END = b"</w:r>"
+WHITESPACE_BYTES = b" \t\n\r\f\v"
+
+# pattern for matching complex styles bold formatting tags
+COMPLEX_BOLD_MATCH_PATTERN = re.compile(rb"<w:bCs.*?/>")
+# pattern for matching complex styles italic formatting tags
+COMPLEX_ITALIC_MATCH_PATTERN = re.compile(rb"<w:iCs.*?/>")
+
+# size of the document.xml chunks read when streaming it
+CHUNK_SIZE = 1024 * 1024
+
+
+def remove_complex_scripts_styles(document_xml):
+    """given docx document.xml contents remove complex scripts style tags"""
+    if not has_complex_scripts_styles(document_xml):
+        return document_xml
+    return b"".join(iter_remove_complex_scripts_styles([document_xml]))
+
+
+def iter_remove_complex_scripts_styles(chunks):
+    """
+    given docx document.xml contents as an iterable of chunks, yield the contents
+    with complex scripts style tags removed, in linear time and holding at most
+    one run tag or the contents between two run tags in memory
+    """
+    data = b""
+    offset = 0
+    final = False
+    between_parts = []
+    chunks = iter(chunks)
+    while True:
+        run_start, run_end = find_run_tag(data, offset, final)
+        if run_start is not None:
+            between_parts.append(data[offset:run_start])
+            yield remove_complex_scripts_styles_part(b"".join(between_parts))
+            yield remove_complex_scripts_styles_part(data[run_start:run_end])
+            between_parts = []
+            offset = run_end
+            continue
+        # no run tag starts before run_end
+        between_parts.append(data[offset:run_end])
+        if final:
+            yield remove_complex_scripts_styles_part(b"".join(between_parts))
+            return
+        chunk = next(chunks, None)
+        final = chunk is None
+        data = data[run_end:] + (chunk or b"")
+        offset = 0
+
+
+def find_run_tag(data, start=0, final=True):
+    """
+    find the next run tag in data from the start position, return its start and end,
+    if there is none return None and the position before which no run tag can start,
+    which is not the end of data if more data is needed to tell unless final is True
+    """
+    position = data.find(RUN_TAG_START, start)
+    while position >= 0:
+        index = position + len(RUN_TAG_START)
+        while index < len(data) and data[index] in WHITESPACE_BYTES:
+            index += 1
+        if index == len(data) and not final:
+            return None, position
+        if index > position + len(RUN_TAG_START):
+            tag_end = data.find(b">", index)
+            if tag_end < 0:
+                # without a > no more run tags can be matched
+                return None, len(data) if final else position
+            if data.find(b"\n", index, tag_end) < 0:
+                run_end = data.find(RUN_TAG_END, tag_end + 1)
+                if run_end < 0:
+                    if final:
+                        return None, len(data)
+                    if data.find(b"\n", tag_end + 1) < 0:
+                        return None, position
+                elif data.find(b"\n", tag_end + 1, run_end) < 0:
+                    return position, run_end + len(RUN_TAG_END)
+        position = data.find(RUN_TAG_START, position + 1)
+    if final:
+        return None, len(data)
+    # keep the end of data which may be the start of a run tag
+    return None, max(start, len(data) - len(RUN_TAG_START) + 1)
+
+
+def remove_complex_scripts_styles_part(xml_part):
+    """remove complex scripts style tags from a run tag or the contents between them"""
+    # if the w:rFonts tag contains a specific attribute, then do not remove the complex styles
+    if not (b"<w:rFonts" in xml_part and b"w:cstheme" in xml_part) or (
+        b"<w:rFonts" in xml_part and b"w:ascii" in xml_part
+    ):
+        xml_part = COMPLEX_BOLD_MATCH_PATTERN.sub(b"", xml_part)
+        xml_part = COMPLEX_ITALIC_MATCH_PATTERN.sub(b"", xml_part)
+    return xml_part
@@ -1,85 +1,352 @@
 # coding=utf-8
 
+import concurrent.futures
+import functools
+import hashlib
+import io
 import zipfile
 import os
 import shutil
+import struct
+import tempfile
 from letterparser import utils
 
 
 def profile_zip(file_name):
     """open the zip and get zip file info based on the filename"""
+    with zipfile.ZipFile(file_name, "r") as open_zipfile:
+        return profile_zip_infos(open_zipfile)
+
+
+def profile_zip_infos(open_zipfile):
+    """get the docx and asset zip file info from the open zip"""
     zip_docx_info = None
     zip_asset_infos = []
-    with zipfile.ZipFile(file_name, "r") as open_zipfile:
-        for zipfile_info in open_zipfile.infolist():
-            # ignore files in subfolders like __MACOSX
-            zipfile_file = zipfile_info.filename
-            if "/" in zipfile_file:
-                continue
-            if zipfile_file.endswith(".docx"):
-                zip_docx_info = zipfile_info
-            else:
-                # assume figure or video file
-                zip_asset_infos.append(zipfile_info)
+    for zipfile_info in open_zipfile.infolist():
+        # ignore files in subfolders like __MACOSX
+        zipfile_file = zipfile_info.filename
+        if "/" in zipfile_file:
+            continue
+        if zipfile_file.endswith(".docx"):
+            zip_docx_info = zipfile_info
+        else:
+            # assume figure or video file
+            zip_asset_infos.append(zipfile_info)
     # sort by file name
     zip_asset_infos = sorted(zip_asset_infos, key=lambda asset: asset.filename)
     return zip_docx_info, zip_asset_infos
 
 
 def unzip_file(open_zipfile, zip_file_info, output_path):
-    "read the zip_file_info from the open_zipfile and write to output_path"
+    "read the zip_file_info from the open_zipfile and write to output_path in chunks"
     with open_zipfile.open(zip_file_info) as zip_content:
         with open(output_path, "wb") as output_file:
-            output_file.write(zip_content.read())
+            shutil.copyfileobj(zip_content, output_file, utils.CHUNK_SIZE)
+
+
+class ZipManifest:
+    """
+    the docx and asset files of a zip, listed when it is opened,
+    files are only extracted when asked for
+    """
+
+    def __init__(self, file_name):
+        self.open_zipfile = zipfile.ZipFile(file_name, "r")
+        self.docx_info, self.asset_infos = profile_zip_infos(self.open_zipfile)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.open_zipfile.close()
+
+    @property
+    def docx_file_name(self):
+        return self.docx_info.filename if self.docx_info else None
+
+    @property
+    def asset_file_names(self):
+        return [asset_info.filename for asset_info in self.asset_infos]
+
+    def read_docx(self):
+        """the docx bytes, None if there is no docx"""
+        if not self.docx_info:
+            return None
+        return self.open_zipfile.read(self.docx_info)
+
+    def extract_docx(self, temp_dir):
+        """write the docx to the temp_dir and return its path"""
+        if not self.docx_info:
+            return None
+        return self.extract(self.docx_info, temp_dir)
 
+    def extract_assets(self, temp_dir, max_workers=1):
+        """
+        write the asset files to the temp_dir and return their paths,
+        using a pool of threads if max_workers is more than 1
+        """
+        if max_workers > 1 and len(self.asset_infos) > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+                return list(
+                    executor.map(
+                        lambda asset_info: self.extract(asset_info, temp_dir),
+                        self.asset_infos,
+                    )
+                )
+        return [self.extract(asset_info, temp_dir) for asset_info in self.asset_infos]
 
-def unzip_zip(file_name, temp_dir):
+    def extract(self, zip_file_info, temp_dir):
+        output_path = os.path.join(temp_dir, zip_file_info.filename)
+        unzip_file(self.open_zipfile, zip_file_info, output_path)
+        return output_path
+
+
+def unzip_zip(file_name, temp_dir, max_workers=1):
     "unzip certain files and return the local paths"
-    docx_file_name = None
-    asset_file_names = []
-    zip_docx_info, zip_asset_infos = profile_zip(file_name)
-    # extract the files
-    with zipfile.ZipFile(file_name, "r") as open_zipfile:
-        if zip_docx_info:
-            docx_file_name = os.path.join(temp_dir, zip_docx_info.filename)
-            unzip_file(open_zipfile, zip_docx_info, docx_file_name)
-        for zip_asset_info in zip_asset_infos:
-            asset_file_name = os.path.join(temp_dir, zip_asset_info.filename)
-            unzip_file(open_zipfile, zip_asset_info, asset_file_name)
-            asset_file_names.append(asset_file_name)
+    with ZipManifest(file_name) as manifest:
+        docx_file_name = manifest.extract_docx(temp_dir)
+        asset_file_names = manifest.extract_assets(temp_dir, max_workers)
     return docx_file_name, asset_file_names
 
 
+def is_docx(file_name):
+    """check if the zip file, or a file object of it, is a docx file"""
+    with zipfile.ZipFile(file_name, "r") as open_zipfile:
+        return "word/document.xml" in open_zipfile.namelist()
+
+
+def unzip_bytes(zip_bytes, temp_dir=None, max_workers=1):
+    """
+    read the docx from the zip bytes in memory and return its file name and bytes,
+    the assets are only written to the temp_dir if it is specified
+    """
+    with ZipManifest(io.BytesIO(zip_bytes)) as manifest:
+        docx_bytes = manifest.read_docx()
+        if temp_dir:
+            asset_file_names = manifest.extract_assets(temp_dir, max_workers)
+        else:
+            asset_file_names = manifest.asset_file_names
+        return manifest.docx_file_name, docx_bytes, asset_file_names
+
+
+DOCUMENT_XML = "word/document.xml"
+
+# flag bit set when the sizes and CRC follow the data instead of the header
+DATA_DESCRIPTOR_FLAG = 0x08
+
+# zipfile internals used to read and write the compressed data of zip items
+RAW_COPY_MODULE_ATTRIBUTES = ["structFileHeader", "sizeFileHeader"]
+RAW_COPY_ZIPFILE_ATTRIBUTES = [
+    "fp",
+    "filelist",
+    "NameToInfo",
+    "start_dir",
+    "_didModify",
+]
+
+
 def fix_complex_scripts_styles(file_name, temp_dir="tmp"):
     """copy the docx file and fix complex scripts style tags"""
-    new_zip_file_name = os.path.join(temp_dir, "temp.docx")
     new_file_name = os.path.join(temp_dir, utils.get_file_name_file(file_name))
-    # create a new zip file with altered word/document.xml file contents
     with zipfile.ZipFile(
         file_name, "r", zipfile.ZIP_DEFLATED, allowZip64=True
     ) as open_zip:
+        if document_has_complex_scripts_styles(open_zip):
+            # a unique name so conversions sharing the temp_dir do not write the same file
+            file_descriptor, new_zip_file_name = tempfile.mkstemp(
+                suffix=".docx", dir=temp_dir
+            )
+            os.close(file_descriptor)
+            # create a new zip file with altered word/document.xml file contents
+            with zipfile.ZipFile(
+                new_zip_file_name, "w", zipfile.ZIP_DEFLATED, allowZip64=True
+            ) as new_open_zip:
+                complex_scripts_styles_rewrite(open_zip, new_open_zip)
+            # copy the new zip overtop of existing docx, if present
+            shutil.move(new_zip_file_name, new_file_name)
+            return new_file_name
+    # nothing to fix, the docx is copied as it is
+    if os.path.abspath(file_name) != os.path.abspath(new_file_name):
+        shutil.copyfile(file_name, new_file_name)
+    return new_file_name
+
+
+def fix_complex_scripts_styles_bytes(docx_bytes):
+    """fix complex scripts style tags in the docx bytes without writing to disk"""
+    with zipfile.ZipFile(io.BytesIO(docx_bytes), "r", allowZip64=True) as open_zip:
+        if not document_has_complex_scripts_styles(open_zip):
+            return docx_bytes
+        output = io.BytesIO()
         with zipfile.ZipFile(
-            new_zip_file_name, "w", zipfile.ZIP_DEFLATED, allowZip64=True
+            output, "w", zipfile.ZIP_DEFLATED, allowZip64=True
         ) as new_open_zip:
             complex_scripts_styles_rewrite(open_zip, new_open_zip)
-    # copy the new zip overtop of existing docx, if present
-    shutil.move(new_zip_file_name, new_file_name)
-    return new_file_name
+    return output.getvalue()
+
+
+def iter_member_chunks(open_zip, zip_file_name):
+    """yield the decompressed contents of the zip item in chunks"""
+    with open_zip.open(zip_file_name) as open_file:
+        yield from iter(functools.partial(open_file.read, utils.CHUNK_SIZE), b"")
+
+
+def document_has_complex_scripts_styles(open_zip):
+    """check the document.xml for complex scripts style tags, reading it in chunks"""
+    # keep enough of the previous chunk to find a tag split between chunks
+    overlap = len(b"<w:bCs") - 1
+    tail = b""
+    for chunk in iter_member_chunks(open_zip, DOCUMENT_XML):
+        data = tail + chunk
+        if utils.has_complex_scripts_styles(data):
+            return True
+        tail = data[-overlap:]
+    return False
 
 
 def complex_scripts_styles_rewrite(from_zip, to_zip):
     """
     given two open zipfile.Zipfile objects from docx files,
     read items from from_zip,
-    write them to to_zip and remove complex script styles from the document.xml file
+    write them to to_zip and remove complex script styles from the document.xml file,
+    which is streamed into the new item, other items are copied without
+    decompressing and compressing them again
     """
-    for zip_file_name in from_zip.namelist():
-        if zip_file_name == "word/document.xml":
-            with from_zip.open(zip_file_name) as open_file:
-                document_xml = open_file.read()
-                document_xml = utils.remove_complex_scripts_styles(document_xml)
-                # write the altered string to the new zip file
-                to_zip.writestr(zip_file_name, document_xml)
+    for zip_info in from_zip.infolist():
+        if zip_info.filename == DOCUMENT_XML:
+            # write the altered contents to the new zip file as they are read
+            with to_zip.open(zip_info.filename, "w") as open_file:
+                for chunk in utils.iter_remove_complex_scripts_styles(
+                    iter_member_chunks(from_zip, zip_info.filename)
+                ):
+                    open_file.write(chunk)
         else:
-            # copy the file into the new zip
-            to_zip.writestr(zip_file_name, from_zip.read(zip_file_name))
+            # copy the compressed file into the new zip
+            copy_raw_member(from_zip, zip_info, to_zip)
+
+
+def read_raw_member(open_zip, zip_info):
+    """the compressed data of the zip item as it is stored in the zip file"""
+    return b"".join(iter_raw_member_chunks(open_zip, zip_info))
+
+
+def iter_raw_member_chunks(open_zip, zip_info):
+    """yield the compressed data of the zip item in chunks"""
+    open_zip.fp.seek(zip_info.header_offset)
+    header = struct.unpack(
+        zipfile.structFileHeader, open_zip.fp.read(zipfile.sizeFileHeader)
+    )
+    # skip the file name and extra field which follow the local file header
+    data_offset = open_zip.fp.tell() + header[-2] + header[-1]
+    position = 0
+    while position < zip_info.compress_size:
+        # seek each time in case the file is read elsewhere between chunks
+        open_zip.fp.seek(data_offset + position)
+        chunk = open_zip.fp.read(
+            min(utils.CHUNK_SIZE, zip_info.compress_size - position)
+        )
+        if not chunk:
+            raise zipfile.BadZipFile("Truncated file %s" % zip_info.filename)
+        position += len(chunk)
+        yield chunk
+
+
+def raw_copy_supported(*open_zips):
+    """check the zipfile internals used to copy compressed data are all present"""
+    return (
+        all(hasattr(zipfile, name) for name in RAW_COPY_MODULE_ATTRIBUTES)
+        and hasattr(zipfile.ZipInfo, "FileHeader")
+        and all(
+            hasattr(open_zip, name)
+            for open_zip in open_zips
+            for name in RAW_COPY_ZIPFILE_ATTRIBUTES
+        )
+    )
+
+
+def copy_raw_member(from_zip, zip_info, to_zip, file_name=None):
+    """
+    copy the compressed data of the zip item to another zip in chunks, or copy
+    the contents using the public zipfile methods if the internals have changed
+    """
+    if not raw_copy_supported(from_zip, to_zip):
+        copy_member(from_zip, zip_info, to_zip, file_name)
+        return
+    write_raw_member_chunks(
+        to_zip, zip_info, iter_raw_member_chunks(from_zip, zip_info), file_name
+    )
+
+
+def copy_member(from_zip, zip_info, to_zip, file_name=None):
+    """copy the decompressed contents of the zip item to another zip in chunks"""
+    new_zip_info = zipfile.ZipInfo(file_name or zip_info.filename, zip_info.date_time)
+    new_zip_info.compress_type = zip_info.compress_type
+    new_zip_info.create_system = zip_info.create_system
+    new_zip_info.external_attr = zip_info.external_attr
+    # the file size decides whether the item needs zip64 extensions
+    new_zip_info.file_size = zip_info.file_size
+    with from_zip.open(zip_info) as open_file:
+        with to_zip.open(new_zip_info, "w") as new_open_file:
+            shutil.copyfileobj(open_file, new_open_file, utils.CHUNK_SIZE)
+
+
+def write_raw_member_chunks(open_zip, zip_info, chunks, file_name=None):
+    """
+    write compressed data to the zip file opened for writing, the zipfile module
+    has no public method for this, so its file list is added to here as
+    ZipFile.write does, the item is named file_name if specified
+    """
+    new_zip_info = zipfile.ZipInfo(file_name or zip_info.filename, zip_info.date_time)
+    new_zip_info.compress_type = zip_info.compress_type
+    new_zip_info.CRC = zip_info.CRC
+    new_zip_info.compress_size = zip_info.compress_size
+    new_zip_info.file_size = zip_info.file_size
+    new_zip_info.create_system = zip_info.create_system
+    new_zip_info.external_attr = zip_info.external_attr
+    # the sizes and CRC are written in the header
+    new_zip_info.flag_bits = zip_info.flag_bits & ~DATA_DESCRIPTOR_FLAG
+    new_zip_info.header_offset = open_zip.fp.tell()
+    open_zip.fp.write(new_zip_info.FileHeader())
+    for chunk in chunks:
+        open_zip.fp.write(chunk)
+    open_zip.filelist.append(new_zip_info)
+    open_zip.NameToInfo[new_zip_info.filename] = new_zip_info
+    open_zip.start_dir = open_zip.fp.tell()
+    open_zip._didModify = True
+
+
+def write_package(output_file, xml_file_name, xml, manifest, file_name_map=None):
+    """
+    write the XML and the asset files of the zip manifest to a new zip, an asset
+    is named by its value in file_name_map if present, its compressed data is
+    copied in chunks without decompressing it or writing temporary files
+    """
+    file_name_map = file_name_map or {}
+    with zipfile.ZipFile(
+        output_file, "w", zipfile.ZIP_DEFLATED, allowZip64=True
+    ) as new_open_zip:
+        new_open_zip.writestr(xml_file_name, xml)
+        for asset_info in manifest.asset_infos:
+            copy_raw_member(
+                manifest.open_zipfile,
+                asset_info,
+                new_open_zip,
+                file_name_map.get(asset_info.filename),
+            )
+
+
+def docx_digest(docx):
+    """
+    sha256 of the docx file bytes, or of a BytesIO, the contents are not
+    decompressed so it is cheap enough to compute for each cache lookup
+    """
+    digest = hashlib.sha256()
+    if isinstance(docx, io.BytesIO):
+        digest.update(docx.getbuffer())
+    else:
+        with open(docx, "rb") as open_file:
+            for chunk in iter(functools.partial(open_file.read, utils.CHUNK_SIZE), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
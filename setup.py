@@ -12,6 +12,7 @@ setup(
     long_description=readme,
     long_description_content_type="text/markdown",
     packages=["letterparser"],
+    package_data={"letterparser": ["filters/*.lua"]},
     license="MIT",
     install_requires=[
         "elifearticle",
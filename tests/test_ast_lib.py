@@ -0,0 +1,262 @@
+import unittest
+from ddt import ddt, data, unpack
+from letterparser import ast_lib, parse
+from letterparser.conf import raw_config, parse_raw_config
+from tests import data_path, read_fixture
+
+
+def string_inlines(string):
+    """Str and Space inlines for a plain string"""
+    inlines = []
+    for i, word in enumerate(string.split(" ")):
+        if i > 0:
+            inlines.append({"t": "Space"})
+        inlines.append({"t": "Str", "c": word})
+    return inlines
+
+
+def para(inlines):
+    return {"t": "Para", "c": inlines}
+
+
+def bold_para(string):
+    return para([{"t": "Strong", "c": string_inlines(string)}])
+
+
+@ddt
+class TestRemoveStrikeout(unittest.TestCase):
+    @unpack
+    @data(
+        ("changes are not may", ["are"], "changes not may"),
+        ("changes are not may", ["are", "not"], "changes may"),
+        ("are changes", ["are"], "changes"),
+        ("changes are", ["are"], "changes"),
+    )
+    def test_remove_strikeout(self, string, strike_words, expected):
+        inlines = [
+            {"t": "Strikeout", "c": [inline]}
+            if inline.get("c") in strike_words
+            else inline
+            for inline in string_inlines(string)
+        ]
+        self.assertEqual(ast_lib.inlines_to_jats(inlines), expected)
+
+
+class TestParagraphs(unittest.TestCase):
+    def test_line_break_formatting(self):
+        """line breaks in italic split paragraphs and the italic is repeated in each"""
+        inlines = [
+            {
+                "t": "Emph",
+                "c": string_inlines("First")
+                + [{"t": "LineBreak"}, {"t": "LineBreak"}]
+                + string_inlines("second"),
+            },
+            {"t": "Space"},
+        ]
+        expected = ["<p><italic>First</italic></p>", "<p><italic>second</italic></p>"]
+        self.assertEqual(ast_lib.paragraphs_to_jats(inlines), expected)
+
+    def test_line_break_italic(self):
+        """italic tags either side of a line break are joined as best_jats joins them"""
+        inlines = (
+            [{"t": "Emph", "c": string_inlines("first line")}, {"t": "LineBreak"}]
+            + [{"t": "Emph", "c": string_inlines("second line")}, {"t": "Space"}]
+            + string_inlines("after")
+        )
+        raw_jats_content = (
+            "<p><italic>first line</italic>\n<italic>second line</italic> after</p>"
+        )
+        self.assertEqual(
+            "".join(ast_lib.paragraphs_to_jats(inlines)),
+            parse.best_jats_content(raw_jats_content)[6:-7],
+        )
+
+    def test_empty_paragraph(self):
+        self.assertEqual(ast_lib.paragraphs_to_jats([{"t": "Space"}]), [])
+
+    def test_line_break_paragraph(self):
+        """a paragraph of a line break is left empty, the same as best_jats leaves it"""
+        inlines = [{"t": "Space"}, {"t": "LineBreak"}]
+        self.assertEqual(
+            ast_lib.paragraphs_to_jats(inlines),
+            [parse.best_jats_content("<p>\n</p>")[6:-7]],
+        )
+
+    def test_link(self):
+        inlines = [
+            {
+                "t": "Link",
+                "c": [
+                    ["", [], []],
+                    string_inlines("a & b"),
+                    ["https://example.org", ""],
+                ],
+            }
+        ]
+        expected = (
+            '<p><ext-link ext-link-type="uri" xlink:href="https://example.org">'
+            "a &amp; b</ext-link></p>"
+        )
+        self.assertEqual(ast_lib.paragraphs_to_jats(inlines), [expected])
+
+
+class TestTable(unittest.TestCase):
+    def test_table_1_20(self):
+        """table in the format of pandoc-types 1.20"""
+        content = [
+            [],
+            [{"t": "AlignDefault"}, {"t": "AlignDefault"}],
+            [0, 0],
+            [[], []],
+            [[[{"t": "Plain", "c": string_inlines("One")}], []]],
+        ]
+        expected = (
+            '<table><col align="left" /><col align="left" />'
+            "<tbody><tr><td>One</td><td></td></tr></tbody></table>"
+        )
+        self.assertEqual(ast_lib.table_to_jats(content), expected)
+
+    def test_table_1_22(self):
+        """table in the format of pandoc-types 1.22"""
+
+        def row(string):
+            cell = [
+                ["", [], []],
+                {"t": "AlignDefault"},
+                1,
+                1,
+                [para(string_inlines(string))],
+            ]
+            return [["", [], []], [cell]]
+
+        content = [
+            ["", [], []],
+            [None, []],
+            [[{"t": "AlignDefault"}, {"t": "ColWidthDefault"}]],
+            [["", [], []], [row("Head")]],
+            [[["", [], []], 0, [], [row("Body")]]],
+            [["", [], []], []],
+        ]
+        expected = (
+            '<table><col align="left" />'
+            "<thead><tr><th>Head</th></tr></thead>"
+            "<tbody><tr><td>Body</td></tr></tbody></table>"
+        )
+        self.assertEqual(ast_lib.table_to_jats(content), expected)
+
+    def test_table_spans(self):
+        """merged cells are followed by empty cells as in pandoc-types 1.20"""
+
+        def cell(string, row_span=1, col_span=1):
+            blocks = [para(string_inlines(string))]
+            return [["", [], []], {"t": "AlignDefault"}, row_span, col_span, blocks]
+
+        rows = [[cell("A", row_span=2), cell("B", col_span=2)], [cell("C"), cell("D")]]
+        self.assertEqual(
+            [[len(blocks) for blocks in row] for row in ast_lib.spanned_rows(rows)],
+            [[1, 1, 0], [0, 1, 1]],
+        )
+
+
+@ddt
+class TestFixtureSections(unittest.TestCase):
+    """sections walking the AST are the same as parsing the best JATS"""
+
+    def setUp(self):
+        self.config = parse_raw_config(raw_config("elife"))
+
+    @unpack
+    @data(
+        ("elife-68041.docx", None),
+        ("elife-99999.docx", None),
+        ("list-27798.docx", "list-27798_raw.xml"),
+        ("list-types.docx", "list-types.xml"),
+        ("sections.docx", None),
+        ("strike-through-34497.docx", "strike-through-34497_raw.xml"),
+        ("table-35684.docx", "table-35684_raw.xml"),
+        ("table-42299.docx", "table-42299_raw.xml"),
+        ("table-43333.docx", "table-43333_raw.xml"),
+    )
+    def test_sections(self, docx_file, raw_xml_file):
+        file_name = data_path(docx_file)
+        if raw_xml_file:
+            # the JATS output of pandoc 2.9, the tables of later versions differ
+            jats_content = parse.best_jats_content(read_fixture(raw_xml_file))
+        else:
+            jats_content = parse.best_jats(file_name, config=self.config)
+        expected = [
+            (section.get("section_type"), section.get("content"))
+            for section in parse.sections(jats_content)
+        ]
+        sections = parse.ast_sections(file_name, config=self.config)
+        self.assertEqual(
+            [
+                (section.get("section_type"), section.get("content"))
+                for section in sections
+            ],
+            expected,
+        )
+
+    @data("Dutzler 39122 edit.docx", "list-25776.docx")
+    def test_sections_unsupported(self, docx_file):
+        """math is only converted by pandoc, there are no AST sections"""
+        self.assertIsNone(parse.ast_sections(data_path(docx_file), config=self.config))
+
+
+class TestSections(unittest.TestCase):
+    def test_sections(self):
+        ast = {
+            "blocks": [
+                bold_para("Decision letter"),
+                para(string_inlines("Letter")),
+                bold_para("Author response"),
+                {"t": "BlockQuote", "c": [para(string_inlines("Quote"))]},
+                {
+                    "t": "BulletList",
+                    "c": [[{"t": "Plain", "c": string_inlines("Item")}]],
+                },
+            ]
+        }
+        sections = ast_lib.sections(ast, parse.SECTION_MAP)
+        self.assertEqual(
+            [section.get("section_type") for section in sections],
+            ["decision_letter", "author_response"],
+        )
+        self.assertEqual(
+            sections[0].get("content"),
+            "<p><bold>Decision letter</bold></p><p>Letter</p>",
+        )
+        self.assertEqual(
+            [dict(section) for section in sections[1].get("content_sections")],
+            [
+                {"tag_name": "p", "content": "<p>Quote</p>"},
+                {
+                    "tag_name": "list",
+                    "content": (
+                        '<list list-type="bullet"><list-item><p>Item</p>'
+                        "</list-item></list>"
+                    ),
+                },
+            ],
+        )
+
+    def test_content_section_namespace(self):
+        jats_string = '<p><ext-link xlink:href="https://example.org">a</ext-link></p>'
+        expected = (
+            '<p xmlns:xlink="http://www.w3.org/1999/xlink">'
+            '<ext-link xlink:href="https://example.org">a</ext-link></p>'
+        )
+        self.assertEqual(ast_lib.element_string(jats_string), expected)
+
+
+@ddt
+class TestIsSupported(unittest.TestCase):
+    @unpack
+    @data(
+        ([para(string_inlines("Text"))], True),
+        ([para([{"t": "Math", "c": [{"t": "InlineMath"}, "x"]}])], False),
+        ([para([{"t": "Note", "c": []}])], False),
+    )
+    def test_is_supported(self, blocks, expected):
+        self.assertEqual(ast_lib.is_supported({"blocks": blocks}), expected)
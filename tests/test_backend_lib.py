@@ -0,0 +1,119 @@
+import asyncio
+import unittest
+from letterparser import backend_lib
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def fake_backend(name, outputs, version="2.9.1.1", clock=None):
+    "backend returning the outputs in turn, and counting the probes"
+    outputs = list(outputs)
+    probes = []
+
+    def probe():
+        probes.append(version)
+        return version
+
+    breaker = backend_lib.CircuitBreaker(
+        failure_threshold=2, reset_timeout=60, clock=clock or FakeClock()
+    )
+    backend = backend_lib.Backend(
+        name, lambda file_name, output_format, temp_dir: outputs.pop(0), probe, breaker
+    )
+    return backend, probes
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_circuit_breaker(self):
+        clock = FakeClock()
+        breaker = backend_lib.CircuitBreaker(
+            failure_threshold=2, reset_timeout=60, clock=clock
+        )
+        breaker.record_failure()
+        self.assertFalse(breaker.is_open())
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open())
+        self.assertFalse(breaker.retry_due())
+        clock.now = 60
+        self.assertTrue(breaker.retry_due())
+        breaker.record_success()
+        self.assertFalse(breaker.is_open())
+        self.assertEqual(breaker.failures, 0)
+
+
+class TestBackend(unittest.TestCase):
+    def test_probe_once(self):
+        backend, probes = fake_backend("local", ["<p/>", "<p/>"])
+        self.assertEqual(backend.convert("file_name"), "<p/>")
+        self.assertTrue(backend.available())
+        self.assertTrue(backend.available())
+        self.assertEqual(probes, ["2.9.1.1"])
+        self.assertEqual(backend.version, "2.9.1.1")
+
+    def test_probe_unavailable(self):
+        clock = FakeClock()
+        backend, probes = fake_backend("docker", [], version=None, clock=clock)
+        self.assertFalse(backend.available())
+        self.assertFalse(backend.available())
+        self.assertEqual(len(probes), 1)
+        # re-probe after the reset timeout
+        clock.now = 60
+        self.assertFalse(backend.available())
+        self.assertEqual(len(probes), 2)
+
+
+class TestBackendRegistry(unittest.TestCase):
+    def test_convert_first_backend(self):
+        first, _ = fake_backend("local", ["<p>first</p>"])
+        second, second_probes = fake_backend("docker", ["<p>second</p>"])
+        registry = backend_lib.BackendRegistry([first, second])
+        self.assertEqual(registry.convert("file_name"), "<p>first</p>")
+        # the second backend is not probed when it is not needed
+        self.assertEqual(second_probes, [])
+        self.assertEqual(registry.versions(), {"local": "2.9.1.1"})
+
+    def test_convert_circuit_breaker(self):
+        clock = FakeClock()
+        first, first_probes = fake_backend(
+            "local", [None, None, "<p>first</p>"], clock=clock
+        )
+        second, _ = fake_backend("docker", ["<p>second</p>"] * 3)
+        registry = backend_lib.BackendRegistry([first, second])
+        self.assertEqual(registry.convert("file_name"), "<p>second</p>")
+        self.assertEqual(registry.convert("file_name"), "<p>second</p>")
+        # circuit is now open and the first backend is skipped
+        self.assertEqual(registry.convert("file_name"), "<p>second</p>")
+        self.assertEqual(first_probes, ["2.9.1.1"])
+        # after the reset timeout the first backend is probed and used again
+        clock.now = 60
+        self.assertEqual(registry.convert("file_name"), "<p>first</p>")
+        self.assertEqual(len(first_probes), 2)
+
+    def test_convert_no_backends(self):
+        backend, _ = fake_backend("local", [], version=None)
+        registry = backend_lib.BackendRegistry([backend])
+        self.assertIsNone(registry.convert("file_name"))
+
+    def test_convert_async(self):
+        """the coroutine function is used, otherwise convert runs in a thread"""
+
+        async def convert_async(file_name, output_format, temp_dir):
+            return "<p>async</p>"
+
+        first, _ = fake_backend("local", [None])
+        first.convert_async_function = convert_async
+        second, _ = fake_backend("docker", ["<p>second</p>"])
+        registry = backend_lib.BackendRegistry([first, second])
+        self.assertEqual(
+            asyncio.run(registry.convert_async("file_name")), "<p>async</p>"
+        )
+        registry = backend_lib.BackendRegistry([second])
+        self.assertEqual(
+            asyncio.run(registry.convert_async("file_name")), "<p>second</p>"
+        )
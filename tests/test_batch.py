@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from mock import patch
+from letterparser import batch, generate
+from letterparser.conf import raw_config, parse_raw_config
+from tests import data_path
+
+
+class TestGenerateXmlFromFiles(unittest.TestCase):
+    def setUp(self):
+        self.config = parse_raw_config(raw_config("elife"))
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_generate_xml_from_files(self):
+        """results are in the order of the files and errors are returned"""
+        file_names = [
+            data_path("elife-39122.zip"),
+            data_path("missing.docx"),
+            data_path("list-27798.docx"),
+        ]
+        results = list(
+            batch.generate_xml_from_files(
+                file_names, config=self.config, temp_dir=self.temp_dir, max_workers=2
+            )
+        )
+        self.assertEqual([result.file_name for result in results], file_names)
+        self.assertEqual(
+            results[0].xml,
+            generate.generate_xml_from_file(file_names[0], config=self.config),
+        )
+        self.assertIsNone(results[1].xml)
+        self.assertTrue("FileNotFoundError" in results[1].error)
+        self.assertIsNone(results[2].error)
+        # worker temp directories are removed when the workers exit
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def test_generate_xml_from_files_as_completed(self):
+        file_names = [data_path("list-27798.docx"), data_path("elife-39122.zip")]
+        results = batch.generate_xml_from_files(
+            file_names, config=self.config, temp_dir=self.temp_dir, ordered=False
+        )
+        self.assertEqual(
+            sorted(result.file_name for result in results), sorted(file_names)
+        )
+
+
+class TestConvertFile(unittest.TestCase):
+    @patch.object(generate, "generate_xml_from_file")
+    def test_convert_file_conversion_error(self, fake_generate_xml_from_file):
+        fake_generate_xml_from_file.side_effect = zipfile.BadZipFile()
+        result = batch.convert_file("file_name")
+        self.assertIsNone(result.xml)
+        self.assertTrue("BadZipFile" in result.error)
+
+    @patch.object(generate, "generate_xml_from_file")
+    def test_convert_file_exception(self, fake_generate_xml_from_file):
+        """an error which is not from the file is raised"""
+        fake_generate_xml_from_file.side_effect = TypeError()
+        with self.assertRaises(TypeError):
+            batch.convert_file("file_name")
@@ -4,6 +4,7 @@ import sys
 import unittest
 from collections import OrderedDict
 from xml.etree import ElementTree
+from xml.etree.ElementTree import Element
 from elifearticle.article import Article, ContentBlock
 from letterparser import build
 from letterparser.generate import output_xml
@@ -68,6 +69,51 @@ class TestSplitContentSections(unittest.TestCase):
         self.assertEqual(sections, expected)
 
 
+class TestSplitContentElements(unittest.TestCase):
+    def test_split_content_elements(self):
+        section = {
+            "content": "<p>One</p><list><list-item><p>Two</p></list-item></list>"
+        }
+        result = build.split_content_elements(section)
+        self.assertEqual([section["tag_name"] for section in result], ["p", "list"])
+        self.assertEqual(result[0]["content"], "<p>One</p>")
+        self.assertEqual(result[0]["element"].text, "One")
+        self.assertEqual(result[1]["element"].tag, "list")
+
+
+class TestElementContentBlock(unittest.TestCase):
+    def test_content(self):
+        """content is rendered from the Element when it is read"""
+        fig_tag = build.fig_element("Author response image 1.", "Title.", None)
+        content_block = build.ElementContentBlock("fig", fig_tag)
+        fig_tag.find("graphic").set("xlink:href", "elife-00666-sa2-fig1")
+        self.assertEqual(
+            content_block.content,
+            (
+                "<label>Author response image 1.</label>"
+                "<caption><title>Title.</title></caption>"
+                '<graphic mimetype="image" xlink:href="elife-00666-sa2-fig1" />'
+            ),
+        )
+
+    def test_set_content(self):
+        """setting the content replaces the Element"""
+        content_block = build.ElementContentBlock("p", Element("p"), content="One")
+        content_block.content = "Two"
+        self.assertEqual(content_block.content, "Two")
+        self.assertIsNone(content_block.element)
+
+
+class TestProcessListContent(unittest.TestCase):
+    def test_process_list_content_element(self):
+        """list-type is replaced in the Element as it is in the content"""
+        content = '<list list-type="order"><list-item><p>Item</p></list-item></list>'
+        element = ElementTree.fromstring(content)
+        result = build.process_list_content(content, element=element)
+        self.assertEqual(result[2], {"list-type": "number"})
+        self.assertEqual(element.get("list-type"), "number")
+
+
 class TestCleanMath(unittest.TestCase):
     def test_clean_math_alternatives(self):
         xml_string = (
@@ -178,6 +224,23 @@ class TestExtractLabelTitleContent(unittest.TestCase):
         )
 
 
+class TestCaptionTitleEnd(unittest.TestCase):
+    def test_caption_title_end(self):
+        remainder = "In <italic>B. subtilis</italic>, the title. Caption."
+        self.assertEqual(build.caption_title_end(remainder), 43)
+
+    def test_caption_title_end_ext_link(self):
+        "full stops in ext-link attributes and text are skipped"
+        remainder = (
+            '<ext-link xlink:href="https://example.org/a.b">et al.</ext-link> title.'
+        )
+        self.assertEqual(build.caption_title_end(remainder), len(remainder))
+
+    def test_caption_title_end_unbalanced(self):
+        remainder = "The <bold>title. Caption."
+        self.assertEqual(build.caption_title_end(remainder), -1)
+
+
 class TestBuildFig(unittest.TestCase):
     def test_build_fig(self):
         content = read_fixture("author_response_fig_content.txt")
@@ -256,6 +319,72 @@ class TestBuildTableWrapElement(unittest.TestCase):
         self.assertEqual(tag_xml, expected)
 
 
+class TestTableSectionElement(unittest.TestCase):
+    def setUp(self):
+        self.title_content = (
+            "<bold>Author response table 1.</bold>"
+            "&lt;Author response table 1 title/legend&gt;"
+            "Author response table.&lt;/Author response table 1 title/legend&gt;"
+        )
+
+    def table_wrap_xml(self, title_content, table):
+        table_content = build.build_table_wrap_parts(title_content, table)
+        tag_content = build.table_wrap_element(
+            table_content.get("label"),
+            table_content.get("title"),
+            table_content.get("content"),
+            table_content.get("table"),
+        )
+        return ElementTree.tostring(tag_content)
+
+    def assert_same_table_wrap(self, content):
+        element = ElementTree.fromstring(content)
+        table_tag = build.table_section_element(self.title_content, content, element)
+        self.assertIsNotNone(table_tag)
+        self.assertEqual(
+            self.table_wrap_xml(self.title_content, table_tag),
+            self.table_wrap_xml(self.title_content, content),
+        )
+
+    def test_table_section_element(self):
+        "col tags are removed and break tags in cells are escaped"
+        content = (
+            '<table> <col align="left" /><col align="left" /><thead><tr><th>A</th>'
+            "<th>B</th></tr></thead><tbody><tr><td><italic>a</italic> &amp; 1"
+            "<break />2</td><td /></tr></tbody> </table>"
+        )
+        self.assert_same_table_wrap(content)
+
+    def test_table_section_element_large_table(self):
+        rows = "".join(
+            "<tr>%s</tr>"
+            % "".join("<td>%s.%s<break />n</td>" % (row, col) for col in range(10))
+            for row in range(500)
+        )
+        content = "<table>%s<tbody>%s</tbody></table>" % (
+            '<col align="left" />' * 10,
+            rows,
+        )
+        self.assert_same_table_wrap(content)
+
+    def test_table_section_element_tail(self):
+        "the content string is used if the table has text after it"
+        content = "<table><tbody><tr><td>1</td></tr></tbody></table>"
+        element = ElementTree.fromstring(content)
+        element.tail = " text"
+        self.assertIsNone(
+            build.table_section_element(self.title_content, content, element)
+        )
+
+    def test_table_section_element_escaped_tag(self):
+        "the content string is used if a tag is escaped as text"
+        content = "<table><tbody><tr><td><unknown>1</unknown></td></tr></tbody></table>"
+        element = ElementTree.fromstring(content)
+        self.assertIsNone(
+            build.table_section_element(self.title_content, content, element)
+        )
+
+
 class TestBuildSubArticle(unittest.TestCase):
     def setUp(self):
         self.config = parse_raw_config(raw_config("elife"))
@@ -1,7 +1,9 @@
 # coding=utf-8
 
+import concurrent.futures
+import os
 import unittest
-from letterparser import build, parse
+from letterparser import build, generate, parse
 from letterparser.conf import raw_config, parse_raw_config
 from tests import data_path
 
@@ -118,3 +120,68 @@ class TestBuildArticles(unittest.TestCase):
         self.assertEqual(articles[0].id, "sa2")
         self.assertEqual(articles[0].content_blocks[0].block_type, "p")
         self.assertEqual(articles[0].content_blocks[0].content, "Test")
+
+    def test_build_articles_build_processes(self):
+        """sub-articles built in worker processes are in the order of the sections"""
+        self.config["build_processes"] = 2
+        jats_content = (
+            "<p><bold>eLife assessment</bold></p><p>Assessment</p>"
+            "<p><bold>Preamble</bold></p>"
+            '<p><ext-link xlink:href="https://sciety.org/test">Link</ext-link></p>'
+            "<p><bold>Decision letter</bold></p><p>Decision</p>"
+            "<p><bold>Author response</bold></p><p>Response</p>"
+        )
+        articles = build.build_articles(jats_content, config=self.config)
+        self.assertEqual([article.id for article in articles], ["sa0", "sa1", "sa2"])
+        self.assertEqual(
+            [article.article_type for article in articles],
+            ["editor-report", "decision-letter", "reply"],
+        )
+        self.assertEqual(
+            [article.content_blocks[-1].content for article in articles],
+            ["Assessment", "Decision", "Response"],
+        )
+        self.assertEqual(
+            articles[0].related_articles[0].xlink_href, "https://sciety.org/test"
+        )
+        build.shutdown_build_executors()
+
+    def test_build_articles_build_processes_broken_pool(self):
+        """a pool with a dead worker process is replaced and the sections still built"""
+        self.config["build_processes"] = 2
+        jats_content = (
+            "<p><bold>Decision letter</bold></p><p>Decision</p>"
+            "<p><bold>Author response</bold></p><p>Response</p>"
+        )
+        executor = build.build_executor(2)
+        with self.assertRaises(concurrent.futures.process.BrokenProcessPool):
+            executor.submit(os._exit, 1).result()
+        articles = build.build_articles(jats_content, config=self.config)
+        self.assertEqual(
+            [article.content_blocks[-1].content for article in articles],
+            ["Decision", "Response"],
+        )
+        self.assertFalse(build.build_executor(2) is executor)
+        articles = build.build_articles(jats_content, config=self.config)
+        self.assertEqual(len(articles), 2)
+        build.shutdown_build_executors()
+
+    def test_build_articles_build_processes_non_ascii(self):
+        """non-ASCII text and MathML built in worker processes are unchanged"""
+        jats_content = (
+            "<p><bold>Decision letter</bold></p><p>Add 5 µM to the café.</p>"
+            "<p><bold>Author response</bold></p><p>Reply with "
+            "<inline-formula><alternatives><tex-math>x</tex-math>"
+            "<mml:math><mml:mi>x</mml:mi></mml:math></alternatives></inline-formula>"
+            " – “maths”.</p>"
+        )
+        expected = generate.output_xml(
+            generate.generate(build.build_articles(jats_content, config=self.config))
+        )
+        self.config["build_processes"] = 2
+        articles = build.build_articles(jats_content, config=self.config)
+        self.assertEqual(
+            articles[0].content_blocks[-1].content, "Add 5 µM to the café."
+        )
+        self.assertEqual(generate.output_xml(generate.generate(articles)), expected)
+        build.shutdown_build_executors()
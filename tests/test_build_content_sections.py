@@ -24,6 +24,24 @@ class TestProcessContentSections(unittest.TestCase):
         self.assertEqual(result[0].block_type, "p")
         self.assertEqual(result[0].content, "Hello!")
 
+    def test_process_content_sections_content_class(self):
+        """the content class is cached on the section"""
+        content_sections = [
+            OrderedDict(
+                [
+                    ("tag_name", "p"),
+                    ("content", "<p>&lt;Author response image 1&gt;</p>"),
+                ]
+            )
+        ]
+        processor = build.ContentSectionProcessor(self.prefs)
+        processor.process(content_sections)
+        self.assertEqual(
+            content_sections[0].get("content_class"), build.CONTENT_FIG_START
+        )
+        self.assertEqual(processor.content_blocks[0].block_type, "fig")
+        self.assertFalse(hasattr(processor, "__dict__"))
+
     def test_process_content_sections_namespace(self):
         content_sections = [
             OrderedDict(
@@ -48,6 +48,43 @@ class TestMatchPatterns(unittest.TestCase):
             test_data.get("expected"),
         )
 
+    @data(
+        {"content": "", "expected": False},
+        {
+            "content": (
+                "&lt;Author response image 1 title/legend&gt;Title."
+                "&lt;/Author response image 1 title/legend&gt;"
+            ),
+            "expected": True,
+        },
+        {"content": "&lt;Author response image 1 title/legend&gt;", "expected": True},
+        {"content": "Author response image 1 title/legend&gt;", "expected": False},
+        {"content": "&lt;image 1 title/legend&gt; text", "expected": False},
+        {"content": "&lt;image 1 " * 500, "expected": False},
+    )
+    def test_match_fig_content_title_end(self, test_data):
+        self.assertEqual(
+            build.match_fig_content_title_end(test_data.get("content")),
+            test_data.get("expected"),
+        )
+
+    @data(
+        {"content": "", "expected": False},
+        {"content": "<bold>Author response table 1.</bold>", "expected": True},
+        {"content": "&lt;Author response table 1&gt;", "expected": True},
+        {"content": "&lt;Author response table 1&gt; text", "expected": True},
+        {"content": "&lt; Author response table 1&gt;", "expected": True},
+        {"content": "&lt;Table 1&gt;", "expected": False},
+        {"content": "&lt;Author-response table 1&gt;", "expected": False},
+        {"content": "content &lt;Author response table 1&gt;", "expected": False},
+        {"content": "&lt;" + "a " * 500 + "table 1 " * 500, "expected": False},
+    )
+    def test_match_table_content_start(self, test_data):
+        self.assertEqual(
+            build.match_table_content_start(test_data.get("content")),
+            test_data.get("expected"),
+        )
+
     @data(
         {"content": "", "expected": False},
         {"content": "<italic></italic>", "expected": True},
@@ -72,3 +109,38 @@ class TestMatchPatterns(unittest.TestCase):
             build.match_disp_quote_content(test_data.get("content")),
             test_data.get("expected"),
         )
+
+    @data(
+        {"content": "", "expected": 0},
+        {"content": "Plain paragraph.", "expected": 0},
+        {
+            "content": "&lt;Author response image 1&gt;",
+            "expected": build.CONTENT_FIG_START,
+        },
+        {
+            "content": (
+                "&lt;Author response image 1 title/legend&gt;"
+                "<bold>Author response image 1.</bold> Title."
+                "&lt;/Author response image 1 title/legend&gt;"
+            ),
+            "expected": build.CONTENT_FIG_TITLE_START | build.CONTENT_FIG_TITLE_END,
+        },
+        {
+            "content": "&lt;Author response video 1&gt;",
+            "expected": build.CONTENT_VIDEO_START,
+        },
+        {
+            "content": "<bold>Author response table 1.</bold>",
+            "expected": build.CONTENT_TABLE_START,
+        },
+        {"content": "<italic>Quote.</italic>", "expected": build.CONTENT_DISP_QUOTE},
+        {
+            "content": "<disp-formula>x</disp-formula>",
+            "expected": build.CONTENT_DISP_FORMULA,
+        },
+    )
+    def test_content_class(self, test_data):
+        self.assertEqual(
+            build.content_class(test_data.get("content")),
+            test_data.get("expected"),
+        )
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from letterparser import cache_lib
+
+
+class TestCacheKey(unittest.TestCase):
+    def test_cache_key(self):
+        self.assertEqual(
+            cache_lib.cache_key("digest", "local 2.9.1.1", ["native"]),
+            cache_lib.cache_key("digest", "local 2.9.1.1", ["native"]),
+        )
+        self.assertNotEqual(
+            cache_lib.cache_key("digest", "local 2.9.1.1"),
+            cache_lib.cache_key("digest", "local 2.19.2"),
+        )
+
+
+class TestMemoryCache(unittest.TestCase):
+    def test_least_recently_used(self):
+        cache = cache_lib.MemoryCache(2)
+        cache.set("one", "1")
+        cache.set("two", "2")
+        # using one makes two the least recently used
+        self.assertEqual(cache.get("one"), "1")
+        cache.set("three", "3")
+        self.assertEqual(list(cache.entries), ["one", "three"])
+        self.assertIsNone(cache.get("two"))
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_set(self):
+        cache = cache_lib.DiskCache(self.directory)
+        self.assertIsNone(cache.get("key"))
+        cache.set("key", "<p>α</p>")
+        self.assertEqual(cache_lib.DiskCache(self.directory).get("key"), "<p>α</p>")
+
+    def test_evict(self):
+        """the least recently used files are removed to fit the size"""
+        cache = cache_lib.DiskCache(self.directory, 10)
+        cache.set("one", "12345")
+        cache.set("two", "12345")
+        past = time.time() - 60
+        os.utime(cache.path("one"), (past, past))
+        cache.set("three", "12345")
+        self.assertIsNone(cache.get("one"))
+        self.assertEqual(cache.get("two"), "12345")
+        self.assertEqual(cache.get("three"), "12345")
+
+
+class TestConversionCache(unittest.TestCase):
+    def test_tiers(self):
+        """an entry found on disk is copied to memory and hits are counted"""
+        directory = tempfile.mkdtemp()
+        try:
+            cache_lib.DiskCache(directory).set("key", "value")
+            cache = cache_lib.create_cache(memory_size=2, directory=directory)
+            self.assertEqual(cache.get("key"), "value")
+            self.assertEqual(cache.tiers[0].get("key"), "value")
+            self.assertIsNone(cache.get("other"))
+            self.assertEqual(cache.stats(), {"hits": 1, "misses": 1})
+        finally:
+            shutil.rmtree(directory)
@@ -22,6 +22,11 @@ class TestConf(unittest.TestCase):
         self.int_expected = 42
         self.list_value = "[1,1,2,3,5]"
         self.list_expected = [1, 1, 2, 3, 5]
+        # keep the library values to restore them after each test
+        self.library_values = (conf.BOOLEAN_VALUES, conf.INT_VALUES, conf.LIST_VALUES)
+
+    def tearDown(self):
+        conf.BOOLEAN_VALUES, conf.INT_VALUES, conf.LIST_VALUES = self.library_values
 
     def test_load_config(self):
         "check building default configuration"
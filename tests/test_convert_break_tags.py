@@ -115,3 +115,36 @@ class TestConvertBreakTags(unittest.TestCase):
         )
         result = parse.convert_break_tags(jats_content)
         self.assertEqual(result, expected)
+
+    def test_convert_break_tags_nested_tags(self):
+        """open tags are closed and opened again in the order they are nested"""
+        jats_content = (
+            "<p><italic>One <bold>two.<break /><break />Three</bold> four.</italic></p>"
+        )
+        expected = (
+            "<p><italic>One <bold>two.</bold></italic></p>"
+            "<p><italic><bold>Three</bold> four.</italic></p>"
+        )
+        result = parse.convert_break_tags(jats_content)
+        self.assertEqual(result, expected)
+
+    def test_convert_break_tags_table_td_many(self):
+        jats_content = (
+            "<table><tr><td>A<break /><break />B<break /><break />C</td></tr></table>"
+        )
+        expected = "<table><tr><td>A<break />B<break />C</td></tr></table>"
+        result = parse.convert_break_tags(jats_content)
+        self.assertEqual(result, expected)
+
+    def test_convert_break_tags_between_tables(self):
+        """break tags in a paragraph between tables are not table break tags"""
+        jats_content = (
+            "<table><tr><td>A</td></tr></table><p>One.<break /><break />Two.</p>"
+            "<table><tr><td>B</td></tr></table>"
+        )
+        expected = (
+            "<table><tr><td>A</td></tr></table><p>One.</p><p>Two.</p>"
+            "<table><tr><td>B</td></tr></table>"
+        )
+        result = parse.convert_break_tags(jats_content)
+        self.assertEqual(result, expected)
@@ -1,19 +1,46 @@
+import asyncio
+import os
 import unittest
 from mock import patch
+import docker
 from letterparser import docker_lib
 
 
+class FakeContainer:
+    def __init__(self, output=b"", exit_code=0, status="running"):
+        self.output = output
+        self.exit_code = exit_code
+        self.status = status
+        self.removed = False
+        self.commands = []
+
+    def reload(self):
+        pass
+
+    def remove(self, **kwargs):
+        self.removed = True
+
+    def exec_run(self, cmd, **kwargs):
+        self.commands.append(cmd)
+        return self.exit_code, self.output
+
+
 class FakeContainerCollection:
-    def __init__(self, output):
+    def __init__(self, output, containers=None):
         self.output = output
+        self.containers = containers or []
+        self.run_kwargs = []
 
     def run(self, *args, **kwargs):
+        self.run_kwargs.append(kwargs)
+        if kwargs.get("detach"):
+            return self.containers.pop(0)
         return self.output
 
 
 class FakeClient:
-    def __init__(self, output):
-        self.containers = FakeContainerCollection(output)
+    def __init__(self, output, containers=None):
+        self.containers = FakeContainerCollection(output, containers)
 
 
 class TestDockerLib(unittest.TestCase):
@@ -25,3 +52,170 @@ class TestDockerLib(unittest.TestCase):
         docker_image = "example/image_name_for_test_case"
         fake_get_docker_client.return_value = FakeClient(output)
         self.assertEqual(docker_lib.call_pandoc("file_name", docker_image), expected)
+
+    @patch.object(docker_lib, "get_docker_client")
+    def test_call_pandoc_removes_container(self, fake_get_docker_client):
+        client = FakeClient(b"")
+        fake_get_docker_client.return_value = client
+        docker_lib.call_pandoc("file_name", "example/image_name_for_test_case")
+        self.assertTrue(client.containers.run_kwargs[0].get("remove"))
+
+    @patch.object(docker_lib, "get_docker_client")
+    def test_call_pandoc_lua_filter(self, fake_get_docker_client):
+        client = FakeClient(b"")
+        fake_get_docker_client.return_value = client
+        lua_filter = os.path.abspath(os.path.join("filters", "normalise.lua"))
+        docker_lib.call_pandoc(
+            "file_name", "example/image_name_for_test_case", lua_filter=lua_filter
+        )
+        volumes = client.containers.run_kwargs[0].get("volumes")
+        self.assertEqual(
+            volumes.get(os.path.dirname(lua_filter)),
+            {"bind": "/filters", "mode": "ro"},
+        )
+
+    @patch.object(docker_lib, "get_docker_client")
+    def test_call_pandoc_bytes(self, fake_get_docker_client):
+        """the docx bytes are only on disk while the container reads them"""
+        client = FakeClient(b"something")
+        fake_get_docker_client.return_value = client
+        output = docker_lib.call_pandoc_bytes(
+            b"docx", "example/image_name_for_test_case"
+        )
+        self.assertEqual(output, "something")
+        volumes = client.containers.run_kwargs[0].get("volumes")
+        self.assertTrue(docker_lib.BYTES_WORK_DIR in volumes)
+        self.assertEqual(os.listdir(docker_lib.BYTES_WORK_DIR), [])
+
+    @patch.object(docker_lib, "get_docker_client")
+    def test_call_pandoc_async(self, fake_get_docker_client):
+        fake_get_docker_client.return_value = FakeClient(b"something")
+        output = asyncio.run(
+            docker_lib.call_pandoc_async(
+                "file_name", "example/image_name_for_test_case"
+            )
+        )
+        self.assertEqual(output, "something")
+
+    @patch.object(docker, "from_env")
+    def test_get_docker_client(self, fake_from_env):
+        "the client is created once and shared"
+        fake_from_env.return_value = FakeClient(b"")
+        docker_lib.DOCKER_CLIENT = None
+        client = docker_lib.get_docker_client()
+        self.assertEqual(docker_lib.get_docker_client(), client)
+        self.assertEqual(fake_from_env.call_count, 1)
+        docker_lib.DOCKER_CLIENT = None
+
+
+class TestContainerPool(unittest.TestCase):
+    def setUp(self):
+        self.docker_image = "example/image_name_for_test_case"
+        self.work_dir = os.path.abspath("tmp")
+
+    def tearDown(self):
+        docker_lib.close_container_pools()
+
+    @patch.object(docker_lib, "get_docker_client")
+    def test_call_pandoc(self, fake_get_docker_client):
+        container = FakeContainer(b"something")
+        fake_get_docker_client.return_value = FakeClient(b"", [container])
+        output = docker_lib.call_pandoc(
+            os.path.join("tmp", "file_name.docx"), self.docker_image, pool_size=1
+        )
+        self.assertEqual(output, "something")
+        self.assertEqual(
+            container.commands,
+            [["pandoc", "--wrap=none", "--to=jats", "/data/file_name.docx"]],
+        )
+        # the container is reused for the next call
+        docker_lib.call_pandoc(
+            os.path.join("tmp", "file_name.docx"), self.docker_image, pool_size=1
+        )
+        self.assertEqual(len(container.commands), 2)
+
+    @patch.object(docker_lib, "get_docker_client")
+    def test_call_pandoc_workspaces(self, fake_get_docker_client):
+        """conversions in workspaces of the same temp_dir share the pool"""
+        container = FakeContainer(b"something")
+        fake_get_docker_client.return_value = FakeClient(b"", [container])
+        for workspace in ["letterparser-one", "letterparser-two"]:
+            docker_lib.call_pandoc(
+                os.path.join("tmp", workspace, "file_name.docx"),
+                self.docker_image,
+                pool_size=1,
+                work_dir="tmp",
+            )
+        self.assertEqual(
+            container.commands[-1],
+            [
+                "pandoc",
+                "--wrap=none",
+                "--to=jats",
+                "/data/letterparser-two/file_name.docx",
+            ],
+        )
+
+    @patch.object(docker_lib, "get_docker_client")
+    def test_call_pandoc_lua_filter(self, fake_get_docker_client):
+        container = FakeContainer(b"something")
+        client = FakeClient(b"", [container])
+        fake_get_docker_client.return_value = client
+        lua_filter = os.path.abspath(os.path.join("filters", "normalise.lua"))
+        pool = docker_lib.ContainerPool(
+            self.docker_image, self.work_dir, lua_filter=lua_filter
+        )
+        pool.call_pandoc(os.path.join("tmp", "file_name.docx"))
+        self.assertEqual(
+            container.commands,
+            [
+                [
+                    "pandoc",
+                    "--wrap=none",
+                    "--to=jats",
+                    "--lua-filter=/filters/normalise.lua",
+                    "/data/file_name.docx",
+                ]
+            ],
+        )
+        self.assertTrue(
+            os.path.dirname(lua_filter)
+            in client.containers.run_kwargs[0].get("volumes")
+        )
+
+    @patch.object(docker_lib, "get_docker_client")
+    def test_replace_dead_container(self, fake_get_docker_client):
+        dead_container = FakeContainer(status="exited")
+        container = FakeContainer(b"something")
+        fake_get_docker_client.return_value = FakeClient(
+            b"", [dead_container, container]
+        )
+        pool = docker_lib.ContainerPool(self.docker_image, self.work_dir)
+        output = pool.call_pandoc(os.path.join("tmp", "file_name.docx"))
+        self.assertEqual(output, "something")
+        self.assertTrue(dead_container.removed)
+        self.assertEqual(dead_container.commands, [])
+
+    @patch.object(docker_lib, "get_docker_client")
+    def test_call_pandoc_exit_code(self, fake_get_docker_client):
+        container = FakeContainer(b"error", exit_code=1)
+        fake_get_docker_client.return_value = FakeClient(b"", [container])
+        pool = docker_lib.ContainerPool(self.docker_image, self.work_dir)
+        with self.assertRaises(docker.errors.ContainerError):
+            pool.call_pandoc(os.path.join("tmp", "file_name.docx"))
+        # container is returned to the pool
+        self.assertEqual(pool.containers.qsize(), 1)
+
+    def test_container_path_outside_work_dir(self):
+        pool = docker_lib.ContainerPool(self.docker_image, self.work_dir)
+        with self.assertRaises(ValueError):
+            pool.container_path(os.path.join("tests", "file_name.docx"))
+
+    @patch.object(docker_lib, "get_docker_client")
+    def test_close(self, fake_get_docker_client):
+        containers = [FakeContainer(), FakeContainer()]
+        fake_get_docker_client.return_value = FakeClient(b"", list(containers))
+        pool = docker_lib.ContainerPool(self.docker_image, self.work_dir, size=2)
+        pool.start()
+        pool.close()
+        self.assertTrue(all(container.removed for container in containers))
@@ -0,0 +1,94 @@
+import unittest
+from ddt import ddt, data, unpack
+from letterparser import docx_lib, generate, parse
+from letterparser.conf import raw_config, parse_raw_config
+from tests import data_path, read_fixture
+
+
+@ddt
+class TestNativeRawJats(unittest.TestCase):
+    """native reader output compared to the pandoc output fixtures"""
+
+    def setUp(self):
+        self.config = parse_raw_config(raw_config("elife"))
+        self.config["docx_reader"] = "native"
+
+    @unpack
+    @data(
+        ("list-27798.docx", "list-27798_raw.xml"),
+        ("list-types.docx", "list-types.xml"),
+        ("strike-through-34497.docx", "strike-through-34497_raw.xml"),
+        ("table-35684.docx", "table-35684_raw.xml"),
+        ("table-42299.docx", "table-42299_raw.xml"),
+        ("table-43333.docx", "table-43333_raw.xml"),
+    )
+    def test_raw_jats(self, docx_file, xml_file):
+        file_name = data_path(docx_file)
+        expected = read_fixture(xml_file)
+        jats_content = parse.raw_jats(file_name, config=self.config)
+        self.assertEqual(jats_content, expected)
+
+    def test_sections(self):
+        """there is no raw pandoc fixture for sections.docx, compare its sections"""
+        file_name = data_path("sections.docx")
+        expected = read_fixture("sections_sections.py")
+        jats_content = parse.best_jats(file_name, config=self.config)
+        self.assertEqual(parse.sections(jats_content), expected)
+
+    @unpack
+    @data(
+        ("elife-68041.docx", "elife-68041.xml"),
+        ("elife-99999.docx", "elife-99999.xml"),
+    )
+    def test_generate_xml(self, docx_file, xml_file):
+        """there are no raw pandoc fixtures for these, compare the generated XML"""
+        file_name = data_path(docx_file)
+        expected = read_fixture(xml_file, mode="rb")
+        pretty_xml = generate.generate_xml_from_docx(
+            file_name, pretty=True, indent="    ", config=self.config
+        )
+        self.assertEqual(pretty_xml, expected)
+
+
+@ddt
+class TestNativeSupported(unittest.TestCase):
+    @unpack
+    @data(
+        ("Dutzler 39122 edit.docx", False),
+        ("list-25776.docx", False),
+        ("list-27798.docx", True),
+        ("sections.docx", True),
+    )
+    def test_native_supported(self, docx_file, expected):
+        self.assertEqual(docx_lib.native_supported(data_path(docx_file)), expected)
+
+
+class TestCombineInlines(unittest.TestCase):
+    def test_combine_shared_formatting(self):
+        first = [["italic", [["str", "periodic"]], {}]]
+        second = [["italic", [["space"]], {}], ["italic", [["str", "testing"]], {}]]
+        expected = [
+            ["italic", [["str", "periodic"], ["space"], ["str", "testing"]], {}]
+        ]
+        inlines = docx_lib.combine_inlines(first, second)
+        inlines = docx_lib.combine_inlines(inlines, [])
+        self.assertEqual(inlines, expected)
+
+    def test_combine_space_out(self):
+        first = [["italic", [["str", "cycle"], ["space"]], {}]]
+        second = [["str", "and"]]
+        expected = [["italic", [["str", "cycle"]], {}], ["space"], ["str", "and"]]
+        self.assertEqual(docx_lib.combine_inlines(first, second), expected)
+
+
+@ddt
+class TestListMarker(unittest.TestCase):
+    @unpack
+    @data(
+        (1, "order", "one-paren", "1)"),
+        (2, "alpha-lower", "two-parens", "(b)"),
+        (4, "roman-upper", "period", "IV."),
+        (3, "order", None, "3."),
+    )
+    def test_list_marker(self, number, list_type, delim, expected):
+        self.assertEqual(docx_lib.list_marker(number, list_type, delim), expected)
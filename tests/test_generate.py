@@ -1,16 +1,23 @@
 # coding=utf-8
 
+import asyncio
+import concurrent.futures
+import io
+import os
 import sys
 import unittest
+import zipfile
 from collections import OrderedDict
 from xml.etree import ElementTree
 from xml.etree.ElementTree import Element, SubElement
+from mock import patch
 from ddt import ddt, data
 from elifearticle.article import ContentBlock
 from jatsgenerator import build as jats_build
-from letterparser import generate
+from letterparser import build, docker_lib, generate, parse, zip_lib
 from letterparser.conf import raw_config, parse_raw_config
 from tests import data_path, helpers, read_fixture
+from tests.test_docker_lib import FakeClient, FakeContainer
 
 
 def simple_decision_letter():
@@ -172,6 +179,194 @@ class TestGenerateFromZip(unittest.TestCase):
         )
         self.assertIsNotNone(pretty_xml)
 
+    @patch.object(zip_lib.ZipManifest, "extract_assets")
+    def test_generate_xml_from_zip_assets_not_extracted(self, fake_extract_assets):
+        """the asset files are renamed without extracting them"""
+        file_name = data_path("elife-39122.zip")
+        config = parse_raw_config(raw_config("elife"))
+        xml = generate.generate_xml_from_zip(file_name, config=config)
+        self.assertTrue(b'xlink:href="elife-39122-sa2-fig1.jpg"' in xml)
+        self.assertEqual(fake_extract_assets.call_count, 0)
+
+
+class TestGenerateFromZipDockerPool(unittest.TestCase):
+    def setUp(self):
+        self.config = parse_raw_config(raw_config("elife"))
+        self.config["docker_pool_size"] = 1
+        parse.reset_backend_registries()
+
+    def tearDown(self):
+        parse.reset_backend_registries()
+        docker_lib.close_container_pools()
+
+    @patch.object(docker_lib, "get_docker_client")
+    @patch.object(parse, "docker_pandoc_version")
+    @patch.object(parse, "pandoc_version")
+    def test_generate_xml_from_zip_docker_pool(
+        self, fake_pandoc_version, fake_docker_pandoc_version, fake_get_docker_client
+    ):
+        """zip files converted in the same temp_dir share the pool of containers"""
+        fake_pandoc_version.return_value = None
+        fake_docker_pandoc_version.return_value = "2.9.1.1"
+        container = FakeContainer(b"<p><bold>Author response</bold></p><p>Test</p>")
+        # a second pool would fail to start a container
+        fake_get_docker_client.return_value = FakeClient(b"", [container])
+        file_name = data_path("elife-39122.zip")
+        for _ in range(2):
+            generate.generate_xml_from_zip(file_name, config=self.config)
+        self.assertEqual(len(container.commands), 2)
+        self.assertEqual(len(docker_lib.CONTAINER_POOLS), 1)
+        self.assertEqual(
+            list(docker_lib.CONTAINER_POOLS.values())[0].work_dir,
+            os.path.abspath("tmp"),
+        )
+
+
+class TestGeneratePackageFromZip(unittest.TestCase):
+    def test_generate_package_from_zip(self):
+        """the package contains the same XML and the asset files"""
+        file_name = data_path("elife-39122.zip")
+        config = parse_raw_config(raw_config("elife"))
+        output = io.BytesIO()
+        xml_file_name = generate.generate_package_from_zip(
+            file_name, output, config=config
+        )
+        self.assertEqual(xml_file_name, "elife-39122.xml")
+        with zipfile.ZipFile(output) as open_zip:
+            self.assertEqual(
+                open_zip.namelist(),
+                [
+                    "elife-39122.xml",
+                    "elife-39122-sa2-fig1.jpg",
+                    "elife-39122-sa2-fig2.jpg",
+                ],
+            )
+            self.assertEqual(
+                open_zip.read(xml_file_name),
+                generate.generate_xml_from_zip(file_name, config=config),
+            )
+
+    def test_package_file_name_map(self):
+        root = Element("root")
+        SubElement(root, "graphic").set("xlink:href", "elife-39122-sa2-fig1.jpg")
+        SubElement(root, "media").set("xlink:href", "elife-39122-sa2-video1.mp4")
+        file_names = ["elife-39122-sa2-fig1.jpg", "elife-39122-sa2-video1.mov"]
+        self.assertEqual(
+            generate.package_file_name_map(root, file_names),
+            OrderedDict([("elife-39122-sa2-video1.mov", "elife-39122-sa2-video1.mp4")]),
+        )
+
+
+class TestGenerateConcurrent(unittest.TestCase):
+    def test_generate_xml_from_file_threads(self):
+        """conversions sharing a temp_dir do not affect each other"""
+        config = parse_raw_config(raw_config("elife"))
+        file_names = [data_path("elife-39122.zip"), data_path("list-27798.docx")] * 2
+        expected = [
+            generate.generate_xml_from_file(file_name, config=config)
+            for file_name in file_names
+        ]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            outputs = list(
+                executor.map(
+                    lambda file_name: generate.generate_xml_from_file(
+                        file_name, config=config
+                    ),
+                    file_names,
+                )
+            )
+        self.assertEqual(outputs, expected)
+        self.assertFalse(
+            [name for name in os.listdir("tmp") if name.startswith("letterparser-")]
+        )
+
+
+class TestGenerateFromBytes(unittest.TestCase):
+    def setUp(self):
+        self.config = parse_raw_config(raw_config("elife"))
+
+    def test_generate_xml_from_bytes_zip(self):
+        """zip bytes give the same output as the zip file, without writing files"""
+        file_name = data_path("elife-39122.zip")
+        expected = generate.generate_xml_from_zip(file_name, config=self.config)
+        with open(file_name, "rb") as open_file:
+            zip_bytes = open_file.read()
+        with patch.object(generate.zip_lib, "unzip_file") as fake_unzip_file:
+            xml_bytes = generate.generate_xml_from_bytes(zip_bytes, config=self.config)
+        self.assertEqual(xml_bytes, expected)
+        self.assertEqual(fake_unzip_file.call_count, 0)
+
+    def test_generate_xml_from_bytes_docx(self):
+        """a docx file object and its file name"""
+        file_name = data_path("list-27798.docx")
+        expected = generate.generate_xml_from_docx(file_name, config=self.config)
+        with open(file_name, "rb") as open_file:
+            xml_bytes = generate.generate_xml_from_bytes(
+                open_file, "list-27798.docx", config=self.config
+            )
+        self.assertEqual(xml_bytes, expected)
+
+
+class TestGenerateFromFileAsync(unittest.TestCase):
+    def test_generate_xml_from_file_async(self):
+        file_name = data_path("elife-39122.zip")
+        config = parse_raw_config(raw_config("elife"))
+        expected = generate.generate_xml_from_file(file_name, config=config)
+        xml_bytes = asyncio.run(
+            generate.generate_xml_from_file_async(file_name, config=config)
+        )
+        self.assertEqual(xml_bytes, expected)
+
+
+class TestRenameAssets(unittest.TestCase):
+    def test_rename_assets_file_names(self):
+        """asset file names are specified instead of listing the temp_dir"""
+        root = Element("root")
+        SubElement(root, "graphic").set("xlink:href", "elife-39122-sa2-fig1")
+        generate.rename_assets(root, file_names=["elife-39122-sa2-fig1.jpg"])
+        self.assertEqual(
+            root.find("graphic").get("xlink:href"), "elife-39122-sa2-fig1.jpg"
+        )
+
+
+class TestSetBody(unittest.TestCase):
+    def setUp(self):
+        self.config = parse_raw_config(raw_config("elife"))
+
+    def test_set_body(self):
+        """appending content block Elements is the same as parsing the content"""
+        articles = generate.docx_to_articles(
+            data_path("Dutzler 39122 edit.docx"), config=self.config
+        )
+        for article in articles:
+            body_tag = generate.set_body(Element("sub-article"), article)
+            parent = Element("sub-article")
+            jats_build.set_body(parent, article)
+            self.assertEqual(
+                ElementTree.tostring(body_tag), ElementTree.tostring(parent[0])
+            )
+
+    def test_content_block_tag(self):
+        content = '<italic>One</italic> <ext-link xlink:href="https://example.org/">two</ext-link>'
+        element = ElementTree.fromstring(
+            '<p xmlns:xlink="http://www.w3.org/1999/xlink"> %s</p>\n' % content
+        )
+        content_block = build.ElementContentBlock("p", element, content=content)
+        block_tag = generate.content_block_tag(content_block)
+        self.assertEqual(
+            ElementTree.tostring(block_tag),
+            (
+                b'<p><italic>One</italic> <ext-link xlink:href="https://example.org/">'
+                b"two</ext-link></p>"
+            ),
+        )
+
+    def test_content_block_tag_escaped(self):
+        """tags which are escaped when parsing the content use the content"""
+        element = ElementTree.fromstring("<p>One<break />Two</p>")
+        content_block = build.ElementContentBlock("p", element)
+        self.assertIsNone(generate.content_block_tag(content_block))
+
 
 class TestGenerateKitchenSinkZip(unittest.TestCase):
     def test_generate_xml_from_zip(self):
@@ -1,8 +1,12 @@
+import asyncio
+import json
 import unittest
 from mock import patch
+from ddt import ddt, data
+import docker
 import requests
 import pypandoc
-from letterparser import docker_lib, parse
+from letterparser import docker_lib, parse, server_lib, utils, zip_lib
 from letterparser.conf import raw_config, parse_raw_config
 from tests import data_path, read_fixture
 
@@ -10,12 +14,37 @@ from tests import data_path, read_fixture
 class TestParse(unittest.TestCase):
     def setUp(self):
         self.config = parse_raw_config(raw_config("elife"))
+        parse.reset_backend_registries()
+
+    def tearDown(self):
+        parse.reset_backend_registries()
 
     @patch.object(pypandoc, "convert_file")
     def test_pandoc_output_exception(self, fake_convert_file):
         fake_convert_file.side_effect = OSError()
         self.assertEqual(parse.pandoc_output("file_name"), None)
 
+    def test_pandoc_output_bytes(self):
+        """docx bytes are piped to pandoc on stdin"""
+        file_name = data_path("list-27798.docx")
+        expected = parse.pandoc_output(file_name)
+        with open(file_name, "rb") as open_file:
+            docx_bytes = open_file.read()
+        with patch.object(pypandoc, "convert_file") as fake_convert_file:
+            output = parse.pandoc_output(docx_bytes)
+        self.assertEqual(output, expected)
+        self.assertEqual(fake_convert_file.call_count, 0)
+
+    @patch.object(parse, "pandoc_stdin_output")
+    def test_pandoc_output_bytes_exception(self, fake_pandoc_stdin_output):
+        fake_pandoc_stdin_output.side_effect = OSError()
+        self.assertEqual(parse.pandoc_output(b"docx"), None)
+
+    @patch.object(docker_lib, "call_pandoc_bytes")
+    def test_docker_pandoc_output_bytes(self, fake_call_pandoc_bytes):
+        fake_call_pandoc_bytes.return_value = "<p>Test</p>"
+        self.assertEqual(parse.docker_pandoc_output(b"docx", None), "<p>Test</p>")
+
     @patch.object(docker_lib, "call_pandoc")
     def test_docker_pandoc_output_with_config(self, fake_call_pandoc):
         config = {"docker_image": "image_name"}
@@ -27,6 +56,82 @@ class TestParse(unittest.TestCase):
         fake_call_pandoc.side_effect = requests.exceptions.ConnectionError()
         self.assertEqual(parse.docker_pandoc_output("file_name", None), None)
 
+    def test_server_pandoc_output_no_config(self):
+        self.assertEqual(parse.server_pandoc_output("file_name", None), None)
+
+    @patch.object(server_lib, "call_pandoc")
+    def test_server_pandoc_output(self, fake_call_pandoc):
+        config = {"pandoc_server_url": "http://localhost:3030"}
+        fake_call_pandoc.return_value = "<p>Test</p>"
+        self.assertEqual(parse.server_pandoc_output("file_name", config), "<p>Test</p>")
+
+    @patch.object(server_lib, "call_pandoc_bytes")
+    def test_server_pandoc_output_bytes(self, fake_call_pandoc_bytes):
+        config = {"pandoc_server_url": "http://localhost:3030"}
+        fake_call_pandoc_bytes.return_value = "<p>Test</p>"
+        self.assertEqual(parse.server_pandoc_output(b"docx", config), "<p>Test</p>")
+
+    @patch.object(server_lib, "call_pandoc")
+    def test_server_pandoc_output_exception(self, fake_call_pandoc):
+        config = {"pandoc_server_url": "http://localhost:3030"}
+        fake_call_pandoc.side_effect = requests.exceptions.Timeout()
+        self.assertEqual(parse.server_pandoc_output("file_name", config), None)
+
+    @patch.object(pypandoc, "get_pandoc_version")
+    def test_pandoc_version_exception(self, fake_get_pandoc_version):
+        fake_get_pandoc_version.side_effect = OSError()
+        self.assertEqual(parse.pandoc_version(), None)
+
+    @patch.object(docker_lib, "pandoc_version")
+    def test_docker_pandoc_version_exception(self, fake_pandoc_version):
+        fake_pandoc_version.side_effect = docker.errors.DockerException()
+        self.assertEqual(parse.docker_pandoc_version(None), None)
+
+    @patch.object(server_lib, "pandoc_version")
+    def test_server_pandoc_version(self, fake_pandoc_version):
+        config = {"pandoc_server_url": "http://localhost:3030"}
+        fake_pandoc_version.return_value = "3.1"
+        self.assertEqual(parse.server_pandoc_version(config), "3.1")
+
+    def test_backend_registry(self):
+        "registry is created once for the same backend config values"
+        registry = parse.backend_registry(self.config)
+        self.assertEqual(parse.backend_registry(dict(self.config)), registry)
+        self.assertEqual(
+            [backend.name for backend in registry.backends], ["local", "docker"]
+        )
+        self.assertEqual(registry.backends[0].breaker.failure_threshold, 3)
+
+    def test_backend_registry_server(self):
+        config = {"pandoc_server_url": "http://localhost:3030"}
+        registry = parse.backend_registry(config)
+        self.assertEqual(
+            [backend.name for backend in registry.backends],
+            ["server", "local", "docker"],
+        )
+
+    @patch.object(parse, "docker_pandoc_version")
+    @patch.object(parse, "pandoc_version")
+    @patch.object(parse, "docker_pandoc_output")
+    @patch.object(parse, "pandoc_output")
+    def test_parse_file_docker_backend(
+        self,
+        fake_pandoc_output,
+        fake_docker_pandoc_output,
+        fake_pandoc_version,
+        fake_docker_pandoc_version,
+    ):
+        "when local pandoc is not installed it is not called again"
+        fake_pandoc_version.return_value = None
+        fake_docker_pandoc_version.return_value = "2.9.1.1"
+        fake_docker_pandoc_output.return_value = "<p>Test</p>"
+        file_name = data_path("Dutzler 39122 edit.docx")
+        self.assertEqual(parse.parse_file(file_name), "<p>Test</p>")
+        self.assertEqual(parse.parse_file(file_name), "<p>Test</p>")
+        self.assertEqual(fake_pandoc_version.call_count, 1)
+        self.assertEqual(fake_pandoc_output.call_count, 0)
+        self.assertEqual(fake_docker_pandoc_output.call_count, 2)
+
     @patch.object(parse, "docker_pandoc_output")
     @patch.object(parse, "pandoc_output")
     def test_parse_file_no_pandoc(self, fake_pandoc_output, fake_docker_pandoc_output):
@@ -35,6 +140,69 @@ class TestParse(unittest.TestCase):
         output = parse.parse_file(data_path("Dutzler 39122 edit.docx"))
         self.assertIsNone(output)
 
+    @patch.object(parse, "parse_file")
+    def test_ast_sections(self, fake_parse_file):
+        fake_parse_file.return_value = json.dumps(
+            {
+                "blocks": [
+                    {
+                        "t": "Para",
+                        "c": [
+                            {
+                                "t": "Strong",
+                                "c": [
+                                    {"t": "Str", "c": "Author"},
+                                    {"t": "Space"},
+                                    {"t": "Str", "c": "response"},
+                                ],
+                            }
+                        ],
+                    },
+                    {"t": "Para", "c": [{"t": "Str", "c": "Response"}]},
+                ]
+            }
+        )
+        sections = parse.ast_sections("file_name", config=self.config)
+        self.assertEqual(len(sections), 1)
+        self.assertEqual(sections[0].get("section_type"), "author_response")
+        self.assertEqual(
+            sections[0].get("content"),
+            "<p><bold>Author response</bold></p><p>Response</p>",
+        )
+        self.assertEqual(fake_parse_file.call_args[1].get("output_format"), "json")
+
+    @patch.object(parse, "parse_file")
+    def test_ast_sections_math(self, fake_parse_file):
+        fake_parse_file.return_value = json.dumps(
+            {"blocks": [{"t": "Para", "c": [{"t": "Math", "c": [{}, "x"]}]}]}
+        )
+        self.assertIsNone(parse.ast_sections("file_name", config=self.config))
+
+    def test_config_lua_filter(self):
+        self.assertIsNone(parse.config_lua_filter(self.config))
+        self.config["pandoc_lua_filter"] = True
+        self.assertEqual(parse.config_lua_filter(self.config), parse.LUA_FILTER)
+        self.assertIsNone(parse.config_lua_filter(self.config, "json"))
+
+    @patch.object(parse, "raw_jats")
+    def test_best_jats_lua_filter(self, fake_raw_jats):
+        "tags are not converted again in output from the Lua filter"
+        fake_raw_jats.return_value = (
+            "<root><p>One</p>\n<list>\n  <list-item>\n    <p>Two</p>\n"
+            "  </list-item>\n</list>\n%s\n</root>" % parse.LUA_FILTER_MARKER
+        )
+        expected = (
+            "<root><p>One</p><list><list-item><p>Two</p></list-item></list></root>"
+        )
+        self.assertEqual(parse.best_jats("file_name", config=self.config), expected)
+
+    def test_best_jats_lua_filter_strike_through(self):
+        file_name = data_path("strike-through-34497.docx")
+        expected = read_fixture("strike-through-34497_best.xml")
+        self.config["pandoc_lua_filter"] = True
+        jats_content = parse.best_jats(file_name, config=self.config)
+        self.assertEqual(jats_content, expected)
+
     def test_raw_jats(self):
         file_name = data_path("Dutzler 39122 edit.docx")
         expected = read_fixture("raw_jats_dutzler_39122.xml")
@@ -61,6 +229,170 @@ class TestParse(unittest.TestCase):
         self.assertEqual(sections, expected)
 
 
+class TestParseAsync(unittest.TestCase):
+    def setUp(self):
+        self.config = parse_raw_config(raw_config("elife"))
+        parse.reset_backend_registries()
+
+    def tearDown(self):
+        parse.reset_backend_registries()
+
+    def test_pandoc_output_async(self):
+        """same output as pandoc_output from a file or from bytes on stdin"""
+        file_name = data_path("list-27798.docx")
+        expected = parse.pandoc_output(file_name)
+        with open(file_name, "rb") as open_file:
+            docx_bytes = open_file.read()
+        self.assertEqual(asyncio.run(parse.pandoc_output_async(file_name)), expected)
+        self.assertEqual(asyncio.run(parse.pandoc_output_async(docx_bytes)), expected)
+
+    @patch("asyncio.create_subprocess_exec")
+    def test_pandoc_output_async_exception(self, fake_create_subprocess_exec):
+        fake_create_subprocess_exec.side_effect = OSError()
+        self.assertIsNone(asyncio.run(parse.pandoc_output_async("file_name")))
+
+    def test_best_jats_async(self):
+        file_name = data_path("list-27798.docx")
+        expected = parse.best_jats(file_name, config=self.config)
+        jats_content = asyncio.run(parse.best_jats_async(file_name, config=self.config))
+        self.assertEqual(jats_content, expected)
+
+    @patch.object(parse, "parse_file_async")
+    def test_conversion_semaphore(self, fake_parse_file_async):
+        """no more conversions are in flight than the async_concurrency"""
+        self.config["async_concurrency"] = 2
+        in_flight = []
+
+        async def parse_file_async(*args, **kwargs):
+            in_flight.append(len(in_flight) + 1)
+            await asyncio.sleep(0.01)
+            in_flight.pop()
+            return "<p>Test</p>"
+
+        fake_parse_file_async.side_effect = parse_file_async
+        max_in_flight = []
+
+        async def convert_all():
+            async def convert():
+                return await parse.parse_docx_async("file_name", self.config)
+
+            async def monitor():
+                for _ in range(10):
+                    max_in_flight.append(len(in_flight))
+                    await asyncio.sleep(0.002)
+
+            return await asyncio.gather(*[convert() for _ in range(6)], monitor())
+
+        outputs = asyncio.run(convert_all())
+        self.assertEqual(outputs[:6], ["<p>Test</p>"] * 6)
+        self.assertEqual(max(max_in_flight), 2)
+
+
+class TestConversionCache(unittest.TestCase):
+    def setUp(self):
+        self.config = parse_raw_config(raw_config("elife"))
+        self.config["cache_memory_size"] = 4
+        parse.reset_conversion_caches()
+
+    def tearDown(self):
+        parse.reset_conversion_caches()
+
+    @patch.object(parse, "converter_version")
+    @patch.object(parse, "convert_file")
+    def test_parse_file_cached(self, fake_convert_file, fake_converter_version):
+        fake_convert_file.return_value = "<p>Test</p>"
+        fake_converter_version.return_value = "local 2.9.1.1"
+        file_name = data_path("list-27798.docx")
+        for _ in range(2):
+            self.assertEqual(parse.parse_file(file_name, self.config), "<p>Test</p>")
+        self.assertEqual(fake_convert_file.call_count, 1)
+        self.assertEqual(
+            parse.conversion_cache(self.config).stats(), {"hits": 1, "misses": 1}
+        )
+        # a different pandoc version is converted again
+        fake_converter_version.return_value = "local 2.19.2"
+        parse.parse_file(file_name, self.config)
+        self.assertEqual(fake_convert_file.call_count, 2)
+
+    @patch.object(parse, "converter_version")
+    @patch.object(parse, "convert_best_jats")
+    def test_best_jats_cached_bytes(
+        self, fake_convert_best_jats, fake_converter_version
+    ):
+        """docx bytes and the file share the cached output"""
+        fake_convert_best_jats.return_value = "<root><p>Test</p></root>"
+        fake_converter_version.return_value = "local 2.9.1.1"
+        file_name = data_path("list-27798.docx")
+        parse.best_jats(file_name, config=self.config)
+        with open(file_name, "rb") as open_file:
+            docx_bytes = open_file.read()
+        jats_content = parse.best_jats(
+            "list-27798.docx", config=self.config, docx_bytes=docx_bytes
+        )
+        self.assertEqual(jats_content, "<root><p>Test</p></root>")
+        self.assertEqual(fake_convert_best_jats.call_count, 1)
+
+    @patch.object(parse, "converter_version")
+    @patch.object(parse, "convert_file")
+    def test_best_jats_digest(self, fake_convert_file, fake_converter_version):
+        """the docx digest is computed once for the best_jats and parse cache keys"""
+        fake_convert_file.return_value = "<p>Test</p>"
+        fake_converter_version.return_value = "local 2.9.1.1"
+        file_name = data_path("list-27798.docx")
+        with patch.object(
+            zip_lib, "docx_digest", wraps=zip_lib.docx_digest
+        ) as fake_docx_digest:
+            parse.best_jats(file_name, config=self.config)
+        self.assertEqual(fake_docx_digest.call_count, 1)
+        self.assertEqual(
+            parse.conversion_cache(self.config).stats(), {"hits": 0, "misses": 2}
+        )
+
+    def test_conversion_cache_not_configured(self):
+        self.assertIsNone(parse.conversion_cache(None))
+        self.assertIsNone(parse.conversion_cache({"cache_memory_size": 0}))
+
+
+@ddt
+class TestLuaFilter(unittest.TestCase):
+    """the Lua filter output is post-processed the same as the pandoc output"""
+
+    @data(
+        "Dutzler 39122 edit.docx",
+        "elife-68041.docx",
+        "elife-99999.docx",
+        "list-25776.docx",
+        "list-27798.docx",
+        "list-types.docx",
+        "sections.docx",
+        "strike-through-34497.docx",
+        "table-35684.docx",
+        "table-42299.docx",
+        "table-43333.docx",
+    )
+    def test_best_jats_content(self, file_name):
+        expected = parse.best_jats_content(parse.pandoc_output(data_path(file_name)))
+        jats_content = parse.best_jats_content(
+            parse.pandoc_output(data_path(file_name), lua_filter=parse.LUA_FILTER)
+        )
+        self.assertEqual(jats_content, expected)
+
+    def test_line_breaks(self):
+        "documents with line breaks are not changed by the filter"
+        file_name = data_path("Dutzler 39122 edit.docx")
+        self.assertEqual(
+            parse.pandoc_output(file_name, lua_filter=parse.LUA_FILTER),
+            parse.pandoc_output(file_name),
+        )
+
+    def test_filter_marker(self):
+        file_name = data_path("strike-through-34497.docx")
+        self.assertTrue(
+            parse.LUA_FILTER_MARKER
+            in parse.pandoc_output(file_name, lua_filter=parse.LUA_FILTER)
+        )
+
+
 class TestConvertSecTags(unittest.TestCase):
     def test_convert_sec_tags_blank(self):
         jats_content = ""
@@ -75,3 +407,83 @@ class TestConvertSecTags(unittest.TestCase):
         expected = "<p>Section title</p><p>Paragraph.</p>"
         converted_jats_content = parse.convert_sec_tags(jats_content)
         self.assertEqual(converted_jats_content, expected)
+
+
+class TestConvertJatsTags(unittest.TestCase):
+    def test_convert_jats_tags_blank(self):
+        self.assertEqual(parse.convert_jats_tags(None), "")
+
+    def test_convert_jats_tags(self):
+        """the same as removing strike tags and empty paragraphs then converting sec tags"""
+        jats_content = (
+            '<sec id="sec1"><title>Section <strike>old</strike> title</title>'
+            "<p>One <strike>deleted</strike> two</p><p> <strike>deleted</strike> </p>"
+            '<p content-type="empty">\t</p><p></p>'
+            '<sec id="sec2"><title>Sub</title><p>Paragraph.</p></sec></sec>'
+            "<table><tr><td><title>Cell</title></td></tr></table>"
+        )
+        expected = utils.remove_strike(jats_content)
+        expected = utils.remove_empty_p_tags(expected)
+        expected = parse.convert_sec_tags(expected)
+        self.assertEqual(
+            expected,
+            (
+                "<p>Section title</p><p>One two</p><p></p><p>Sub</p><p>Paragraph.</p>"
+                "<table><tr><td><title>Cell</title></td></tr></table>"
+            ),
+        )
+        self.assertEqual(parse.convert_jats_tags(jats_content), expected)
+
+    def test_convert_jats_tags_nested_sec(self):
+        """sec tags without a title are removed with the nested sec tags"""
+        jats_content = (
+            '<sec id="s5"><sec><title>T</title><p>One.</p></sec></sec>\n'
+            '<sec id="s0"><sec id="s3"><title>Sub</title><p>Two.</p></sec></sec>'
+        )
+        expected = utils.remove_strike(jats_content)
+        expected = utils.remove_empty_p_tags(expected)
+        expected = parse.convert_sec_tags(expected)
+        self.assertEqual(expected, "<p>T</p><p>One.</p>\n<p>Sub</p><p>Two.</p>")
+        self.assertEqual(parse.convert_jats_tags(jats_content), expected)
+
+    def test_convert_jats_tags_untitled_sec(self):
+        """
+        a sec tag with no title after it is removed with its close tag, where
+        convert_sec_tags left the sec open tag unclosed
+        """
+        jats_content = (
+            '<sec id="s0"><sec id="s3"><title>Sub</title><p>One.</p></sec>'
+            '<sec id="s4"><p>Two.</p></sec></sec>'
+        )
+        self.assertEqual(
+            parse.convert_jats_tags(jats_content),
+            "<p>Sub</p><p>One.</p><p>Two.</p>",
+        )
+
+
+class TestSectionIndex(unittest.TestCase):
+    def test_section_index(self):
+        jats_content = (
+            "<root> <p>Preamble</p>"
+            "<p><bold>Decision letter</bold></p><p>Letter.</p> </root>"
+        )
+        section_index = parse.SectionIndex(jats_content)
+        self.assertEqual(
+            section_index.spans, [(7, 22, None), (22, 71, "decision_letter")]
+        )
+        self.assertEqual(
+            section_index.content(section_index.spans[1]),
+            "<p><bold>Decision letter</bold></p><p>Letter.</p>",
+        )
+        self.assertEqual(section_index.sections(), parse.sections(jats_content, "root"))
+
+    def test_section_index_literal_markers(self):
+        """markers are matched as they are, not as regular expressions"""
+        section_map = {"numbered": "<p>(1)</p>"}
+        section_index = parse.SectionIndex(
+            "<p>1</p><p>(1)</p><p>Text</p>", section_map=section_map
+        )
+        self.assertEqual(
+            [section_index.content(span) for span in section_index],
+            ["<p>1</p>", "<p>(1)</p><p>Text</p>"],
+        )
@@ -0,0 +1,85 @@
+# coding=utf-8
+
+import marshal
+import unittest
+from elifearticle.article import Article
+from letterparser import build, generate, record_lib
+from letterparser.conf import raw_config, parse_raw_config
+
+
+JATS_CONTENT = (
+    "<p><bold>Decision letter</bold></p>"
+    "<p>First paragraph with <italic>italic</italic> text.</p>"
+    "<p>Carriage\rreturn.</p>"
+    "<p><bold>Author response</bold></p>"
+    "<p>Reply with <inline-formula><alternatives><tex-math>x</tex-math>"
+    "<mml:math><mml:mi>x</mml:mi></mml:math></alternatives></inline-formula>"
+    " maths.</p>"
+)
+
+
+class TestRecordLib(unittest.TestCase):
+    def setUp(self):
+        self.config = parse_raw_config(raw_config("elife"))
+
+    def test_build_records(self):
+        records = build.build_records(JATS_CONTENT, config=self.config)
+        self.assertEqual(
+            [record.article_type for record in records], ["decision-letter", "reply"]
+        )
+        self.assertEqual(records[0].title, "Decision letter")
+        self.assertEqual(records[0].content_blocks[0].block_type, "boxed-text")
+        self.assertEqual(records[0].content_blocks[1].block_type, "p")
+        self.assertEqual(
+            records[0].content_blocks[1].content,
+            "First paragraph with <italic>italic</italic> text.",
+        )
+
+    def test_dumps_loads(self):
+        """records loaded from bytes generate the same output"""
+        records = build.build_records(JATS_CONTENT, config=self.config)
+        loaded_records = record_lib.loads(record_lib.dumps(records))
+        self.assertEqual(
+            generate.output_xml(generate.generate(loaded_records)),
+            generate.output_xml(generate.generate(records)),
+        )
+        self.assertEqual(
+            [record.id for record in loaded_records],
+            [record.id for record in records],
+        )
+
+    def test_dumps_loads_section_records(self):
+        section = record_lib.SectionRecord(
+            "decision_letter",
+            "<p>Test</p>",
+            [record_lib.ContentSectionRecord("p", "<p>Test</p>")],
+        )
+        self.assertEqual(record_lib.loads(record_lib.dumps([section])), [section])
+
+    def test_loads_version(self):
+        data = marshal.dumps((record_lib.SERIAL_VERSION + 1, []))
+        with self.assertRaises(ValueError):
+            record_lib.loads(data)
+
+    def test_record_article(self):
+        """an Article is only created from the record when asked for"""
+        records = build.build_records(JATS_CONTENT, config=self.config)
+        article = build.record_article(records[0])
+        self.assertTrue(isinstance(article, Article))
+        self.assertEqual(article.article_type, "decision-letter")
+        self.assertEqual(article.title, "Decision letter")
+        self.assertEqual(
+            generate.output_xml(generate.generate([article])),
+            generate.output_xml(generate.generate(records[0:1])),
+        )
+
+    def test_block_record_content(self):
+        record = record_lib.BlockRecord("p", content="Test")
+        self.assertEqual(record.get("block_type"), "p")
+        self.assertEqual(record.get("unknown"), None)
+        self.assertTrue("block_type" in record)
+        self.assertFalse("element" in record)
+        record.content = "Changed"
+        self.assertEqual(record.content, "Changed")
+        with self.assertRaises(KeyError):
+            record["unknown"] = True
@@ -0,0 +1,87 @@
+import base64
+import unittest
+from mock import patch
+import requests
+from letterparser import server_lib
+from tests import data_path
+
+
+class FakeResponse:
+    def __init__(self, json_data, status_code=200):
+        self.json_data = json_data
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code != 200:
+            raise requests.exceptions.HTTPError()
+
+    def json(self):
+        return self.json_data
+
+
+class FakeSession:
+    def __init__(self, response):
+        self.response = response
+        self.requests = []
+
+    def post(self, url, **kwargs):
+        self.requests.append((url, kwargs))
+        return self.response
+
+
+class TestSession(unittest.TestCase):
+    def tearDown(self):
+        server_lib.close_session()
+
+    def test_get_session(self):
+        "the same session is returned on each call"
+        session = server_lib.get_session()
+        self.assertIsInstance(session, requests.Session)
+        self.assertEqual(server_lib.get_session(), session)
+
+    def test_close_session(self):
+        session = server_lib.get_session()
+        server_lib.close_session()
+        self.assertNotEqual(server_lib.get_session(), session)
+
+
+class TestRequestData(unittest.TestCase):
+    def test_request_data(self):
+        data = server_lib.request_data(b"docx")
+        self.assertEqual(data.get("text"), base64.b64encode(b"docx").decode("utf8"))
+        self.assertEqual(data.get("from"), "docx")
+        self.assertEqual(data.get("to"), "jats")
+        self.assertEqual(data.get("wrap"), "none")
+
+
+class TestCallPandoc(unittest.TestCase):
+    @patch.object(server_lib, "get_session")
+    def test_call_pandoc(self, fake_get_session):
+        session = FakeSession(FakeResponse({"output": "<p>Test</p>", "base64": False}))
+        fake_get_session.return_value = session
+        output = server_lib.call_pandoc(
+            data_path("elife-99999.docx"), "http://localhost:3030", timeout=5
+        )
+        self.assertEqual(output, "<p>Test</p>")
+        url, kwargs = session.requests[0]
+        self.assertEqual(url, "http://localhost:3030")
+        self.assertEqual(kwargs.get("timeout"), 5)
+
+    @patch.object(server_lib, "get_session")
+    def test_call_pandoc_base64(self, fake_get_session):
+        output = base64.b64encode(b"<p>Test</p>").decode("utf8")
+        fake_get_session.return_value = FakeSession(
+            FakeResponse({"output": output, "base64": True})
+        )
+        output = server_lib.call_pandoc(
+            data_path("elife-99999.docx"), "http://localhost:3030"
+        )
+        self.assertEqual(output, "<p>Test</p>")
+
+    @patch.object(server_lib, "get_session")
+    def test_call_pandoc_error(self, fake_get_session):
+        fake_get_session.return_value = FakeSession(FakeResponse({}, 500))
+        with self.assertRaises(requests.exceptions.HTTPError):
+            server_lib.call_pandoc(
+                data_path("elife-99999.docx"), "http://localhost:3030"
+            )
@@ -1,6 +1,10 @@
 # coding=utf-8
 
+import os
+import shutil
+import tempfile
 import unittest
+from mock import patch
 from ddt import ddt, data
 from letterparser import utils
 from tests import data_path, read_fixture
@@ -428,6 +432,44 @@ class TestCollapseNewlines(unittest.TestCase):
         )
 
 
+@ddt
+class TestLineClass(unittest.TestCase):
+    @data(
+        {"line": "", "expected": 0},
+        {"line": "text", "expected": 0},
+        {
+            "line": " <p><italic> ",
+            "expected": utils.LINE_STARTS_TAG
+            | utils.LINE_STARTS_P
+            | utils.LINE_STARTS_P_ITALIC
+            | utils.LINE_IS_P_ITALIC
+            | utils.LINE_ENDS_TAG
+            | utils.LINE_ENDS_ITALIC,
+        },
+        {
+            "line": "</italic></p>",
+            "expected": utils.LINE_STARTS_TAG
+            | utils.LINE_STARTS_CLOSE_ITALIC
+            | utils.LINE_IS_CLOSE_ITALIC_P
+            | utils.LINE_ENDS_TAG
+            | utils.LINE_ENDS_CLOSE_P
+            | utils.LINE_ENDS_CLOSE_ITALIC_P,
+        },
+        {
+            "line": "<bold>Title</bold></p>",
+            "expected": utils.LINE_STARTS_TAG
+            | utils.LINE_STARTS_BOLD
+            | utils.LINE_ENDS_TAG
+            | utils.LINE_ENDS_CLOSE_P
+            | utils.LINE_ENDS_CLOSE_BOLD_P,
+        },
+    )
+    def test_line_class(self, test_data):
+        self.assertEqual(
+            utils.line_class(test_data.get("line")), test_data.get("expected")
+        )
+
+
 @ddt
 class TestCleanPortion(unittest.TestCase):
     @data(
@@ -474,6 +516,41 @@ class TestFileNameFunctions(unittest.TestCase):
         self.assertEqual(utils.get_file_name_file(self.file_name), expected)
 
 
+@ddt
+class TestHasComplexScriptsStyles(unittest.TestCase):
+    @data(
+        {"document_xml": b"<w:rPr><w:bCs/></w:rPr>", "expected": True},
+        {"document_xml": b'<w:rPr><w:iCs w:val="0"/></w:rPr>', "expected": True},
+        {"document_xml": b"<w:rPr><w:b/><w:i/></w:rPr>", "expected": False},
+    )
+    def test_has_complex_scripts_styles(self, test_data):
+        self.assertEqual(
+            utils.has_complex_scripts_styles(test_data.get("document_xml")),
+            test_data.get("expected"),
+        )
+
+
+class TestWorkspace(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_workspace(self):
+        """a new directory in the temp_dir for each workspace, removed on exit"""
+        with utils.workspace(self.temp_dir) as work_dir:
+            with utils.workspace(self.temp_dir) as other_work_dir:
+                self.assertNotEqual(work_dir, other_work_dir)
+            self.assertEqual(os.path.dirname(work_dir), self.temp_dir)
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def test_workspace_ram(self):
+        with patch.object(utils, "RAM_DIR", self.temp_dir):
+            with utils.workspace("tmp", ram=True) as work_dir:
+                self.assertEqual(os.path.dirname(work_dir), self.temp_dir)
+
+
 @ddt
 class TestManuscriptFromFileName(unittest.TestCase):
     @data(
@@ -551,6 +628,58 @@ class TestRemoveComplexScriptsStyles(unittest.TestCase):
         self.assertEqual(xml_string, expected)
 
 
+@ddt
+class TestIterRemoveComplexScriptsStyles(unittest.TestCase):
+    @data(
+        {"chunk_size": 1},
+        {"chunk_size": 7},
+        {"chunk_size": 4096},
+    )
+    def test_iter_remove_complex_scripts_styles(self, test_data):
+        """the same output whichever way the contents are split into chunks"""
+        with open(data_path("complex_scripts_document.xml"), "rb") as open_file:
+            xml_string = open_file.read()
+        expected = read_fixture("complex_scripts_document_expected.xml", mode="rb")
+        chunk_size = test_data.get("chunk_size")
+        chunks = [
+            xml_string[index : index + chunk_size]
+            for index in range(0, len(xml_string), chunk_size)
+        ]
+        self.assertEqual(
+            b"".join(utils.iter_remove_complex_scripts_styles(chunks)), expected
+        )
+
+    @data(
+        {
+            "comment": "a new line inside the run tag contents is not a run tag",
+            "xml_string": (
+                b'<w:r a="1">\n<w:rFonts w:cstheme="minorHAnsi"/><w:bCs/></w:r>'
+                b"<w:iCs/>"
+            ),
+            "expected": (
+                b'<w:r a="1">\n<w:rFonts w:cstheme="minorHAnsi"/><w:bCs/></w:r>'
+                b"<w:iCs/>"
+            ),
+        },
+        {
+            "comment": "new lines between the tag name and attributes are allowed",
+            "xml_string": (
+                b'<w:r\n a="1"><w:rFonts w:cstheme="minorHAnsi"/><w:bCs/></w:r>'
+                b"<w:iCs/>"
+            ),
+            "expected": (
+                b'<w:r\n a="1"><w:rFonts w:cstheme="minorHAnsi"/><w:bCs/></w:r>'
+            ),
+        },
+    )
+    def test_run_tags_new_lines(self, test_data):
+        chunks = [test_data.get("xml_string")[:3], test_data.get("xml_string")[3:]]
+        self.assertEqual(
+            b"".join(utils.iter_remove_complex_scripts_styles(chunks)),
+            test_data.get("expected"),
+        )
+
+
 class TestDetectProblemCharacters(unittest.TestCase):
     def test_detect_problem_characters_maths(self):
         string = "𝓮𝓛𝓲𝓯𝓮"
@@ -1,9 +1,15 @@
 # coding=utf-8
 
+import io
 import unittest
 import os
+import shutil
+import tempfile
+import zipfile
+from mock import patch
 from ddt import ddt, data
 from tests import data_path
+from letterparser import utils, zip_lib
 from letterparser.zip_lib import profile_zip, unzip_zip
 
 
@@ -59,3 +65,181 @@ class TestZip(unittest.TestCase):
                 expected=expected_assets, output=assets
             ),
         )
+
+    def test_unzip_bytes(self):
+        "read the docx bytes from the zip bytes without writing files"
+        with open(data_path("elife-39122.zip"), "rb") as open_file:
+            zip_bytes = open_file.read()
+        with patch.object(zip_lib, "unzip_file") as fake_unzip_file:
+            docx, docx_bytes, assets = zip_lib.unzip_bytes(zip_bytes)
+        self.assertEqual(docx, "elife-39122.docx")
+        self.assertTrue(zip_lib.is_docx(io.BytesIO(docx_bytes)))
+        self.assertEqual(
+            assets, ["elife-39122-sa2-fig1.jpg", "elife-39122-sa2-fig2.jpg"]
+        )
+        self.assertEqual(fake_unzip_file.call_count, 0)
+
+
+class TestZipManifest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_zip_manifest(self):
+        "the file names are listed without extracting the files"
+        with zip_lib.ZipManifest(data_path("elife-39122.zip")) as manifest:
+            self.assertEqual(manifest.docx_file_name, "elife-39122.docx")
+            self.assertEqual(
+                manifest.asset_file_names,
+                ["elife-39122-sa2-fig1.jpg", "elife-39122-sa2-fig2.jpg"],
+            )
+            self.assertEqual(os.listdir(self.temp_dir), [])
+            docx_file_name = manifest.extract_docx(self.temp_dir)
+        self.assertEqual(os.listdir(self.temp_dir), ["elife-39122.docx"])
+        self.assertTrue(zip_lib.is_docx(docx_file_name))
+
+    @patch.object(utils, "CHUNK_SIZE", 1024)
+    def test_extract_assets_parallel(self):
+        "the same files are extracted in chunks by a pool of threads"
+        zip_file_name = data_path("elife-39122.zip")
+        with zip_lib.ZipManifest(zip_file_name) as manifest:
+            assets = manifest.extract_assets(self.temp_dir, max_workers=2)
+        self.assertEqual(
+            assets,
+            [
+                os.path.join(self.temp_dir, "elife-39122-sa2-fig1.jpg"),
+                os.path.join(self.temp_dir, "elife-39122-sa2-fig2.jpg"),
+            ],
+        )
+        with zipfile.ZipFile(zip_file_name) as open_zip:
+            for asset in assets:
+                with open(asset, "rb") as open_file:
+                    self.assertEqual(
+                        open_file.read(), open_zip.read(os.path.basename(asset))
+                    )
+
+
+class TestWritePackage(unittest.TestCase):
+    @patch.object(utils, "CHUNK_SIZE", 1024)
+    def test_write_package(self):
+        "the XML is added and assets are renamed and copied in chunks"
+        zip_file_name = data_path("elife-39122.zip")
+        output = io.BytesIO()
+        with zip_lib.ZipManifest(zip_file_name) as manifest:
+            zip_lib.write_package(
+                output,
+                "elife-39122.xml",
+                b"<root/>",
+                manifest,
+                {"elife-39122-sa2-fig1.jpg": "renamed.jpg"},
+            )
+        with zipfile.ZipFile(zip_file_name) as open_zip:
+            with zipfile.ZipFile(output) as new_open_zip:
+                self.assertIsNone(new_open_zip.testzip())
+                self.assertEqual(
+                    new_open_zip.namelist(),
+                    ["elife-39122.xml", "renamed.jpg", "elife-39122-sa2-fig2.jpg"],
+                )
+                self.assertEqual(new_open_zip.read("elife-39122.xml"), b"<root/>")
+                self.assertEqual(
+                    zip_lib.read_raw_member(
+                        new_open_zip, new_open_zip.getinfo("renamed.jpg")
+                    ),
+                    zip_lib.read_raw_member(
+                        open_zip, open_zip.getinfo("elife-39122-sa2-fig1.jpg")
+                    ),
+                )
+
+
+class TestFixComplexScriptsStylesBytes(unittest.TestCase):
+    def test_fix_complex_scripts_styles_bytes(self):
+        "same document.xml as the fixed docx file written to disk"
+        file_name = data_path("Dutzler 39122 edit.docx")
+        new_file_name = zip_lib.fix_complex_scripts_styles(file_name, "tmp")
+        with zipfile.ZipFile(new_file_name) as open_zip:
+            expected = open_zip.read("word/document.xml")
+        with open(file_name, "rb") as open_file:
+            docx_bytes = zip_lib.fix_complex_scripts_styles_bytes(open_file.read())
+        with zipfile.ZipFile(io.BytesIO(docx_bytes)) as open_zip:
+            self.assertEqual(open_zip.read("word/document.xml"), expected)
+
+    def test_fix_complex_scripts_styles_raw_copy(self):
+        "items other than document.xml are copied without compressing them again"
+        file_name = data_path("elife-68041.docx")
+        new_file_name = zip_lib.fix_complex_scripts_styles(file_name, "tmp")
+        with zipfile.ZipFile(file_name) as open_zip:
+            with zipfile.ZipFile(new_file_name) as new_open_zip:
+                self.assertIsNone(new_open_zip.testzip())
+                self.assertEqual(new_open_zip.namelist(), open_zip.namelist())
+                for zip_info in open_zip.infolist():
+                    if zip_info.filename == "word/document.xml":
+                        continue
+                    new_zip_info = new_open_zip.getinfo(zip_info.filename)
+                    self.assertEqual(
+                        zip_lib.read_raw_member(new_open_zip, new_zip_info),
+                        zip_lib.read_raw_member(open_zip, zip_info),
+                    )
+
+    def test_fix_complex_scripts_styles_unchanged(self):
+        "a docx without complex scripts styles is not rewritten"
+        file_name = data_path("elife-99999.docx")
+        with open(file_name, "rb") as open_file:
+            docx_bytes = open_file.read()
+        self.assertIs(zip_lib.fix_complex_scripts_styles_bytes(docx_bytes), docx_bytes)
+        new_file_name = zip_lib.fix_complex_scripts_styles(file_name, "tmp")
+        with open(new_file_name, "rb") as open_file:
+            self.assertEqual(open_file.read(), docx_bytes)
+
+    @patch.object(utils, "CHUNK_SIZE", 3)
+    def test_fix_complex_scripts_styles_chunks(self):
+        "document.xml is streamed into the new docx in chunks"
+        file_name = data_path("Dutzler 39122 edit.docx")
+        with zipfile.ZipFile(file_name) as open_zip:
+            self.assertTrue(zip_lib.document_has_complex_scripts_styles(open_zip))
+            expected = utils.remove_complex_scripts_styles(
+                open_zip.read("word/document.xml")
+            )
+        new_file_name = zip_lib.fix_complex_scripts_styles(file_name, "tmp")
+        with zipfile.ZipFile(new_file_name) as open_zip:
+            self.assertEqual(open_zip.read("word/document.xml"), expected)
+
+
+class TestRawCopy(unittest.TestCase):
+    def test_raw_copy_supported(self):
+        """
+        fails if the zipfile internals used to copy compressed data are changed,
+        the contents would then be decompressed and compressed again
+        """
+        with zipfile.ZipFile(data_path("elife-68041.docx")) as open_zip:
+            with zipfile.ZipFile(io.BytesIO(), "w") as new_open_zip:
+                self.assertTrue(zip_lib.raw_copy_supported(open_zip, new_open_zip))
+
+    @patch.object(zip_lib, "raw_copy_supported")
+    def test_copy_raw_member_fallback(self, fake_raw_copy_supported):
+        "the contents are copied with the public zipfile methods as a fallback"
+        fake_raw_copy_supported.return_value = False
+        file_name = data_path("elife-68041.docx")
+        output = io.BytesIO()
+        with zipfile.ZipFile(file_name) as open_zip:
+            with zipfile.ZipFile(output, "w") as new_open_zip:
+                for zip_info in open_zip.infolist():
+                    zip_lib.copy_raw_member(open_zip, zip_info, new_open_zip)
+            with zipfile.ZipFile(output) as new_open_zip:
+                self.assertIsNone(new_open_zip.testzip())
+                self.assertEqual(new_open_zip.namelist(), open_zip.namelist())
+                for zip_info in open_zip.infolist():
+                    new_zip_info = new_open_zip.getinfo(zip_info.filename)
+                    self.assertEqual(new_zip_info.CRC, zip_info.CRC)
+                    self.assertEqual(new_zip_info.compress_type, zip_info.compress_type)
+
+
+class TestDocxDigest(unittest.TestCase):
+    def test_docx_digest(self):
+        file_name = data_path("list-27798.docx")
+        with open(file_name, "rb") as open_file:
+            docx_bytes = open_file.read()
+        digest = zip_lib.docx_digest(file_name)
+        self.assertEqual(zip_lib.docx_digest(io.BytesIO(docx_bytes)), digest)
+        self.assertNotEqual(zip_lib.docx_digest(data_path("list-types.docx")), digest)